@@ -24,20 +24,49 @@ utils
 from .coupling import *
 from .domain import *
 from .loop import *
+from .router import *
 from .utils import *
 
 # eophis modules
-from .utils import logs
+from .utils import logs, timers
 from .utils.worker import Paral
 from .coupling import _init_coupling
 # external modules
-from watermark import watermark
-from importlib.metadata import version
 import atexit
 
-def _init_eophis():
-    """ Initializes Eophis: print package infos and call subpackage init routines. """
+class _Status:
+    """
+    This class contains the status of Eophis initialization.
+    
+    Attributes
+    ----------
+    initialized : bool
+        Eophis has been initialized if True
+        
+    """
+    initialized = False
+
+
+def init():
+    """
+    Initializes Eophis: print package infos and call subpackage init routines.
+    
+    Notes
+    -----
+    This function is automatically called at first use of the coupling API, it may be called explicitly to control when initialization occurs.
+    Calls after the first one do nothing.
+    
+    """
+    if _Status.initialized:
+        return
+    _Status.initialized = True
+    
+    # external modules only required here
+    from watermark import watermark
+    from importlib.metadata import version
+    
     ver = version("eophis")
+    logs.open_log_files()
     logs.info(f'===============================')
     logs.info(f'|    CNRS - IGE - MEOM Team   |')
     logs.info(f'|           ------            |')
@@ -55,10 +84,9 @@ def _init_eophis():
 
 
 def _finish_eophis():
-    """ Executes cleaning processes at end of Eophis use. """
-    close_tunnels(reread=False)
+    """ Executes cleaning processes at end of Eophis use. Collective operations are skipped if the run was aborted, other processes would never join them. """
+    if not logs.aborted():
+        timers.write_summary()
+        close_tunnels(reread=False)
     logs.info('\nEOPHIS run finished')
     logs.flush_buffer(Paral.MASTER)
-
-
-_init_eophis()
@@ -20,6 +20,7 @@ from .namcouple import *
 # eophis modules
 from ..utils import logs
 from ..utils.worker import Paral
+from .namelist import root_call, shared_communicator
 # external modules
 import os
 import shutil
@@ -35,6 +36,7 @@ def _init_coupling():
     - Save copy of 'namcouple' as 'namcouple_ref' if exists alone
     - If both exist, does nothing and read 'namcouple'
     - instantiate Namcouple singleton with 'namcouple'
+    - Namelists are inquired and copied by first eophis process if eophis communicator does not involve coupled codes, by every process otherwise
     
     """
     logs.info('---------------------------')
@@ -44,22 +46,34 @@ def _init_coupling():
     
     cpl_nml = os.path.join(os.getcwd(), 'namcouple')
     cpl_nml_ref = os.path.join(os.getcwd(), 'namcouple_ref')
-   
+    cpl_nml_ref = root_call(shared_communicator(), _prepare_namelists, cpl_nml, cpl_nml_ref)
+
+    # Instantiate OASIS namcouple
+    logs.info('  Reading namcouple\n')
+    init_namcouple(cpl_nml_ref,cpl_nml)
+
+
+def _prepare_namelists(cpl_nml,cpl_nml_ref):
+    """ Creates namcouple from namcouple_ref or namcouple_ref from namcouple, returns path of namcouple to read. """
     if not os.path.isfile(cpl_nml):
         logs.info(f'      namcouple not found, looking for reference file namcouple_ref')
         if not os.path.isfile(cpl_nml_ref):
             logs.info(f'      namcouple_ref not found either, creating it from scratch')
         else:
             logs.info(f'      namcouple_ref found, copied as namcouple')
-            shutil.copy(cpl_nml_ref,cpl_nml)
+            _copy(cpl_nml_ref,cpl_nml)
     else:
         if not os.path.isfile(cpl_nml_ref):
             logs.info(f'      only namcouple found, save copy as {cpl_nml_ref}')
-            shutil.copy(cpl_nml, cpl_nml_ref)
+            _copy(cpl_nml, cpl_nml_ref)
         else:
             logs.info(f'      namcouple and namcouple_ref found, nothing done')
             cpl_nml_ref = cpl_nml
+    return cpl_nml_ref
 
-    # Instantiate OASIS namcouple
-    logs.info('  Reading namcouple\n')
-    init_namcouple(cpl_nml_ref,cpl_nml)
+
+def _copy(src,dst):
+    """ Copies a file through a temporary file renamed atomically, processes copying the same file at the same time never read a partial copy. """
+    tmp = f'{dst}.{os.getpid()}.tmp'
+    shutil.copy(src,tmp)
+    os.replace(tmp,dst)
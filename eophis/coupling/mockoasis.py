@@ -0,0 +1,203 @@
+"""
+This module is an in-process stand-in for the python OASIS API, to run Tunnels without OASIS nor coupled geoscientific code.
+
+* Copyright (c) 2023 IGE-MEOM
+    Eophis is released under an MIT License.
+    See the `LICENSE <https://github.com/meom-group/eophis/blob/main/LICENSE>`_ file for details.
+
+"""
+# eophis modules
+from ..utils import logs
+from ..utils.worker import Paral
+from .namelist import NamcoupleIndex
+from .recorder import load_record
+# external modules
+import numpy as np
+
+__all__ = []
+
+class OASIS:
+    """ Exchange directions, as in pyoasis. """
+    IN = 1
+    OUT = 2
+
+
+class _Sources:
+    """
+    This class contains the synthetic global fields received by mock variables.
+
+    Attributes
+    ----------
+    fields : dict
+        function generating values of a global field, keyed by namcouple field name
+    replay : string
+        directory of recorded fields to replay instead of synthetic fields, None if not replaying
+    LEVEL_STRIDE : int
+        value offset between two levels of the default synthetic field
+
+    """
+    fields = {}
+    replay = None
+    LEVEL_STRIDE = 10**8
+
+
+def default_source(index, nlvl, date):
+    """ Default synthetic global field: value of a cell is its global index plus one, levels are shifted by LEVEL_STRIDE. Date is ignored. """
+    return np.add.outer( index + 1.0, _Sources.LEVEL_STRIDE * np.arange(nlvl) )
+
+
+def set_replay(directory):
+    """
+    Makes mock variables receive fields recorded by Tunnels instead of synthetic fields.
+
+    Parameters
+    ----------
+    directory : string
+        directory of the records, None to receive synthetic fields again
+
+    Notes
+    -----
+    Records are read by the process that wrote them: the decomposition, i.e. the number of processes, must be the same as during recording.
+
+    """
+    _Sources.replay = directory
+
+
+def set_source(name, func):
+    """
+    Defines the synthetic global field received by a mock variable.
+
+    Parameters
+    ----------
+    name : string
+        namcouple name of the received field
+    func : callable
+        ``func(index, nlvl, date)`` returns values of the global field at date, of shape (len(index), nlvl), for the global flat indexes of the cells
+
+    """
+    _Sources.fields[name] = func
+
+
+class Component:
+    """
+    This class stands for an OASIS component. All processes are Eophis processes.
+
+    Attributes
+    ----------
+    name : string
+        component name
+    localcomm : mpi4py.MPI.Intracomm
+        communicator of the component processes
+
+    """
+    def __init__(self, name, coupled=True, communicator=None):
+        self.name = name
+        self.localcomm = communicator or Paral.GLOBAL_COMM
+        logs.info(f'  Mock OASIS component {name} created, fields are not exchanged with a coupled code')
+
+    def enddef(self):
+        """ Ends definition phase, nothing to do. """
+        pass
+
+
+class BoxPartition:
+    """
+    This class stands for an OASIS Box partition.
+
+    Attributes
+    ----------
+    index : numpy.ndarray
+        global flat indexes of the partition cells, in reception order
+
+    """
+    def __init__(self, global_offset, local_extent_x, local_extent_y, global_extent_x):
+        lines = global_offset + global_extent_x * np.arange(local_extent_y)
+        self.index = np.add.outer( lines, np.arange(local_extent_x) ).ravel()
+
+
+class OrangePartition:
+    """
+    This class stands for an OASIS Orange partition.
+
+    Attributes
+    ----------
+    index : numpy.ndarray
+        global flat indexes of the partition cells, in reception order
+
+    """
+    def __init__(self, offsets, extents, global_size=None):
+        self.index = np.concatenate( [ np.arange(off, off + ext) for off, ext in zip(offsets, extents) ] + [ np.array([],dtype=int) ] )
+
+
+class Var:
+    """
+    This class stands for an OASIS variable. Receptions gather partition cells from a synthetic global field, sendings are counted and discarded.
+
+    Attributes
+    ----------
+    name : string
+        namcouple field name
+    partition : BoxPartition or OrangePartition
+        variable partition
+    direction : int
+        OASIS.IN or OASIS.OUT
+    bundle_size : int
+        number of levels
+    cpl_freqs : list( int )
+        exchange frequency, read from namcouple
+    puts : int
+        number of sendings
+    last_put : (int, numpy.ndarray)
+        date and array of the last sending, array is not copied
+    _default : numpy.ndarray
+        partition cells of the default synthetic field, computed at first reception
+    _records : (dict, numpy.ndarray)
+        position of each date in records and memory-mapped recorded fields, if replaying
+
+    """
+    def __init__(self, name, partition, direction, bundle_size=1):
+        from .namcouple import Namcouple
+        self.name = name
+        self.partition = partition
+        self.direction = direction
+        self.bundle_size = bundle_size
+        self.puts = 0
+        self.last_put = None
+        self._default = None
+        self._records = None
+
+        # frequency from namcouple field section, variable is the target of received fields and the source of sent ones
+        nml = NamcoupleIndex(Namcouple()._lines)
+        side = 1 if direction == OASIS.IN else 0
+        fields = [ fld for fld in nml.fields if fld[side] == name ]
+        if not fields:
+            logs.abort(f'Mock OASIS: field {name} not found in namcouple')
+        self.cpl_freqs = [ int(nml.field(*fields[0])[3]) ]
+
+    def get(self, date, array):
+        """ Fills array with the partition cells of the synthetic global field at date, or with the field recorded at date if replaying. Default field does not depend on date and is only computed once. """
+        if _Sources.replay is not None:
+            self._replay(date, array)
+            return
+        if self.name in _Sources.fields:
+            array[...] = _Sources.fields[self.name](self.partition.index, array.shape[1], date)
+            return
+        if self._default is None or self._default.shape != array.shape:
+            self._default = default_source(self.partition.index, array.shape[1], date).astype(array.dtype, order='F')
+        array[...] = self._default
+
+    def _replay(self, date, array):
+        """ Fills array with recorded field at date. """
+        if self._records is None:
+            self._records = load_record(_Sources.replay, self.name, Paral.RANK)
+        dates, records = self._records
+        if records.shape[1:] != array.shape:
+            logs.abort(f'Mock OASIS: shape {records.shape[1:]} of recorded field {self.name} does not match reception {array.shape}, decomposition may differ')
+        if date not in dates:
+            logs.abort(f'Mock OASIS: field {self.name} was not recorded at date {date}')
+        array[...] = records[ dates[date] ]
+
+    def put(self, date, array):
+        """ Counts sending, keeps reference to array. """
+        self.puts += 1
+        self.last_put = (date, array)
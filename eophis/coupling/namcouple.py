@@ -7,13 +7,13 @@ Contains tools to create and manipulate OASIS namelist sections in right format.
     
 """
 # eophis modules
-from .namelist import raw_content, is_in, find_pos, replace_line, find_and_replace_line, find_and_replace_char, write
+from .namelist import NamcoupleIndex, shared_content, shared_communicator, replace_line, write
 from .tunnel import init_oasis, Tunnel
 from ..utils.worker import Paral, set_local_communicator
-from ..utils.params import Mode
+from ..utils.params import Mode, Freqs
 from ..utils import logs
 # external module
-import re
+import numpy as np
 
 __all__ = ['init_namcouple','register_tunnels','write_coupling_namelist','open_tunnels','tunnels_ready','close_tunnels']
 
@@ -36,9 +36,11 @@ class Namcouple:
         comp : pyoasis.Comp
             main OASIS Component
         _lines : list( string )
-            namcouple file content
+            namcouple file content, read at first access
         _reflines : list( string )
-            unmodified namcouple file content
+            unmodified namcouple file content, read at first access
+        _unchecked : list( tuple )
+            parameters of sections required by registered tunnels, to be checked with namcouple content when tunnels are opened (production mode only)
         _Nin : int
             number of reception sections
         _Nout : int
@@ -50,6 +52,8 @@ class Namcouple:
     _instance = None
     
     def __new__(cls,*args,**kwargs):
+        if not cls._instance:
+            _init_package()
         if not cls._instance:
             cls._instance = super(Namcouple, cls).__new__(cls)
             cls._instance.initialized = False
@@ -65,7 +69,17 @@ class Namcouple:
             self.comp = None
             self._Nin = 0
             self._Nout = 0
-            self._read_namcouple() if read else None
+            self._unchecked = []
+            if read:
+                self.__dict__.pop('_lines',None)
+                self.__dict__.pop('_reflines',None)
+
+    def __getattr__(self,name):
+        """ Reads namcouple file at first access of its content. """
+        if name in ('_lines','_reflines'):
+            self._read_namcouple()
+            return self.__dict__[name]
+        raise AttributeError(name)
 
     def _reset(self,reread=True):
         """ Unsets coupling environment, reinit namcouple content. """
@@ -74,8 +88,11 @@ class Namcouple:
         self.__init__(self.infile,self.outfile,reread)
 
     def _read_namcouple(self):
-        """ Reads namcouple file from ``infile`` attribute, generate minimal content if empty. """
-        self._lines = raw_content(self.infile)
+        """
+        Reads namcouple file from ``infile`` attribute, generate minimal content if empty.
+        The file is read by one process and broadcasted to the others if eophis processes are isolated from coupled codes or in preproduction mode, by every process otherwise.
+        """
+        self._lines = shared_content(self.infile,shared_communicator())
         if len(self._lines) == 0:
             self._lines =  [ '$NFIELDS', '0', '$END', '############' ]
             self._lines += [ '$RUNTIME', '0', '$END', '############' ]
@@ -83,7 +100,7 @@ class Namcouple:
             self._lines += [ '$STRINGS', '#', '$END' ]
         self._reflines = self._lines
 
-    def _add_tunnel(self,label,grids,exchs,geo_aliases=None,py_aliases=None):
+    def _add_tunnel(self,label,grids,exchs,geo_aliases=None,py_aliases=None,reuse=False,cache=None,fuse=False,mpi_halos=False,record=None):
         """ Updates namcouple file content, create new Tunnel from updates. """
         # Default values
         geo_aliases = geo_aliases or {}
@@ -94,26 +111,33 @@ class Namcouple:
             logs.warning(f'Tunnels are opened, cannot register new tunnel {label}')
             return
             
-        # content to add in namcouple, if production mode: check consistency
-        replace_line(self._lines, '# ======= Tunnel '+label+' =======', len(self._lines)-2)
-        for ex in exchs:
-            for varin in ex['in']:
-                py_aliases.update({ varin : 'M_IN_'+str(self._Nin) }) if varin not in py_aliases.keys() else None
-                geo_aliases.update({ varin : 'E_OUT_'+str(self._Nin) }) if varin not in geo_aliases.keys() else None
-                section = _make_and_check_section( geo_aliases[varin],py_aliases[varin],ex['freq'],ex['grd'],grids[ex['grd']]['npts'], nmcpl=self._reflines )
-                self._lines.insert( len(self._lines)-1, '# Earth -- '+varin+' --> Models')
-                self._lines.insert( len(self._lines)-1, section)
+        # content to add in namcouple
+        sections = []
+        for way, grd, freq, lag, lbls in _group_exchanges(exchs,fuse):
+            if way == 'in':
+                py_name = py_aliases.get(lbls[0], 'M_IN_'+str(self._Nin))
+                geo_name = geo_aliases.get(lbls[0], 'E_OUT_'+str(self._Nin))
+                sections.append( ('# Earth -- '+','.join(lbls)+' --> Models', (geo_name,py_name,freq,grd,grids[grd]['npts'])) )
                 self._Nin += 1
-            for varout in ex['out']:
-                py_aliases.update({ varout : 'M_OUT_'+str(self._Nout) }) if varout not in py_aliases.keys() else None
-                geo_aliases.update({ varout : 'E_IN_'+str(self._Nout) }) if varout not in geo_aliases.keys() else None
-                section = _make_and_check_section( py_aliases[varout],geo_aliases[varout],ex['freq'],ex['grd'],grids[ex['grd']]['npts'], nmcpl=self._reflines )
-                self._lines.insert( len(self._lines)-1, '# Earth <-- '+varout+' -- Models')
-                self._lines.insert( len(self._lines)-1, section)
+            else:
+                py_name = py_aliases.get(lbls[0], 'M_OUT_'+str(self._Nout))
+                geo_name = geo_aliases.get(lbls[0], 'E_IN_'+str(self._Nout))
+                sections.append( ('# Earth <-- '+','.join(lbls)+' -- Models', (py_name,geo_name,freq,grd,grids[grd]['npts'],lag)) )
                 self._Nout += 1
-        self._lines.insert(len(self._lines)-1, '#')
-
-        self.tunnels.append( Tunnel(label,grids,exchs,geo_aliases,py_aliases) )
+            py_aliases.update({ lbl : py_name for lbl in lbls })
+            geo_aliases.update({ lbl : geo_name for lbl in lbls })
+
+        # production mode: check consistency when tunnels are opened, namcouple is not modified
+        if Mode.PROD:
+            self._unchecked += [ params for _, params in sections ]
+        else:
+            replace_line(self._lines, '# ======= Tunnel '+label+' =======', len(self._lines)-2)
+            for comment, params in sections:
+                self._lines.insert( len(self._lines)-1, comment)
+                self._lines.insert( len(self._lines)-1, _make_and_check_section(*params) )
+            self._lines.insert(len(self._lines)-1, '#')
+
+        self.tunnels.append( Tunnel(label,grids,exchs,geo_aliases,py_aliases,reuse,cache,fuse,mpi_halos,record) )
         return self.tunnels[-1:][0]
     
     def _finalize(self,total_time):
@@ -132,15 +156,15 @@ class Namcouple:
             return
     
         # Update Nbfield and Runtime
-        nfield = int(self._lines[ find_pos(self._lines,'$NFIELDS') + 1 ]) + self._Nin + self._Nout
-        runtime = int(self._lines[ find_pos(self._lines,'$RUNTIME') + 1 ])
-        find_and_replace_line(self._lines,'$NFIELDS',str(nfield),offset=1)
-        if total_time > runtime:
-            find_and_replace_line(self._lines,'$RUNTIME',str(total_time),offset=1)
+        nml = NamcoupleIndex(self._lines)
+        nml.set('$NFIELDS', int(nml.get('$NFIELDS')) + self._Nin + self._Nout)
+        if total_time > int(nml.get('$RUNTIME')):
+            nml.set('$RUNTIME', total_time)
 
         # Update static frequencies - check runtime
-        _check_runtime(total_time) if is_in(self._lines,'-1') else None
-        find_and_replace_char(self._lines,'-1',str(total_time))
+        static = [ fld for fld in nml.fields if nml.field(*fld)[3] == str(Freqs.STATIC) ]
+        _check_runtime(total_time) if static else None
+        [ nml.set_frequency(*fld, total_time) for fld in static ]
 
         # Write namcouple
         write(self._lines,self.outfile,add_header=True) if Paral.RANK == Paral.MASTER else None
@@ -157,21 +181,70 @@ class Namcouple:
         self.comp = init_oasis()
         set_local_communicator(self.comp.localcomm)
         logs.flush_buffer(Paral.MASTER)
+        logs.gather_logs()
+
+        # check registered tunnels consistency with namcouple
+        nml = NamcoupleIndex(self._reflines)
+        for params in self._unchecked:
+            _make_and_check_section(*params, nmcpl=nml)
         
-        # init OASIS commands in tunnels
+        # init OASIS commands in tunnels, lagged fields need restart files before definition ends
         for tnl in self.tunnels:
             tnl._configure(self.comp)
+            tnl._write_restarts(nml)
 
         # Finalize OASIS coupling
         self.comp.enddef()
         self._activated = True
 
 
-def _make_and_check_section(name_snd,name_rcv,freq,grd,npts,nmcpl=''):
+def _init_package():
+    """ Initializes Eophis if not done yet. Namcouple is then instantiated from the default namcouple files. """
+    from .. import init
+    init()
+
+
+def _group_exchanges(exchs,fuse=False):
+    """
+    Gathers Tunnel variables into OASIS fields. Without fusion, each variable is a field.
+    With fusion, variables sharing grid, frequency, type, direction and lag are bundled in the same field.
+    
+    Parameters
+    ----------
+    exchs : list
+        Tunnel user-defined exchanges
+    fuse : bool
+        if True, fuse variables in bundles
+        
+    Returns
+    -------
+    groups : list
+        direction ('in' or 'out'), grid label, frequency, lag and variable labels of each OASIS field
+    
+    """
+    groups = {}
+    for ex in exchs:
+        dtype = np.dtype( np.float64 if 'dtype' not in ex.keys() else ex['dtype'] ).name
+        for way in ('in','out'):
+            lag = ex.get('lag',0) if way == 'out' else 0
+            for lbl in ex[way]:
+                key = (way, ex['grd'], ex['freq'], dtype, lag) if fuse else (way, lbl)
+                groups.setdefault(key, (way, ex['grd'], ex['freq'], lag, []))[4].append(lbl)
+    return list(groups.values())
+
+
+def _make_and_check_section(name_snd,name_rcv,freq,grd,npts,lag=0,nmcpl=None):
     """
     Assembles tunnel infos to create a complete namcouple section.
     Check consistency with namcouple in production mode.
     
+    Parameters
+    ----------
+    lag : int
+        OASIS lag of the field in seconds. A lagged field has its own restart file, named after its source
+    nmcpl : eophis.coupling.namelist.NamcoupleIndex
+        indexed namcouple content to check section with (production mode only)
+    
     Returns
     -------
     section : string
@@ -183,30 +256,24 @@ def _make_and_check_section(name_snd,name_rcv,freq,grd,npts,nmcpl=''):
         if sections in read namcouple does not match sections required by registered tunnels, (production mode only)
     
     """
-    section  = name_snd+' '+name_rcv+' 1 '+str(int(freq))+' 0 rst.nc EXPORTED\n'
-    section += str(npts[0])+' '+str(npts[1])+' '+str(npts[0])+' '+str(npts[1])+' '+str(grd)+' '+ str(grd)+' LAG=0\n'
+    restart = 'rst_'+name_snd+'.nc' if lag else 'rst.nc'
+    section  = name_snd+' '+name_rcv+' 1 '+str(int(freq))+' 0 '+restart+' EXPORTED\n'
+    section += str(npts[0])+' '+str(npts[1])+' '+str(npts[0])+' '+str(npts[1])+' '+str(grd)+' '+ str(grd)+' LAG='+str(int(lag))+'\n'
     section += 'R 0 R 0'
            
     if Mode.PROD:
-        # split section in fundamental subsections
         sct = section.split()
-        secsize = len(''.join(sct))
-        subsec = [ ''.join(sct[0:4]), '.nc'+''.join(sct[6]), ''.join(sct[7:13]), ''.join(sct[-4:]) ]
         
         # in case of static exchange...
         if freq == -1:
-            total_time = nmcpl[ find_pos(nmcpl,'$RUNTIME') +1 ]
-            subsec[0] = subsec[0][:-2] + total_time
-            secsize = secsize -2 + len(total_time)
-            _check_runtime(total_time)
+            sct[3] = nmcpl.get('$RUNTIME')
+            _check_runtime(sct[3])
         
-        # find corresponding subsections in namcouple
-        ref = re.sub(r'\s','',''.join(nmcpl))
-        pos = ref.find(subsec[0])
-        refsec = ref[ pos : pos + secsize ]
-        # compare section and namcouple, stop if they do not match
-        if not all ( sec in refsec for sec in subsec ):
-            logs.abort(f'Section "{" ".join(sct)}" required by registered tunnel does not match with namcouple content "{refsec}"')
+        # compare names, frequency, restart format, status, grids, lag and grid types with namcouple section, transformation lines may follow
+        ref = nmcpl.field(name_snd,name_rcv) or []
+        match = len(ref) >= 18 and ref[0:4] == sct[0:4] and ref[5].endswith('.nc') and ref[6:14] == sct[6:14] and ref[14:18] == sct[14:18]
+        if not match:
+            logs.abort(f'Section "{" ".join(sct)}" required by registered tunnel does not match with namcouple content "{" ".join(ref)}"')
     return section
 
 
@@ -238,9 +305,10 @@ def init_namcouple(cpl_nml_tmp,cpl_nml):
 
     Notes
     -----
-    This function is automatically called when importing eophis package.
+    This function is automatically called at Eophis initialization.
 
     """
+    _init_package()
     if Namcouple._instance is not None:
         logs.warning('Namcouple is already initialized and will be erased with a new instantiation')
         Namcouple._instance = None
@@ -311,6 +379,8 @@ def tunnels_ready():
 
 
 def close_tunnels(reread=True):
-    """ Namcouple API: terminates coupling environement if set up. Resets Namcouple with same initialization attributes. """
+    """ Namcouple API: terminates coupling environement if set up. Resets Namcouple with same initialization attributes. Messages of all processes are forwarded to Master and record files of Tunnels are closed before. """
+    logs.gather_logs()
     logs.info(f'\n  Closing tunnels')
+    [ tnl._close_recorder() for tnl in Namcouple().tunnels ]
     Namcouple()._reset(reread)
@@ -6,6 +6,9 @@ Tools to manipulate namelist content.
     See the `LICENSE <https://github.com/meom-group/eophis/blob/main/LICENSE>`_ file for details.
     
 """
+# eophis modules
+from ..utils.worker import Paral
+from ..utils.params import Mode
 # external modules
 import f90nml
 import time
@@ -22,11 +25,16 @@ class FortranNamelist:
         path to namelist file
     formatted : f90nml.namelist.Namelist
         content of the namelist file in Fortran format
+        
+    Notes
+    -----
+    Namelist file is only read by the first process of a communicator and its content is broadcasted to the others.
+    Eophis communicator is used by default if it does not involve coupled codes, every process reads the file otherwise.
 
     """
-    def __init__(self,file_path):
+    def __init__(self,file_path,comm=None):
         self.file_path = file_path
-        self.formatted = f90nml.read(file_path)
+        self.formatted = root_call(comm or shared_communicator(), f90nml.read, file_path)
 
     def get(self,*labels):
         """
@@ -52,6 +60,83 @@ class FortranNamelist:
         f90nml.write(self.nml,outfile)
 
 
+class NamcoupleIndex:
+    """
+    This class indexes the content of an OASIS namelist. Positions of keyword values and of field sections are found in one pass,
+    so that they are accessed and modified without scanning the whole content again.
+    
+    Attributes
+    ----------
+    lines : list( string )
+        namelist content, modified in place. A line may contain several lines of text.
+    keywords : dict
+        position of the value of each keyword ('$NFIELDS', '$RUNTIME'...)
+    fields : dict
+        positions of the first and after last lines of each field section, keyed by (source, target) field names
+    STATUS : tuple( string )
+        OASIS field status, identify the first line of field sections
+        
+    """
+    STATUS = ('EXPORTED', 'EXPOUT', 'IGNORED', 'IGNOUT', 'INPUT', 'OUTPUT', 'AUXILARY')
+
+    def __init__(self,lines):
+        self.lines = lines
+        self.keywords = {}
+        self.fields = {}
+        block, field = None, None
+        for pos, line in enumerate(lines):
+            tokens = line.split()
+            if len(tokens) == 0 or tokens[0].startswith('#'):
+                continue
+            if tokens[0].startswith('$'):
+                block = None if tokens[0] == '$END' else tokens[0]
+                self.keywords.setdefault(block, pos+1) if block else None
+                field = None
+            elif block == '$STRINGS' and any( tk in self.STATUS for tk in tokens[2:] ):
+                field = (tokens[0], tokens[1])
+                self.fields[field] = [pos, pos+1]
+            elif field is not None:
+                self.fields[field][1] = pos+1
+
+    def get(self,keyword):
+        """ Returns value of a keyword. """
+        return self.lines[ self.keywords[keyword] ].strip()
+
+    def set(self,keyword,value):
+        """ Replaces value of a keyword. """
+        self.lines[ self.keywords[keyword] ] = str(value)
+
+    def field(self,source,target):
+        """
+        Accesses a field section.
+        
+        Parameters
+        ----------
+        source : string
+            source field name
+        target : string
+            target field name
+            
+        Returns
+        -------
+        tokens : list( string )
+            words of the field section, None if not found
+            
+        """
+        if (source,target) not in self.fields:
+            return None
+        start, end = self.fields[(source,target)]
+        return ' '.join( self.lines[start:end] ).split()
+
+    def set_frequency(self,source,target,freq):
+        """ Replaces exchange frequency of a field section. """
+        start = self.fields[(source,target)][0]
+        header, *others = self.lines[start].split('\n', 1)
+        tokens = header.split()
+        tokens[3] = str(freq)
+        self.lines[start] = '\n'.join( [' '.join(tokens)] + others )
+
+
 def raw_content(file_path,retries=5):
     """
     Reads lines contained in a file.
@@ -77,6 +162,71 @@ def raw_content(file_path,retries=5):
         except FileNotFoundError:
             time.sleep(0.25 * (attempt + 1))
     return []
+
+
+def shared_content(file_path,comm=None,retries=5):
+    """
+    Reads lines contained in a file with first process of a communicator, and broadcasts them to the others.
+    Only the reading process retries if FileNotFoundError.
+    
+    Parameters
+    ----------
+    file_path : string
+        path to file
+    comm : mpi4py.MPI.Intracomm
+        communicator of processes requiring file content, every process reads the file if None
+    retries : int
+        number of reading attempts
+        
+    Returns
+    -------
+    lines : list( string )
+        file lines (str), empty list if FileNotFoundError persistent.
+        
+    """
+    return root_call(comm, raw_content, file_path, retries)
+
+
+def shared_communicator():
+    """
+    Returns communicator of eophis processes if collective operations on it do not involve coupled codes, i.e. if eophis processes are isolated or in preproduction mode.
+    Returns None otherwise: before OASIS initialization, eophis communicator contains processes of coupled codes that would never join the collective operation.
+    """
+    return Paral.EOPHIS_COMM if Paral.ISOLATED or Mode.PREPROD else None
+
+
+def root_call(comm,func,*args):
+    """
+    Calls a function with first process of a communicator, and broadcasts its result to the others.
+    An exception raised by the function is broadcasted too and raised again by every process, so that others do not wait for a result that never comes.
+    
+    Parameters
+    ----------
+    comm : mpi4py.MPI.Intracomm
+        communicator of processes requiring the result, every process calls the function if None
+    func : function
+        function to call
+    args : tuple
+        arguments passed to func
+        
+    Returns
+    -------
+    res : object
+        result of func
+        
+    """
+    if comm is None:
+        return func(*args)
+    res, err = None, None
+    if comm.Get_rank() == 0:
+        try:
+            res = func(*args)
+        except Exception as exc:
+            err = exc
+    res, err = comm.bcast( (res, err), root=0 )
+    if err is not None:
+        raise err
+    return res
         
 
 def is_in(lines,target):
@@ -0,0 +1,119 @@
+"""
+This module records fields received through OASIS, to replay them later without coupled geoscientific code.
+
+* Copyright (c) 2023 IGE-MEOM
+    Eophis is released under an MIT License.
+    See the `LICENSE <https://github.com/meom-group/eophis/blob/main/LICENSE>`_ file for details.
+
+"""
+# eophis modules
+from ..utils import logs
+# external modules
+import numpy as np
+import json
+import os
+
+__all__ = []
+
+class Recorder:
+    """
+    This class writes raw received fields, before rebuild, in binary files. Each OASIS field of each process is recorded in three files:
+        - ``<name>_rank<rank>.bin`` : successive raw arrays, in Fortran order
+        - ``<name>_rank<rank>.json`` : type and shape of the raw arrays
+        - ``<name>_rank<rank>.dates`` : date of each raw array, one per line
+
+    Attributes
+    ----------
+    directory : string
+        directory of the records
+    rank : int
+        process rank
+    _files : dict
+        opened data and dates files of each OASIS field
+
+    """
+    def __init__(self, directory, rank):
+        self.directory = directory
+        self.rank = rank
+        self._files = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, name, date, array):
+        """
+        Appends a raw received field to its record.
+
+        Parameters
+        ----------
+        name : string
+            OASIS field name
+        date : int
+            reception date
+        array : numpy.ndarray
+            raw field received from OASIS
+
+        """
+        if name not in self._files:
+            base = record_path(self.directory, name, self.rank)
+            with open(base + '.json', 'w') as outfile:
+                json.dump( { 'dtype' : array.dtype.str, 'shape' : list(array.shape) }, outfile )
+            self._files[name] = ( open(base + '.bin', 'wb'), open(base + '.dates', 'w') )
+        data, dates = self._files[name]
+        data.write( array.tobytes(order='F') )
+        dates.write( f'{date}\n' )
+        data.flush()
+        dates.flush()
+
+    def close(self):
+        """ Closes record files. """
+        for data, dates in self._files.values():
+            data.close()
+            dates.close()
+        self._files = {}
+
+
+def record_path(directory, name, rank):
+    """ Returns path of the record files of an OASIS field for a process, without extension. """
+    return os.path.join(directory, f'{name}_rank{rank}')
+
+
+def load_record(directory, name, rank):
+    """
+    Maps the record of an OASIS field in memory.
+
+    Parameters
+    ----------
+    directory : string
+        directory of the records
+    name : string
+        OASIS field name
+    rank : int
+        process rank
+
+    Returns
+    -------
+    dates : dict
+        position of each recorded date in records
+    records : numpy.ndarray
+        memory-mapped raw fields, of shape (number of records, size, number of levels) and Fortran-ordered for each record
+
+    """
+    base = record_path(directory, name, rank)
+    if not os.path.isfile(base + '.json'):
+        logs.abort(f'Record of field {name} for rank {rank} not found in {directory}')
+    with open(base + '.json') as infile:
+        meta = json.load(infile)
+    with open(base + '.dates') as infile:
+        dates = [ int(line) for line in infile if line.strip() ]
+
+    # last record may be incomplete if recording was interrupted, empty records of idle processes are never incomplete
+    size, nlvl = meta['shape']
+    dtype = np.dtype(meta['dtype'])
+    if size * nlvl == 0:
+        nrec = len(dates)
+    else:
+        nrec = min( len(dates), os.path.getsize(base + '.bin') // (size * nlvl * dtype.itemsize) )
+    if nrec > 0 and size * nlvl > 0:
+        records = np.memmap(base + '.bin', dtype=dtype, mode='r', shape=(nrec, nlvl, size))
+    else:
+        records = np.zeros((nrec, nlvl, size), dtype=dtype)
+    return { date : pos for pos, date in enumerate(dates[:nrec]) }, records.transpose(0,2,1)
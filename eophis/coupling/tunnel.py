@@ -7,16 +7,79 @@ This module is a wrapper for python OASIS API.
     
 """
 # eophis modules
-from ..utils import logs
+from ..utils import logs, timers
 from ..utils.worker import Paral
 from ..utils.params import Freqs
 from ..domain.grid import Grid
+from . import mockoasis
+from .recorder import Recorder
 # external modules
-import pyoasis
-from pyoasis import OASIS
+from time import perf_counter
+import importlib.util
 import numpy as np
+import sys
+import os
+
+__all__ = ['Tunnel','set_backend']
+
+class _MissingModule:
+    """ Stands for a module that is not installed, raises ModuleNotFoundError at first access to one of its attributes. """
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        raise ModuleNotFoundError(f'No module named {self.name!r}, required to open Tunnels with the {self.name} coupling backend')
+
+
+def _lazy_import(name):
+    """ Imports a module whose execution is delayed until first access to one of its attributes. """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return _MissingModule(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def set_backend(backend='pyoasis', records=None):
+    """
+    Selects the coupling library used by Tunnels.
+    
+    Parameters
+    ----------
+    backend : string
+        'pyoasis' : fields are exchanged through OASIS with coupled geoscientific codes (default)
+        'mock' : in-process stand-in, received fields are gathered from synthetic global fields and sent fields are discarded
+        'replay' : mock backend receiving fields recorded by Tunnels instead of synthetic fields
+    records : string
+        directory of recorded fields, for 'replay' backend
+        
+    Notes
+    -----
+    Backend must be selected before opening Tunnels. It may also be selected with the EOPHIS_BACKEND environment variable,
+    and records directory with EOPHIS_RECORDS.
+    
+    """
+    global pyoasis
+    if backend == 'pyoasis':
+        pyoasis = _lazy_import('pyoasis')
+    elif backend == 'mock' or backend == 'replay':
+        pyoasis = mockoasis
+        mockoasis.set_replay( records if backend == 'replay' else None )
+        if backend == 'replay' and records is None:
+            logs.abort('Replay backend requires a records directory')
+    else:
+        logs.abort(f'Coupling backend {backend} not recognized, use pyoasis, mock or replay')
+
+# pyoasis loads OASIS libraries, only required when tunnels are opened
+set_backend( os.environ.get('EOPHIS_BACKEND', 'pyoasis'), os.environ.get('EOPHIS_RECORDS') )
 
-__all__ = ['Tunnel']
 
 class Tunnel:
     """
@@ -35,25 +98,63 @@ class Tunnel:
         Correspondence between Tunnel and namcouple fields names from geophysical side
     py_aliases : dict
         Correspondence between Tunnel and namcouple fields names from Python side
+    reuse : bool
+        if True, received arrays are views of persistent buffers, overwritten by next reception of the same variable
+    cache : string
+        directory of partition plans, plans are not saved if None
+    fuse : bool
+        if True, variables sharing grid, frequency, type and direction are exchanged in a single OASIS field
+    mpi_halos : bool
+        if True, fields are received without halos and halo cells are filled by MPI communications between Eophis processes
+    record : string
+        directory in which raw received fields are recorded, for later replay. Nothing recorded if None
+    copied_bytes : dict
+        number of bytes copied to format the last sending of each variable
     _partitions : dict
         list of pyoasis.Partition objects
     _variables : dict
         list of pyoasis.Var objects to receive ('rcv' key) and to send ('snd' key)
+    _buffers : dict
+        persistent arrays of received fields, in raw OASIS format ('raw' key, per field) and rebuilt ('rebuilt' key, per variable), and of sent fields ('snd' key, per field)
+    _bundles : dict
+        variables exchanged through each OASIS field
+    _levels : dict
+        position of each variable in the bundle of its OASIS field
+    _received : dict
+        date of the last reception of each OASIS field
+    _packed : dict
+        variables already packed in each OASIS field, for the date of its next sending
     _static_used : dict
         status of static variables (exchanged or not)
+    _recorder : eophis.coupling.recorder.Recorder
+        writer of raw received fields, created at first reception if ``record`` is set
+    _lags : dict
+        OASIS lag of each lagged sent variable, in seconds
         
     """
-    def __init__(self, label, grids, exchs, geo_aliases, py_aliases):
+    def __init__(self, label, grids, exchs, geo_aliases, py_aliases, reuse=False, cache=None, fuse=False, mpi_halos=False, record=None):
         self.label = label
         self.grids = {}
         self.exchs = exchs
         self.geo_aliases = geo_aliases
         self.py_aliases = py_aliases
+        self.reuse = reuse
+        self.cache = cache
+        self.fuse = fuse
+        self.mpi_halos = mpi_halos
+        self.record = record
+        self._recorder = None
         self._inpartitions = {}
         self._outpartitions = {}
         self._variables = { 'rcv': {}, 'snd': {} }
+        self._buffers = { 'raw': {}, 'rebuilt': {}, 'snd': {} }
+        self.copied_bytes = {}
         self._static_used = {}
         self._var2grid = {}
+        self._bundles = {}
+        self._levels = {}
+        self._received = {}
+        self._packed = {}
         
         # print some infos
         logs.info(f'-------- Tunnel {label} registered --------')
@@ -71,7 +172,21 @@ class Tunnel:
             hls = 0 if 'halos' not in grd_info.keys() else grd_info['halos']
             bnd = ('close', 'close') if 'bnd' not in grd_info.keys() else grd_info['bnd']
             grd_type, fold = ('T', 'T') if 'folding' not in grd_info.keys() else grd_info['folding']
-            self.grids[grd_label] = Grid( grd_label, nx, ny, hls, bnd, grd_type, fold )
+            mask = None if 'mask' not in grd_info.keys() else grd_info['mask']
+            self.grids[grd_label] = Grid( grd_label, nx, ny, hls, bnd, grd_type, fold, mask )
+
+        # Check exchanges types and lags
+        self._lags = {}
+        for ex in exchs:
+            dtype = np.float64 if 'dtype' not in ex.keys() else ex['dtype']
+            if np.dtype(dtype) != np.float32 and np.dtype(dtype) != np.float64:
+                logs.abort(f'Tunnel {label}: exchange type {dtype} not supported, use float32 or float64')
+            lag = ex.get('lag',0)
+            if lag and (ex['freq'] <= 0 or lag < 0 or lag % ex['freq'] != 0):
+                logs.abort(f'Tunnel {label}: lag {lag} of {ex["out"]} must be a positive multiple of a non-static exchange frequency')
+            self._lags.update({ lbl : lag for lbl in ex['out'] if lag })
+        for lbl, lag in self._lags.items():
+            logs.info(f'  {lbl} is lagged by {lag}s: geoscientific code receives values sent at date t at date t+{lag}')
         logs.info(f'------------------------------------')
 
     def _configure(self, comp):
@@ -96,28 +211,102 @@ class Tunnel:
             # define subdomain
             grd.make_local_subdomain(domid=myrank, nsub=oursize)
             
-            # output grid (without halos) --> OASIS Box
-            global_offset, size_x, size_y, nx = grd.as_box_partition()
-            self._outpartitions[grd_lbl] = pyoasis.BoxPartition(global_offset, size_x, size_y, nx)
+            # input grid (with halos) --> OASIS Orange, or real cells only if halos are filled by MPI communications
+            off_seg, siz_seg, ncells = grd.as_orange_partition(self.cache)
+            if self.mpi_halos:
+                grd.set_halo_exchange(off_seg, siz_seg)
+            if grd.empty or not self.mpi_halos:
+                self._inpartitions[grd_lbl] = pyoasis.OrangePartition(off_seg, siz_seg, ncells)
 
-            # input grid (with halos) --> OASIS Orange
-            off_seg, siz_seg, ncells = grd.as_orange_partition()
-            self._inpartitions[grd_lbl] = pyoasis.OrangePartition(off_seg, siz_seg, ncells)
+            # output grid (without halos) --> OASIS Box, empty subdomain is an Orange partition without segments
+            if grd.empty:
+                self._outpartitions[grd_lbl] = self._inpartitions[grd_lbl]
+            else:
+                global_offset, size_x, size_y, nx = grd.as_box_partition()
+                self._outpartitions[grd_lbl] = pyoasis.BoxPartition(global_offset, size_x, size_y, nx)
+                if self.mpi_halos:
+                    self._inpartitions[grd_lbl] = self._outpartitions[grd_lbl]
 
     def _define_variables(self):
-        """ Creates OASIS variables from attributes and initialise status of static variables. """
+        """ Creates OASIS variables and exchange buffers from attributes and initialise status of static variables. """
+        # variables sharing an alias are bundled in the same field
+        nlvl = {}
         for ex in self.exchs:
+            for lbl in ex['in'] + ex['out']:
+                alias = self.py_aliases[lbl]
+                start = nlvl.get(alias,0)
+                self._levels[lbl] = slice(start, start + ex['lvl'])
+                self._bundles.setdefault(alias, []).append(lbl)
+                nlvl[alias] = start + ex['lvl']
+
+        for ex in self.exchs:
+            grd = self.grids[ex['grd']]
+            dtype = np.float64 if 'dtype' not in ex.keys() else ex['dtype']
             for varin in ex['in']:
+                alias = self.py_aliases[varin]
                 self._var2grid[varin] = ex['grd']
-                self._variables['rcv'][varin] = pyoasis.Var(self.py_aliases[varin], self._inpartitions[ex['grd']], OASIS.IN, bundle_size=ex['lvl'])
+                if alias not in self._received:
+                    self._received[alias] = None
+                    self._buffers['raw'][alias] = grd.generate_receiving_array(nlvl[alias],dtype)
+                    self._variables['rcv'][varin] = pyoasis.Var(alias, self._inpartitions[ex['grd']], pyoasis.OASIS.IN, bundle_size=nlvl[alias])
+                else:
+                    self._variables['rcv'][varin] = self._variables['rcv'][ self._bundles[alias][0] ]
+                self._buffers['rebuilt'][varin] = grd.generate_rebuilt_array(ex['lvl'],dtype)
                 if ex['freq'] == Freqs.STATIC:
                     self._static_used[varin] = False
             for varout in ex['out']:
+                alias = self.py_aliases[varout]
                 self._var2grid[varout] = ex['grd']
-                self._variables['snd'][varout] = pyoasis.Var(self.py_aliases[varout], self._outpartitions[ex['grd']], OASIS.OUT, bundle_size=ex['lvl'])
+                if alias not in self._packed:
+                    self._packed[alias] = {}
+                    self._buffers['snd'][alias] = grd.generate_sending_array(nlvl[alias],dtype)
+                    self._variables['snd'][varout] = pyoasis.Var(alias, self._outpartitions[ex['grd']], pyoasis.OASIS.OUT, bundle_size=nlvl[alias])
+                else:
+                    self._variables['snd'][varout] = self._variables['snd'][ self._bundles[alias][0] ]
+                self.copied_bytes[varout] = 0
                 if ex['freq'] == Freqs.STATIC:
                     self._static_used[varout] = False
 
+    def _write_restarts(self, nmcpl):
+        """
+        Writes OASIS restart files of lagged sent fields, filled with zeros, if they do not exist yet.
+        They provide the values received by the geoscientific code before the first lagged sending. Restart files written by OASIS at the end of a previous run are kept.
+
+        Parameters
+        ----------
+        nmcpl : eophis.coupling.namelist.NamcoupleIndex
+            indexed namcouple content, in which restart files names are read
+
+        """
+        fields = { self.py_aliases[lbl] : self.geo_aliases[lbl] for lbl in self._lags }
+        if not fields:
+            return
+        if Paral.RANK == Paral.MASTER:
+            for alias, geo_alias in fields.items():
+                grd = self.grids[ self._var2grid[ self._bundles[alias][0] ] ]
+                nlvl = sum( self._levels[lbl].stop - self._levels[lbl].start for lbl in self._bundles[alias] )
+                sct = nmcpl.field(alias, geo_alias)
+                _write_restart(sct[5], alias, nlvl, grd)
+        Paral.EOPHIS_COMM.Barrier()
+
+    def _close_recorder(self):
+        """ Closes record files of received fields, if any. Next receptions are recorded in new files. """
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+
+    def lags(self):
+        """ Returns OASIS lag of lagged sent variables, in seconds. """
+        return dict(self._lags)
+
+    def is_idle(self):
+        """ Returns True if local subdomains of all grids are empty, i.e. only land subdomains would have been left to local process. """
+        return all( grd.empty for grd in self.grids.values() )
+
+    def idle_sendings(self):
+        """ Returns empty arrays to send for all non-static sendable variables, for idle processes. """
+        return { lbl : np.zeros( (0, 0, self._levels[lbl].stop - self._levels[lbl].start) ) for lbl in self.departure_list() }
+
     def arriving_list(self):
         """ Returns list of non-static receiveable variables. """
         return [ lbl for ex in self.exchs for lbl in ex['in'] if ex['freq'] > 0 ]
@@ -126,6 +315,30 @@ class Tunnel:
         """ Returns list of non-static sendable variables. """
         return [ lbl for ex in self.exchs for lbl in ex['out'] if ex['freq'] > 0 ]
 
+    def active_steps(self, step, niter):
+        """
+        Identifies loop iterations at which at least one non-static variable is exchanged.
+        
+        Parameters
+        ----------
+        step : int
+            loop time step, in seconds
+        niter : int
+            number of loop iteration
+            
+        Returns
+        -------
+        its : numpy.ndarray
+            indexes of iterations with exchanges
+            
+        """
+        freqs = { var.cpl_freqs[0] for direction in ('rcv','snd') for lbl,var in self._variables[direction].items() if lbl not in self._static_used }
+        dates = ( np.arange(niter) * step ).astype(int)
+        active = np.zeros(niter, dtype=bool)
+        for freq in freqs:
+            active |= ( dates % freq == 0 )
+        return np.flatnonzero(active)
+
     def send(self, var_label, values, date=86579):
         """
         Sends variable value to geoscientific code if date does match frequency exchange, nothing otherwise.
@@ -139,6 +352,13 @@ class Tunnel:
         values : numpy.ndarray
             array to send through OASIS under var_label
             
+        Notes
+        -----
+        Real cells are copied in a persistent Fortran-ordered buffer of the exchange type before sending, unless values already are a contiguous Fortran-ordered array without halos of that type.
+        Size of the copy is stored in ``copied_bytes``. Durations of formatting ('format') and sending ('put') are recorded in exchange timings.
+        If variables are fused, values are packed in the bundle buffer of their OASIS field, which is sent once all its variables have been sent at the same date.
+        Field is not sent at a date if one of its variables is missing, a warning is raised when the next date is packed.
+            
         Raises
         ------
         eophis.warning()
@@ -157,14 +377,42 @@ class Tunnel:
             self._static_used[var_label] = True
             date = 0
         elif var_label in self._static_used and self._static_used[var_label]:
-            logs.warning(f'Static sending of {var_label} through tunnel {self.label} already done, skipped')
+            logs.warning('Static sending of %s through tunnel %s already done, skipped', var_label, self.label)
             return
         
-        # format field and send
+        # format field and send, fused field is sent once all its variables are packed
         if values is not None and (date % var.cpl_freqs[0] == 0):
-            values = grd.format_sending_array(values,var_label)
-            values = pyoasis.asarray(values)
-            var.put(date,values)
+            alias = self.py_aliases[var_label]
+            snd_buf = self._buffers['snd'][alias]
+            t0 = perf_counter()
+            if len(self._bundles[alias]) == 1:
+                snd_fld = grd.format_sending_array(values,var_label,snd_buf)
+                self.copied_bytes[var_label] = snd_fld.nbytes if snd_fld is snd_buf else 0
+            else:
+                snd_lvl = snd_buf[:,:,self._levels[var_label]]
+                snd_fld = grd.format_sending_array(values,var_label,snd_lvl)
+                if snd_fld is not snd_lvl:
+                    snd_lvl[:] = snd_fld
+                self.copied_bytes[var_label] = snd_lvl.nbytes
+                packed = self._pack(alias, var_label, date)
+                snd_fld = snd_buf if len(packed) == len(self._bundles[alias]) else None
+            t1 = perf_counter()
+            timers.record(self.label, var_label, 'format', t1 - t0, self.copied_bytes[var_label])
+
+            if snd_fld is not None:
+                var.put(date,snd_fld)
+                timers.record(self.label, var_label, 'put', perf_counter() - t1, snd_fld.nbytes)
+                self._packed[alias].clear()
+
+    def _pack(self, alias, var_label, date):
+        """ Marks a variable as packed in its OASIS field at date, returns variables packed at date. Incomplete packings of previous dates are dropped. """
+        packed = self._packed[alias]
+        for old_date in [ dt for dt in packed if dt != date ]:
+            missing = ', '.join( lbl for lbl in self._bundles[alias] if lbl not in packed[old_date] )
+            logs.warning('Fused field %s of tunnel %s not sent at date %s, missing variables: %s', alias, self.label, old_date, missing)
+            del packed[old_date]
+        packed.setdefault(date, set()).add(var_label)
+        return packed[date]
 
     def receive(self, var_label, date=86579):
         """
@@ -187,6 +435,13 @@ class Tunnel:
         rcv_fld : numpy.ndarray
             array sent by geoscientific code, None if date does not match frequency exchange
             
+        Notes
+        -----
+        If Tunnel ``reuse`` is True, returned array is overwritten by the next reception of var_label. Copy it to keep its values.
+        If variables are fused, their OASIS field is received with the first of them and unpacked for the next ones at the same date.
+        Durations of reception ('get') and rebuilding ('rebuild') are recorded in exchange timings.
+        If ``record`` is set, raw OASIS fields are written in record files after reception, before rebuild.
+            
         """
         # variable and grid
         var = self._variables['rcv'][var_label]
@@ -198,20 +453,61 @@ class Tunnel:
             self._static_used[var_label] = True
             date = 0
         elif var_label in self._static_used and self._static_used[var_label]:
-            logs.warning(f'Static receive of {var_label} through tunnel {self.label} already done, skipped')
+            logs.warning('Static receive of %s through tunnel %s already done, skipped', var_label, self.label)
             return
         
-        # get field and rebuild
+        # get field and rebuild, fused field is received once per date
         if (date % var.cpl_freqs[0] == 0):
-            rcv_fld = grd.generate_receiving_array(var.bundle_size)
-            rcv_fld = pyoasis.asarray(rcv_fld)
-            var.get(date,rcv_fld)
-            rcv_fld = grd.rebuild(rcv_fld)
+            alias = self.py_aliases[var_label]
+            raw_fld = self._buffers['raw'][alias]
+            t0 = perf_counter()
+            if self._received[alias] != date:
+                var.get(date,raw_fld)
+                self._received[alias] = date
+                timers.record(self.label, var_label, 'get', perf_counter() - t0, raw_fld.nbytes)
+                if self.record:
+                    self._recorder = self._recorder or Recorder(self.record, Paral.RANK)
+                    self._recorder.write(alias, date, raw_fld)
+            t1 = perf_counter()
+            rcv_fld = self._buffers['rebuilt'][var_label]
+            rcv_fld = rcv_fld if self.reuse else np.empty_like(rcv_fld)
+            rcv_fld = grd.rebuild(raw_fld[:,self._levels[var_label]],rcv_fld)
+            timers.record(self.label, var_label, 'rebuild', perf_counter() - t1, rcv_fld.nbytes)
             return rcv_fld
         else:
             return None
 
 
+def _write_restart(path, name, nlvl, grd):
+    """
+    Adds an OASIS field filled with zeros in a restart file, unless already present. File is created if it does not exist.
+
+    Parameters
+    ----------
+    path : string
+        restart file name
+    name : string
+        namcouple name of the field on the sending side
+    nlvl : int
+        number of levels of the field, levels of a bundle are stored as ``<name>_bundleNN`` variables
+    grd : eophis.Grid
+        global grid of the field
+
+    """
+    from netCDF4 import Dataset
+    nx, ny = grd.size
+    names = [name] if nlvl == 1 else [ f'{name}_bundle{n+1:02d}' for n in range(nlvl) ]
+    with Dataset(path, 'a' if os.path.isfile(path) else 'w') as outfile:
+        dims = ( f'y_{grd.label}', f'x_{grd.label}' )
+        for dim, npts in zip(dims, (ny,nx)):
+            if dim not in outfile.dimensions:
+                outfile.createDimension(dim, npts)
+        for var in names:
+            if var not in outfile.variables:
+                outfile.createVariable(var, np.float64, dims)[:] = 0.0
+                logs.info(f'  Initial values of lagged field {var} set to zero in OASIS restart file {path}')
+
+
 def init_oasis(comp_name='eophis'):
     """
     Initializes OASIS environment.
@@ -22,4 +22,6 @@ from .grid import *
 from .halo import *
 from .cyclichalo import *
 from .nfhalo import *
+from .mpihalo import *
 from .offsiz import *
+from .planner import *
@@ -65,40 +65,34 @@ class CyclicHalo(HaloGrid):
     
     def segment(self):
         """ Decomposes close/cyclic boundary-crossing halo cells into offsets/sizes couple. """
-        hls_offsets = []
-        hls_sizes = []
-    
         start_line = 0 + self.size*self.full_dim[1]
         end_line = self.local_grid[1] + self.size + self.size*(1-self.full_dim[1])
     
-        # segment halos cells
-        for l in range( start_line , end_line ):
-            start = self.offset + self.global_grid[0] * ( l - self.size )
-            start = start % (self.global_grid[0]*self.global_grid[1])
-            
-            # above- and below- intern lines
-            if l < self.size or l >= self.local_grid[1] + self.size:
-                hls_offsets.append( start )
-                hls_sizes.append( self.local_grid[0] )
+        # lines of halo cells, with their global offset
+        lines = np.arange( start_line , end_line )
+        starts = self.offset + self.global_grid[0] * ( lines - self.size )
+        starts = starts % (self.global_grid[0]*self.global_grid[1])
+        
+        # above- and below- intern lines
+        offsets = [ starts[:,None] ]
+        sizes = [ np.full( (len(lines),1), self.local_grid[0] ) ]
+        keep = [ ( (lines < self.size) | (lines >= self.local_grid[1] + self.size) )[:,None] ]
             
-            # extremities
-            if not self.full_dim[0]:
-                # left
-                local_offset = ( start % self.global_grid[0] - self.size )
-                off, siz = super().segment_side_halos(start,local_offset)
-                hls_offsets += off
-                hls_sizes += siz
-                
-                # right
-                local_offset = ( start % self.global_grid[0] + self.local_grid[0] )
-                off, siz = super().segment_side_halos(start,local_offset)
-                hls_offsets += off
-                hls_sizes += siz
-        return hls_offsets, hls_sizes
+        # extremities
+        if not self.full_dim[0]:
+            for local_offsets in ( starts % self.global_grid[0] - self.size , starts % self.global_grid[0] + self.local_grid[0] ):
+                off, siz, kp = super().segment_side_lines(starts,local_offsets)
+                offsets.append(off)
+                sizes.append(siz)
+                keep.append(kp)
+        
+        # gather segments line by line
+        keep = np.hstack(keep)
+        return np.hstack(offsets)[keep].tolist(), np.hstack(sizes)[keep].tolist()
     
-    def rebuild(self, field_grid):
-        """ Rebuilds a received field from OASIS into subdomain with close/cyclic boundary-crossing halo cells. """
-        field_grid = super().rebuild(field_grid,self.full_dim)
+    def apply_instructions(self, field_grid):
+        """ Rebuilds step by step a received field into subdomain with close/cyclic boundary-crossing halo cells. """
+        field_grid = super().apply_instructions(field_grid,self.full_dim)
         field_grid = np.roll(field_grid,self.shifts[0],axis=0)
         field_grid = np.roll(field_grid,self.shifts[1],axis=1)
         field_grid = self.fill_boundary_halos(field_grid)
@@ -12,11 +12,18 @@ from .offsiz import clean_for_oasis, set_fold_trf
 from .halo import HaloGrid
 from .cyclichalo import CyclicHalo
 from .nfhalo import NFHalo
+from .mpihalo import MPIHalo
+from ..utils.worker import Paral
 # external module
 import numpy as np
+import zlib
+import os
 
 __all__ = ['Domains']
 
+# format of partition plan files, plans written with another format are recomputed
+PLAN_VERSION = 1
+
 class Domains:
     """
     This class contains pre-defined Grids.
@@ -83,19 +90,29 @@ class Grid:
         grid type (T,U,V,F) for Fold boundary condition
     fold : string
         folding point (T,F) for Fold boundary condition
+    mask : numpy.ndarray
+        global sea mask of shape (nx,ny), True for sea points. Subdomains only containing land points are eliminated from decomposition. None if not provided
     subdom : int
         ID of the subdomain for which the Grid is configured
+    nsub : int
+        number of subdomains in which the Grid is decomposed
     loc_size : (int,int)
         local subdomain grid size (with halos) for which the Grid is configured
-    _global_offset : int
+    empty : bool
+        True if no subdomain is left for the local process after land elimination
+    global_offset : int
         offset of the local subdomain within the global grid
     halos : eophis.HaloGrid
         subdomain halo grid for which the Grid is configured
     _oasis_size : int
         number of cells received by OASIS for the two first dimensions
+    exchange : eophis.MPIHalo
+        fills halo cells by MPI communications if set, fields are then received without halos. None if halos are received through OASIS
+    _layout : (tuple,tuple,numpy.ndarray)
+        sizes of decomposition rectangles in x and y directions, and process handling each rectangle (negative if eliminated)
         
     """
-    def __init__(self, label, nx, ny, halo_size=0, bnd=('close','close'), grd='T', fold='T'):
+    def __init__(self, label, nx, ny, halo_size=0, bnd=('close','close'), grd='T', fold='T', mask=None):
         # global grid attributes
         self.label = label
         self.size = (nx,ny)
@@ -103,12 +120,17 @@ class Grid:
         self.bnd = ( bnd[0].lower() , bnd[1].lower() )
         self.fold = fold.upper()
         self.grd = grd.upper()
+        self.mask = None if mask is None else _read_mask(mask, label)
         
         # local grid attributes
         self.subdom = None
+        self.nsub = None
         self.loc_size = None
+        self.empty = False
         self.halos = None
-        self._global_offset = 0
+        self.exchange = None
+        self._layout = None
+        self.global_offset = 0
         self._oasis_size = 0
         
         # check arguments
@@ -128,6 +150,12 @@ class Grid:
         elif 'close' not in self.bnd[1] and 'cyclic' not in self.bnd[1]:
             logs.warning(f'Grid {label}: unrecognized y dimension boundary condition, set to close by default')
             self.bnd = (self.bnd[0],'close')
+
+        if self.mask is not None:
+            if self.mask.shape != (nx,ny):
+                logs.abort(f'Grid {label}: shape {self.mask.shape} of land/sea mask does not match global size {nx,ny}')
+            if not self.mask.any():
+                logs.abort(f'Grid {label}: land/sea mask does not contain any sea point')
         
         # print some infos
         logs.info(f'\n  Grid {label} registered ')
@@ -135,6 +163,8 @@ class Grid:
         logs.info(f'      Boundary conditions: {self.bnd[0],self.bnd[1]}')
         if 'fold' in self.bnd[1]:
             logs.info(f'      Grid Type, Folding Point: {self.grd,self.fold}')
+        if self.mask is not None:
+            logs.info(f'      Sea points: {np.count_nonzero(self.mask)} out of {nx*ny}')
                 
     def decompose(self,nsub):
         """
@@ -170,8 +200,7 @@ class Grid:
                         py = i if nx >= ny else j
                     
         # spread grid size over subdomains
-        rankx = tuple( 1 + nx // px if i < nx % px else nx // px for i in range(px) )
-        ranky = tuple( 1 + ny // py if i < ny % py else ny // py for i in range(py) )
+        rankx, ranky = _spread(nx,px), _spread(ny,py)
 
         # check size compatibility
         if nx*ny < nsub:
@@ -184,6 +213,73 @@ class Grid:
         # return results
         return rankx, ranky
 
+    def decompose_masked(self,nsub):
+        """
+        Finds the best decomposition of global grid into rectangles for a given number of subdomains, land rectangles being eliminated.
+        
+        Parameters
+        ----------
+        nsub : int
+            maximum number of subdomains containing sea points
+            
+        Returns
+        -------
+        rankx : tuple( int )
+            grid size for each rectangles in x direction
+        ranky : tuple( int )
+            grid size for each rectangles in y direction
+        active : numpy.ndarray
+            indexes of rectangles containing sea points, that are kept as subdomains. Rectangle index is ``isub + len(rankx) * jsub``
+        
+        Notes
+        -----
+        For each number ``px`` of rectangles in x direction, the largest number ``py`` in y direction is searched by bisection such as at most ``nsub`` rectangles contain sea points.
+        Among these candidates, the decomposition whose largest subdomain (with halos) is the smallest is kept, then the one whose sea points are the best balanced.
+        
+        """
+        # sea points in any rectangle are given by summed area table
+        nx, ny = self.size
+        hls = self.halo_size
+        sat = np.zeros( (nx+1,ny+1), dtype=np.int64 )
+        sat[1:,1:] = self.mask.cumsum(axis=0).cumsum(axis=1)
+        
+        def sea_points(edges_x,py):
+            corners = sat[np.ix_(edges_x,_edges(ny,py))]
+            return corners[1:,1:] - corners[:-1,1:] - corners[1:,:-1] + corners[:-1,:-1]
+
+        def cost(px,py,sea):
+            # size of largest subdomain with halos, sea points of the most loaded one, aspect ratio
+            keep = sea > 0
+            area = np.outer( np.diff(_edges(nx,px)) + 2*hls, np.diff(_edges(ny,py)) + 2*hls )
+            return ( area[keep].max(), sea.max(), abs( px/py - nx/ny ) )
+        
+        best, cost0 = None, None
+        for px in range( 1, min(nx,nsub) + 1 ):
+            # bracket largest py such as sea rectangles do not exceed nsub, starting from px*py close to nsub
+            edges_x = _edges(nx,px)
+            fits = lambda py: np.count_nonzero( sea_points(edges_x,py) ) <= nsub
+            lo, hi = 1, min( ny, -(-nsub // px) )
+            if fits(hi):
+                lo, step = hi, 1
+                hi = min( ny, lo + step )
+                while hi > lo and fits(hi):
+                    lo, step = hi, 2*step
+                    hi = min( ny, lo + step )
+                hi = hi + 1 if hi == lo else hi
+            # bisect, sea rectangles number almost always increases with py
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                lo, hi = (mid, hi) if fits(mid) else (lo, mid)
+            cost1 = cost(px, lo, sea_points(edges_x,lo))
+            if best is None or cost1 < cost0:
+                best, cost0 = (px,lo), cost1
+        
+        px, py = best
+        active = np.flatnonzero( sea_points(_edges(nx,px),py).ravel(order='F') > 0 )
+        if len(active) < nsub:
+            logs.warning(f'Grid {self.label}: only {len(active)} subdomains contain sea points, {nsub-len(active)} processes will be idle')
+        return _spread(nx,px), _spread(ny,py), active
+
     def make_local_subdomain(self,domid,nsub):
         """
         Decomposes the global grid in subdomains. Identifies the local subdomain properties. Selects the Halo grid corresponding to subdomain.
@@ -205,18 +301,37 @@ class Grid:
         """
         # check arguments
         self.subdom = domid
+        self.nsub = nsub
         if domid > nsub:
             logs.abort(f'Grid {self.label}: Subdomain ID {domid} is greater than Grid subdomains {nsub}')
         if domid < 0:
             logs.abort(f'Grid {self.label}: Subdomain ID {domid} should not negative')
         
-        # divide grid in subdomains
+        # divide grid in subdomains, land rectangles are eliminated if mask is provided
         logs.info(f'            Configure grid {self.label} for subdomain {domid+1} out of {nsub} with {self.halo_size} halo cells.')
-        sub_sizes_x, sub_sizes_y = self.decompose(nsub)
+        if self.mask is None:
+            sub_sizes_x, sub_sizes_y = self.decompose(nsub)
+            ranks = np.arange(nsub)
+        else:
+            sub_sizes_x, sub_sizes_y, active = self.decompose_masked(nsub)
+            ranks = np.full( len(sub_sizes_x)*len(sub_sizes_y), -1 )
+            ranks[active] = np.arange(len(active))
+        self._layout = (sub_sizes_x, sub_sizes_y, ranks)
+        rect = np.flatnonzero(ranks == domid)
+        rect = rect[0] if len(rect) > 0 else None
+
+        # no subdomain left, empty partition
+        self.empty = rect is None
+        if self.empty:
+            logs.info(f'            No subdomain with sea points left for grid {self.label}, local partition is empty.')
+            self.loc_size = (0,0)
+            self.global_offset = 0
+            self.halos = HaloGrid(0, self.size, self.loc_size, self.global_offset)
+            return
 
         # local grid dimension
-        isub = domid % len(sub_sizes_x)
-        jsub = domid // len(sub_sizes_x)
+        isub = rect % len(sub_sizes_x)
+        jsub = rect // len(sub_sizes_x)
         self.loc_size = ( sub_sizes_x[isub] , sub_sizes_y[jsub] )
         self.global_offset = sum(sub_sizes_y[0:jsub]) * self.size[0] + sum(sub_sizes_x[0:isub])
             
@@ -227,59 +342,290 @@ class Grid:
         """ Returns subdomain real cells (only) as parameters useable by OASIS to define a sending Box Partition. """
         return self.global_offset, self.loc_size[0], self.loc_size[1], self.size[0]
         
-    def as_orange_partition(self):
-        """ Returns subdomain real and halo cells as parameters useable by OASIS to define a receiving Orange Partition. """
-        # segment real cells
-        seg_offsets = []
-        seg_sizes = []
-        for l in range(self.loc_size[1]):
-            start = self.global_offset + self.size[0] * l
-            seg_offsets.append( start )
-            seg_sizes.append( self.loc_size[0] )
+    def as_orange_partition(self,cache=None):
+        """
+        Returns subdomain real and halo cells as parameters useable by OASIS to define a receiving Orange Partition.
+        
+        Parameters
+        ----------
+            cache : string
+                directory of partition plans. If given, partition and rebuild plan are loaded from it if they exist, saved in it otherwise
         
-        # segment halos cells
-        halos_offsets, halos_sizes = self.halos.segment()
+        Notes
+        -----
+        Empty subdomain is defined as a partition without segments, so that the process still takes part in OASIS communications.
         
-        # gather segments for oasis
-        seg_offsets += halos_offsets
-        seg_sizes += halos_sizes
-        seg_offsets, seg_sizes = clean_for_oasis( seg_offsets , seg_sizes)
+        """
+        if self.empty:
+            self.orange_size = 0
+            self.halos.compile_rebuild(self.orange_size)
+            return [], [], self.size[0]*self.size[1]
+
+        plan_file = self.plan_file(cache) if cache else None
+        if plan_file and os.path.isfile(plan_file):
+            plan = self.load_plan(plan_file)
+            if plan is not None:
+                return plan
+    
+        # segment real and halo cells
+        seg_offsets, seg_sizes = _orange_segments( self.halos, self.global_offset, self.size[0], self.loc_size )
         
         # total size of orange partition
         self.orange_size = sum(seg_sizes)
+        
+        # compile rebuild instructions for received fields
+        self.halos.compile_rebuild(self.orange_size)
+        self.save_plan(plan_file,seg_offsets,seg_sizes) if plan_file else None
         return seg_offsets, seg_sizes, self.size[0]*self.size[1]
+
+    def set_halo_exchange(self,seg_offsets,seg_sizes,comm=None):
+        """
+        Fills halo cells by MPI communications between neighboring subdomains instead of receiving them through OASIS. Fields are then received on Box partition.
         
-    def rebuild(self,oasis_field):
-        """ Rebuilds a received field from OASIS into subdomain shape with real and halo cells. """
-        return self.halos.rebuild(oasis_field)
+        Parameters
+        ----------
+            seg_offsets, seg_sizes : list( int )
+                Orange partition segments of the subdomain, as returned by ``as_orange_partition()``
+            comm : mpi4py.MPI.Intracomm
+                communicator of the processes sharing the decomposition, eophis communicator if None
+        
+        Notes
+        -----
+        This is a collective operation on comm.
         
-    def format_sending_array(self,sending_array,var_label=''):
-        """ Converts a real and halo cells shaped subdomain field into a sending-compatible shape. """
+        """
+        # global cell received in each orange partition cell
+        received = np.concatenate( [ np.arange(off, off + siz) for off, siz in zip(seg_offsets, seg_sizes) ] + [ np.array([],dtype=int) ] )
+        
+        # global cell filling each rebuilt cell, from rebuild plan
+        if self.halos._gather is None:
+            sources = received
+        else:
+            sources = received[self.halos._gather]
+            sources[self.halos._zeros] = -1
+            
+        rankx, ranky, ranks = self._layout
+        self.exchange = MPIHalo( sources, self.halos._rebuilt_size, rankx, ranky, ranks, comm or Paral.EOPHIS_COMM )
+        self.orange_size = self.loc_size[0] * self.loc_size[1]
+
+    def plan_file(self,cache):
+        """ Returns path of the partition plan file in cache directory. Plans only depend on global grid properties, mask and on subdomain, not on Grid name. """
+        nx, ny = self.size
+        masking = '' if self.mask is None else f'_m{zlib.crc32(np.packbits(self.mask)):08x}'
+        name = f'plan_{nx}x{ny}_h{self.halo_size}_{self.bnd[0]}_{self.bnd[1]}_{self.grd}{self.fold}{masking}_{self.subdom}of{self.nsub}.npz'
+        return os.path.join(cache,name)
+
+    def save_plan(self,plan_file,seg_offsets,seg_sizes):
+        """ Writes Orange partition and halos rebuild plan of the subdomain in plan file. """
+        os.makedirs(os.path.dirname(plan_file) or '.', exist_ok=True)
+        gather = self.halos._gather if self.halos._gather is not None else np.array([],dtype=int)
+        zeros = self.halos._zeros if self.halos._zeros is not None else np.array([],dtype=int)
+        
+        # write in temporary file first, a plan file is thus always complete
+        tmp_file = plan_file + '.tmp'
+        with open(tmp_file,'wb') as outfile:
+            np.savez( outfile, version=np.array(PLAN_VERSION), box=np.array(self.as_box_partition()), offsets=np.array(seg_offsets), sizes=np.array(seg_sizes), \
+                      gather=gather, zeros=zeros, rebuilt_size=np.array(self.halos._rebuilt_size) )
+        os.replace(tmp_file,plan_file)
+
+    def load_plan(self,plan_file):
+        """
+        Reads Orange partition and halos rebuild plan of the subdomain from plan file. Returns Orange partition parameters, None if plan does not match subdomain.
+        A plan is only accepted if it has the current format, and if its partition and rebuild plan are consistent with the subdomain and its halos.
+        """
+        try:
+            with np.load(plan_file) as plan:
+                version = int(plan['version']) if 'version' in plan.files else None
+                box, seg_offsets, seg_sizes = plan['box'], plan['offsets'], plan['sizes']
+                gather, zeros, rebuilt_size = plan['gather'], plan['zeros'], plan['rebuilt_size']
+        except (OSError, ValueError, KeyError):
+            logs.warning(f'Grid {self.label}: partition plan {plan_file} is not readable, recomputed')
+            return None
+        if version != PLAN_VERSION:
+            logs.warning(f'Grid {self.label}: partition plan {plan_file} has format {version} instead of {PLAN_VERSION}, recomputed')
+            return None
+        if not self._plan_matches(box, seg_offsets, seg_sizes, gather, zeros, rebuilt_size):
+            logs.warning(f'Grid {self.label}: partition plan {plan_file} does not match subdomain, recomputed')
+            return None
+        
+        # set rebuild plan
+        self.orange_size = int(np.sum(seg_sizes))
+        self.halos._gather = gather if len(gather) > 0 else None
+        self.halos._zeros = zeros
+        self.halos._rebuilt_size = tuple(rebuilt_size.tolist())
+        return seg_offsets.tolist(), seg_sizes.tolist(), self.size[0]*self.size[1]
+        
+    def _plan_matches(self,box,seg_offsets,seg_sizes,gather,zeros,rebuilt_size):
+        """ Checks if a loaded plan matches subdomain: Box partition, rebuilt size, segments within the global grid and rebuild indexes within the Orange partition. """
+        rebuilt = ( self.loc_size[0] + 2*self.halos.size, self.loc_size[1] + 2*self.halos.size )
+        ncells, orange_size = self.size[0] * self.size[1], int(np.sum(seg_sizes))
+        if tuple(box.tolist()) != self.as_box_partition() or tuple(rebuilt_size.tolist()) != rebuilt or len(seg_offsets) != len(seg_sizes):
+            return False
+        if np.any(seg_sizes <= 0) or np.any(seg_offsets < 0) or np.any(seg_offsets + seg_sizes > ncells):
+            return False
+        if np.any(zeros < 0) or np.any(zeros >= rebuilt[0]*rebuilt[1]):
+            return False
+        if len(gather) == 0:
+            return orange_size == rebuilt[0] * rebuilt[1] and len(zeros) == 0
+        return len(gather) == rebuilt[0] * rebuilt[1] and 0 <= gather.min() and gather.max() < orange_size
+
+    def rebuild(self,oasis_field,out=None):
+        """ Rebuilds a received field from OASIS into subdomain shape with real and halo cells, in ``out`` if provided. Halo cells are filled by MPI communications if set. """
+        if self.exchange is not None:
+            return self.exchange.fill(oasis_field,out)
+        return self.halos.rebuild(oasis_field,out)
+        
+    def format_sending_array(self,sending_array,var_label='',out=None):
+        """
+        Converts a real and halo cells shaped subdomain field into a sending-compatible shape.
+        
+        Parameters
+        ----------
+            sending_array : numpy.ndarray
+                subdomain field to send, with real and halo cells or with real cells only
+            var_label : string
+                name of the sent variable, for error messages
+            out : numpy.ndarray
+                Fortran-ordered sending buffer in which to copy real cells if required
+        
+        Returns
+        -------
+            snd_fld : numpy.ndarray
+                real cells of sending_array, copied in ``out`` if provided and real cells are not already contiguous with ``out`` type
+        
+        """
         # check array
         if not isinstance(sending_array, np.ndarray):
             logs.abort(f'Grid {self.label}: Sending array for {var_label} must by a numpy array')
         if len(sending_array.shape) != 3:
             logs.abort(f'Grid {self.label}: Shape of sending array for {var_label} must be equal to 3 and is {len(sending_array.shape)}')
-        # check size
-        hls = self.halos.size
+        # check size, array may be given without halos
+        hls = self.halos.size if sending_array.shape[:2] != self.loc_size else 0
         send_size = (sending_array.shape[0]-2*hls) * (sending_array.shape[1]-2*hls)
         part_size = self.loc_size[0]*self.loc_size[1]
         if ( send_size != part_size ):
             logs.abort(f'Grid {self.label}: Size {send_size} of sending array for {var_label} does not match partition {part_size}')
 
         # remove halos
-        return sending_array[ hls : sending_array.shape[0]-hls , hls : sending_array.shape[1]-hls , : ]
+        snd_fld = sending_array[ hls : sending_array.shape[0]-hls , hls : sending_array.shape[1]-hls , : ]
+        if out is None or ( snd_fld.flags.f_contiguous and snd_fld.dtype == out.dtype ):
+            return snd_fld
+
+        # copy real cells in sending buffer
+        if snd_fld.shape != out.shape:
+            logs.abort(f'Grid {self.label}: Shape {snd_fld.shape} of sending array for {var_label} does not match sending buffer {out.shape}')
+        out[...] = snd_fld
+        return out
                 
-    def generate_receiving_array(self,nlvl=1):
+    def generate_receiving_array(self,nlvl=1,dtype=np.float64):
         """ Generates an array whose shape matches OASIS reception raw format.
         
         Parameters
         ----------
             nlvl : int
                 number of third dimension level to generate, (default=1)
+            dtype : numpy.dtype
+                type of array elements, (default=numpy.float64)
         
         """
-        return np.zeros( (self.orange_size,nlvl) )
+        return np.zeros( (self.orange_size,nlvl), dtype=dtype, order='F' )
+
+    def generate_sending_array(self,nlvl=1,dtype=np.float64):
+        """ Generates a Fortran-ordered array whose shape matches OASIS sending format, with real cells only.
+        
+        Parameters
+        ----------
+            nlvl : int
+                number of third dimension level to generate, (default=1)
+            dtype : numpy.dtype
+                type of array elements, (default=numpy.float64)
+        
+        """
+        return np.zeros( (self.loc_size[0], self.loc_size[1], nlvl), dtype=dtype, order='F' )
+
+    def generate_rebuilt_array(self,nlvl=1,dtype=np.float64):
+        """ Generates a Fortran-ordered array whose shape matches a rebuilt received field, with real and halo cells.
+        
+        Parameters
+        ----------
+            nlvl : int
+                number of third dimension level to generate, (default=1)
+            dtype : numpy.dtype
+                type of array elements, (default=numpy.float64)
+        
+        """
+        hls = self.halos.size
+        return np.zeros( (self.loc_size[0]+2*hls, self.loc_size[1]+2*hls, nlvl), dtype=dtype, order='F' )
+
+
+def _spread(n, p):
+    """ Returns sizes of ``p`` near-equal parts of ``n`` cells, larger parts first. """
+    return tuple( 1 + n // p if i < n % p else n // p for i in range(p) )
+
+
+def _edges(n, p):
+    """ Returns bounds of ``p`` near-equal parts of ``n`` cells, as spread by ``_spread()``. """
+    sizes = n // p + ( np.arange(p) < n % p )
+    return np.concatenate( ([0], np.cumsum(sizes)) )
+
+
+def _read_mask(mask, label=''):
+    """
+    Returns a land/sea mask as a boolean array of shape (nx,ny), True for sea points.
+    
+    Parameters
+    ----------
+        mask : numpy.ndarray or string or (string,string)
+            mask array, non-zero for sea points, or path to a numpy file containing it, or path to a netCDF file and name of the mask variable in it.
+            netCDF variable is stored in (y,x) order as in NEMO domain files, leading dimensions are ignored
+        label : string
+            Grid name, for error messages
+    
+    """
+    if isinstance(mask, (tuple,list)) and len(mask) == 2 and isinstance(mask[0], str):
+        from netCDF4 import Dataset
+        path, name = mask
+        if not os.path.isfile(path):
+            logs.abort(f'Grid {label}: land/sea mask file {path} not found')
+        with Dataset(path) as infile:
+            if name not in infile.variables:
+                logs.abort(f'Grid {label}: variable {name} not found in land/sea mask file {path}')
+            values = np.ma.filled( infile.variables[name][:], 0 )
+        return values.reshape(values.shape[-2:]).T != 0
+    elif isinstance(mask, str):
+        if not os.path.isfile(mask):
+            logs.abort(f'Grid {label}: land/sea mask file {mask} not found')
+        return np.load(mask) != 0
+    return np.asarray(mask) != 0
+
+
+def _orange_segments(halos, global_offset, nx, loc_size):
+    """
+    Returns offsets and sizes of the segments containing real and halo cells of a subdomain, cleaned for OASIS.
+    
+    Parameters
+    ----------
+        halos : eophis.HaloGrid
+            subdomain halo grid
+        global_offset : int
+            offset of the subdomain within the global grid
+        nx : int
+            global grid size for x dimension
+        loc_size : (int,int)
+            subdomain real cells size
+    
+    """
+    # segment real cells
+    seg_offsets = global_offset + nx * np.arange(loc_size[1])
+    seg_sizes = np.full( loc_size[1], loc_size[0] )
+    
+    # segment halos cells
+    halos_offsets, halos_sizes = halos.segment()
+    
+    # gather segments for oasis
+    seg_offsets = np.concatenate( (seg_offsets, halos_offsets) ).astype(int)
+    seg_sizes = np.concatenate( (seg_sizes, halos_sizes) ).astype(int)
+    return clean_for_oasis( seg_offsets , seg_sizes )
 
 
 def _select_halo_type(grd, fold, bnd, halo_size, global_grid, local_grid, offset):
@@ -25,6 +25,12 @@ class HaloGrid:
         subdomain local grid size for (x,y) dimension
     offset : int
         global offset of the local subdomain
+    _gather : numpy.ndarray
+        flat index of received grid elements to gather into each rebuilt cell, None if rebuild is a simple reshape
+    _zeros : numpy.ndarray
+        flat index of rebuilt cells to fill with zeros (closed boundaries)
+    _rebuilt_size : (int,int)
+        rebuilt subdomain size for (x,y) dimensions
         
     """
     def __init__(self, size, global_grid, local_grid, offset):
@@ -32,44 +38,113 @@ class HaloGrid:
         self.global_grid = global_grid
         self.local_grid = local_grid
         self.offset = offset
+        self._gather = None
+        self._zeros = None
+        self._rebuilt_size = None
                 
     def segment(self):
         """ Decomposes non boundary-crossing halos cells into offsets/sizes couple. """
-        hls_offsets = []
-        hls_sizes = []
-        
-        # segment halos cells
-        for l in range( (self.size>0)*self.local_grid[1] + 2*self.size ):
-            
-            # above- and below- lines or real cells
-            local_offset = self.offset + self.global_grid[0] * ( l - self.size )
-            if l < self.size or l >= self.local_grid[1] + self.size:
-                hls_offsets.append( local_offset - self.size )
-                hls_sizes.append( self.local_grid[0] + 2*self.size )
-            else:
-                # left
-                hls_offsets.append( local_offset - self.size )
-                hls_sizes.append( self.size )
-                # right
-                hls_offsets.append( local_offset + self.local_grid[0] )
-                hls_sizes.append( self.size )
-        return hls_offsets, hls_sizes
+        # lines of halo cells, with their global offset
+        lines = np.arange( (self.size>0)*self.local_grid[1] + 2*self.size )
+        local_offsets = self.offset + self.global_grid[0] * ( lines - self.size )
+        full_lines = (lines < self.size) | (lines >= self.local_grid[1] + self.size)
+
+        # above- and below- lines or left side, right side of real cells
+        offsets = np.stack( ( local_offsets - self.size , local_offsets + self.local_grid[0] ), axis=1 )
+        sizes = np.stack( ( np.where( full_lines, self.local_grid[0] + 2*self.size, self.size ), np.full(len(lines),self.size) ), axis=1 )
+        keep = np.stack( ( np.ones(len(lines),dtype=bool), ~full_lines ), axis=1 )
+        return offsets[keep].tolist(), sizes[keep].tolist()
         
     def segment_side_halos(self,local_start, local_offset):
-        local_offset = local_offset % self.global_grid[0]
-        side_A = ( self.global_grid[0] - local_offset ) * ( (self.global_grid[0]-local_offset) < self.size )
+        """ Decomposes side halo cells of one line into offsets/sizes couple. """
+        offsets, sizes, keep = self.segment_side_lines( np.array([local_start]), np.array([local_offset]) )
+        return offsets[keep].tolist(), sizes[keep].tolist()
+
+    def segment_side_lines(self, local_starts, local_offsets):
+        """
+        Decomposes side halo cells of several lines into offsets/sizes couples. Side halos crossing x dimension boundary are split in two segments.
+        
+        Parameters
+        ----------
+        local_starts : numpy.ndarray
+            global offsets of the lines
+        local_offsets : numpy.ndarray
+            x position of the side halos in the lines
+        
+        Returns
+        -------
+        offsets, sizes : numpy.ndarray
+            two segments per line
+        keep : numpy.ndarray
+            segments to keep, second segment of a line is only used if side halos are split
+        
+        """
+        local_offsets = local_offsets % self.global_grid[0]
+        side_A = ( self.global_grid[0] - local_offsets ) * ( (self.global_grid[0]-local_offsets) < self.size )
         side_B = self.size - side_A
+        split = side_A > 0
+        
+        line_offsets = local_offsets + self.global_grid[0]*(local_starts // self.global_grid[0])
+        offsets = np.stack( ( line_offsets , line_offsets - self.global_grid[0] + side_A ), axis=1 )
+        sizes = np.stack( ( np.where( split, side_A, side_B ), side_B ), axis=1 )
+        keep = np.stack( ( np.ones(len(split),dtype=bool), split ), axis=1 )
+        return offsets, sizes, keep
+
+    def compile_rebuild(self, oasis_size):
+        """
+        Compiles rebuild instructions into a flat gather index. Instructions are applied once on a field containing
+        the received cells indexes, the rebuilt field then indicates which received cell fills each subdomain cell.
+        
+        Parameters
+        ----------
+        oasis_size : int
+            number of cells received by OASIS
+        
+        """
+        # shifted indexes, zero values then stand for closed halo cells
+        index_grid = np.arange(1, oasis_size + 1).reshape(oasis_size,1)
+        index_grid = self.apply_instructions(index_grid)
+        self._rebuilt_size = index_grid.shape[:2]
+
+        # flatten plan in rebuilt field order
+        index_grid = index_grid.reshape(-1,order='F')
+        self._zeros = np.flatnonzero(index_grid == 0)
+        self._gather = np.maximum(index_grid - 1, 0)
+
+        # no plan needed if rebuild is a simple reshape
+        if len(self._zeros) == 0 and np.array_equal(self._gather, np.arange(oasis_size)):
+            self._gather = None
 
-        if side_A > 0:
-            side_offsets = [ local_offset + self.global_grid[0]*(local_start // self.global_grid[0]) , ( local_offset + self.global_grid[0]*(local_start // self.global_grid[0]) - self.global_grid[0] + side_A ) ]
-            side_sizes = [ side_A , side_B ]
-        else:
-            side_offsets = [ local_offset + self.global_grid[0]*(local_start // self.global_grid[0]) ]
-            side_sizes = [ side_B ]
-        return side_offsets, side_sizes
+    def rebuild(self, field_grid, out=None):
+        """
+        Rebuilds a received field from OASIS into subdomain shape, with compiled plan if available.
+        
+        Parameters
+        ----------
+        field_grid : numpy.ndarray
+            raw field received from OASIS
+        out : numpy.ndarray
+            Fortran-ordered array in which to write the rebuilt field, new array returned if None
+        
+        """
+        if self._gather is None:
+            field_grid = self.apply_instructions(field_grid)
+            if out is None:
+                return field_grid
+            out[...] = field_grid
+            return out
+
+        # gather received cells along first dimension
+        size_z = field_grid.shape[1]
+        if out is None:
+            out = np.empty( (self._rebuilt_size[0],self._rebuilt_size[1],size_z), dtype=field_grid.dtype, order='F' )
+        rebuilt_grid = out.reshape(-1,size_z,order='F').T
+        np.take(field_grid.T, self._gather, axis=1, out=rebuilt_grid, mode='clip')
+        rebuilt_grid[:,self._zeros] = 0.0
+        return out
 
-    def rebuild(self, field_grid, full_dim=(0,0)):
-        """ Rebuilds a received field from OASIS into a subdomain with non boundary-crossing halo cells. """
+    def apply_instructions(self, field_grid, full_dim=(0,0)):
+        """ Rebuilds step by step a received field into a subdomain with non boundary-crossing halo cells. """
         size_x = self.local_grid[0] + 2*self.size*(1-full_dim[0])
         size_y = self.local_grid[1] + 2*self.size*(1-full_dim[1])
         size_z = field_grid.shape[1]
@@ -0,0 +1,106 @@
+"""
+mpihalo.py - This module contains tools to fill halo cells by MPI communications between neighboring subdomains.
+
+* Copyright (c) 2023 IGE-MEOM
+    Eophis is released under an MIT License.
+    See the `LICENSE <https://github.com/meom-group/eophis/blob/main/LICENSE>`_ file for details.
+
+"""
+# external module
+from mpi4py import MPI
+import numpy as np
+
+__all__ = []
+
+class MPIHalo:
+    """
+    This class fills halo cells of a subdomain with real cells of neighboring subdomains, exchanged by non-blocking MPI communications between Eophis processes.
+    Fields are then received from OASIS without halos, on the Box partition of the subdomain. Which global cell fills each halo cell is given by the rebuild plan of the subdomain HaloGrid, whatever the boundary conditions.
+
+    Attributes
+    ----------
+    comm : mpi4py.MPI.Intracomm
+        communicator of the processes sharing the decomposition, duplicated for the Grid
+    rebuilt_size : (int,int)
+        rebuilt subdomain size for (x,y) dimensions
+    _local_src : numpy.ndarray
+        flat index of local real cells copied in rebuilt subdomain
+    _local_dst : numpy.ndarray
+        flat index of rebuilt cells filled with local real cells
+    _zeros : numpy.ndarray
+        flat index of rebuilt cells to fill with zeros (closed boundaries, eliminated land subdomains)
+    _recv : dict
+        flat index of rebuilt cells filled by each neighboring process
+    _send : dict
+        flat index of local real cells sent to each neighboring process
+    TAG : int
+        MPI tag of halo communications
+
+    Notes
+    -----
+    MPIHalo is created from the global index of the cell filling each rebuilt cell (``sources``, negative for zeros), and from the decomposition rectangles sizes ``rankx``, ``ranky`` with the process handling each of them (``ranks``, negative for eliminated rectangles).
+    Creation is a collective operation on comm: processes tell their neighbors which real cells they need.
+
+    """
+    TAG = 6281
+
+    def __init__(self, sources, rebuilt_size, rankx, ranky, ranks, comm):
+        self.comm = comm.Dup()
+        self.rebuilt_size = tuple(rebuilt_size)
+        rank = self.comm.Get_rank()
+
+        # owner of each source cell and position in owner real cells
+        edges_x = np.concatenate( ([0], np.cumsum(rankx)) )
+        edges_y = np.concatenate( ([0], np.cumsum(ranky)) )
+        nx = edges_x[-1]
+        valid = sources >= 0
+        x, y = np.where(valid, sources, 0) % nx, np.where(valid, sources, 0) // nx
+        isub = np.searchsorted(edges_x, x, side='right') - 1
+        jsub = np.searchsorted(edges_y, y, side='right') - 1
+        owner = np.where( valid, np.asarray(ranks)[isub + len(rankx) * jsub], -1 )
+        local = (x - edges_x[isub]) + np.asarray(rankx)[isub] * (y - edges_y[jsub])
+
+        # local copies, zeros and requests to neighbors
+        self._zeros = np.flatnonzero(owner < 0)
+        self._local_dst = np.flatnonzero(owner == rank)
+        self._local_src = local[self._local_dst]
+        self._recv = { int(r) : np.flatnonzero(owner == r) for r in np.unique(owner) if r >= 0 and r != rank }
+        requests = self.comm.alltoall( [ local[self._recv[r]] if r in self._recv else None for r in range(self.comm.Get_size()) ] )
+        self._send = { r : idx for r, idx in enumerate(requests) if idx is not None }
+
+    def fill(self, field_grid, out=None):
+        """
+        Builds subdomain with halo cells from real cells received by OASIS.
+
+        Parameters
+        ----------
+        field_grid : numpy.ndarray
+            real cells received from OASIS on Box partition, of shape (size_x*size_y, size_z)
+        out : numpy.ndarray
+            Fortran-ordered array in which to write the subdomain with halos, new array returned if None
+
+        Notes
+        -----
+        Neighboring processes must fill the same field at the same time.
+
+        """
+        size_z = field_grid.shape[1]
+        if out is None:
+            out = np.empty( (self.rebuilt_size[0],self.rebuilt_size[1],size_z), dtype=field_grid.dtype, order='F' )
+        rebuilt_grid = out.reshape(-1,size_z,order='F')
+
+        # post receptions and sendings
+        recv_bufs = { r : np.empty( (len(idx),size_z), dtype=field_grid.dtype ) for r, idx in self._recv.items() }
+        send_bufs = { r : np.ascontiguousarray(field_grid[idx]) for r, idx in self._send.items() }
+        requests = [ self.comm.Irecv(buf, source=r, tag=self.TAG) for r, buf in recv_bufs.items() ]
+        requests += [ self.comm.Isend(buf, dest=r, tag=self.TAG) for r, buf in send_bufs.items() ]
+
+        # local cells meanwhile
+        rebuilt_grid[self._local_dst] = field_grid[self._local_src]
+        rebuilt_grid[self._zeros] = 0.0
+
+        # halo cells from neighbors
+        MPI.Request.Waitall(requests)
+        for r, buf in recv_bufs.items():
+            rebuilt_grid[self._recv[r]] = buf
+        return out
@@ -9,7 +9,7 @@ nfhalo.py - This module contains tools to define halo cells that do cross global
 # eophis modules
 from ..utils import logs
 from .halo import HaloGrid
-from .offsiz import grid_to_offsets_sizes, list_to_slices, set_fold_trf
+from .offsiz import merge_intervals, subtract_intervals, locate_intervals, set_fold_trf
 # external module
 import numpy as np
 
@@ -71,47 +71,41 @@ class NFHalo(HaloGrid):
         
     def segment(self):
         """ Decomposes NorthFold boundary-crossing halo cells into offsets/sizes couple. """
-        hls_offsets = [[],[]]
-        hls_sizes = [[],[]]
-        
         start_line = 0 + self.size * ( self.full_dim[0] and self.full_dim[1] )
         end_line = self.local_grid[1] + self.size + self.size*(1-self.full_dim[1])
 
-        # segment halos cells
-        for l in range( start_line , end_line ):
-            start = self.offset + self.global_grid[0] * ( l - self.size )
-                                    
-            # above- and below- intern lines
-            if l < self.shifts[1]:
-                # folded halos
-                start += self.global_grid[0] * (self.shifts[1]-l) - self.fold_param[1] + self.local_grid[0]
-                start = start % self.global_grid[0] - self.global_grid[0] * ( self.fold_param[0] + (self.shifts[1]-l) )
-                start += self.global_grid[0] * (abs(start)%self.global_grid[0] == 0)
-                start = abs(start)
-                
-                off, siz = self.segment_intern_fold(start)
-                hls_offsets[1] += off
-                hls_sizes[1] += siz
-            else:
-                # regular halos (and real cells for rebuild instructions)
-                start = start % (self.global_grid[0]*self.global_grid[1])
-                hls_offsets[0].append( start )
-                hls_sizes[0].append( self.local_grid[0] )
+        # lines of halo cells, with their global offset
+        lines = np.arange( start_line , end_line )
+        starts = self.offset + self.global_grid[0] * ( lines - self.size )
+        folded = lines < self.shifts[1]
+        
+        # folded halos
+        fold_starts = starts + self.global_grid[0] * (self.shifts[1]-lines) - self.fold_param[1] + self.local_grid[0]
+        fold_starts = fold_starts % self.global_grid[0] - self.global_grid[0] * ( self.fold_param[0] + (self.shifts[1]-lines) )
+        fold_starts += self.global_grid[0] * (abs(fold_starts)%self.global_grid[0] == 0)
+        fold_starts = abs(fold_starts)
+        
+        # regular halos (and real cells for rebuild instructions)
+        starts = np.where( folded, fold_starts, starts % (self.global_grid[0]*self.global_grid[1]) )
+        offsets, sizes, keep = self.segment_fold_lines(starts)
+        offsets = [ np.where( folded[:,None], offsets, np.stack( (starts, starts), axis=1 ) ) ]
+        sizes = [ np.where( folded[:,None], sizes, self.local_grid[0] ) ]
+        keep = [ np.where( folded[:,None], keep, [True,False] ) ]
             
-            # extremities
-            if not self.full_dim[0]:
-                hls = 1 if l < self.shifts[1] else 0
-                # left
-                local_offset = ( start % self.global_grid[0] - self.size )
-                off, siz = super().segment_side_halos(start,local_offset)
-                hls_offsets[hls] += off
-                hls_sizes[hls] += siz
-
-                # right
-                local_offset = ( start % self.global_grid[0] + self.local_grid[0] )
-                off, siz = super().segment_side_halos(start,local_offset)
-                hls_offsets[hls] += off
-                hls_sizes[hls] += siz
+        # extremities
+        if not self.full_dim[0]:
+            for local_offsets in ( starts % self.global_grid[0] - self.size , starts % self.global_grid[0] + self.local_grid[0] ):
+                off, siz, kp = super().segment_side_lines(starts,local_offsets)
+                offsets.append(off)
+                sizes.append(siz)
+                keep.append(kp)
+        
+        # gather segments line by line, for regular and folded lines
+        offsets = np.hstack(offsets)
+        sizes = np.hstack(sizes)
+        keep = np.hstack(keep)
+        hls_offsets = [ offsets[~folded][keep[~folded]].tolist() , offsets[folded][keep[folded]].tolist() ]
+        hls_sizes = [ sizes[~folded][keep[~folded]].tolist() , sizes[folded][keep[folded]].tolist() ]
                 
         # set rebuild instructions from segmentation
         if self.full_dim[0] and self.full_dim[1]:
@@ -120,57 +114,61 @@ class NFHalo(HaloGrid):
             return self.rebuild_instructions( hls_offsets, hls_sizes )
     
     def segment_intern_fold(self, local_start):
+        """ Decomposes folded cells of one line into offsets/sizes couple. """
+        offsets, sizes, keep = self.segment_fold_lines( np.array([local_start]) )
+        return offsets[keep].tolist(), sizes[keep].tolist()
+
+    def segment_fold_lines(self, local_starts):
+        """
+        Decomposes folded cells of several lines into offsets/sizes couples. Folded lines crossing x dimension boundary are split in two segments.
+        
+        Parameters
+        ----------
+        local_starts : numpy.ndarray
+            global offsets of the folded lines
+        
+        Returns
+        -------
+        offsets, sizes : numpy.ndarray
+            two segments per line
+        keep : numpy.ndarray
+            segments to keep, second segment of a line is only used if folded line is split
+        
+        """
         avail_size = self.local_grid[0]
-        inner_size = self.global_grid[0] - local_start % self.global_grid[0]
+        inner_size = self.global_grid[0] - local_starts % self.global_grid[0]
         side_A = inner_size * ( inner_size < avail_size )
         side_B = avail_size - side_A
+        split = side_A > 0
         
-        if side_A > 0:
-            fold_offsets = [ local_start , local_start - self.global_grid[0] + side_A ]
-            fold_sizes = [ side_A , side_B ]
-        else:
-            fold_offsets = [ local_start ]
-            fold_sizes = [ side_B ]
-        return fold_offsets, fold_sizes
+        offsets = np.stack( ( local_starts , local_starts - self.global_grid[0] + side_A ), axis=1 )
+        sizes = np.stack( ( np.where( split, side_A, side_B ), side_B ), axis=1 )
+        keep = np.stack( ( np.ones(len(split),dtype=bool), split ), axis=1 )
+        return offsets, sizes, keep
     
     def rebuild_instructions(self, offsets, sizes):
         """ Identifies operations required to build the folded halo cells from a received field. """
         # folded / regular partitions
-        folded_grid = np.concatenate([np.arange(off, off + size) + 1 for off, size in zip(offsets[1], sizes[1])])
-        right_grid = np.concatenate([np.arange(off, off + size) + 1 for off, size in zip(offsets[0], sizes[0])])
+        folded_bounds = merge_intervals(offsets[1], np.add(offsets[1],sizes[1]))
+        right_bounds = merge_intervals(offsets[0], np.add(offsets[0],sizes[0]))
 
         # check if folded halos cross first dimension boundary
-        self._fold_bnd = ( np.min(folded_grid) % self.global_grid[0] == 1 ) and ( np.max(folded_grid) % self.global_grid[0] == 0 )
+        self._fold_bnd = ( folded_bounds[0,0] % self.global_grid[0] == 0 ) and ( folded_bounds[-1,1] % self.global_grid[0] == 0 )
 
-        # build artificial oasis partition
-        offsets = np.concatenate(offsets)
-        sizes = np.concatenate(sizes)
-        oasis_grid = np.concatenate([np.arange(off, off + size) + 1 for off, size in zip(offsets, sizes)])
-
-        # remove duplicates
-        oasis_grid = np.unique(oasis_grid)
-
-        # convert back to offsets / sizes
-        oasis_grid = np.sort(oasis_grid)
-        offsets, sizes = grid_to_offsets_sizes(oasis_grid)
+        # build oasis partition
+        offsets = np.concatenate(offsets).astype(int)
+        sizes = np.concatenate(sizes).astype(int)
+        oasis_bounds = merge_intervals(offsets, offsets + sizes)
 
         # elements in oasis grid to extract to build folded grid
-        non_common_idx = np.where( ~np.isin(folded_grid, right_grid) )[0]
-        non_common_elt = folded_grid[non_common_idx]
-        mv_idx = np.where( np.isin(oasis_grid, non_common_elt) )[0]
+        self._moves = locate_intervals( subtract_intervals(folded_bounds, right_bounds), oasis_bounds )
 
         # elements in oasis grid to copy to build folded grid
-        cp_idx = np.where( np.isin(oasis_grid, folded_grid) & np.isin(oasis_grid, right_grid) )[0]
-        cp_idx = np.hstack((cp_idx,mv_idx))
-        cp_idx = np.sort(cp_idx)
-
-        # reduce index list to slices
-        self._copies = list_to_slices(cp_idx)
-        self._moves = list_to_slices(mv_idx)
-        return offsets, sizes
+        self._copies = locate_intervals( folded_bounds, oasis_bounds )
+        return oasis_bounds[:,0].tolist(), (oasis_bounds[:,1] - oasis_bounds[:,0]).tolist()
     
-    def rebuild(self, field_grid):
-        """ Rebuilds a received field from OASIS into subdomain with NorthFold boundary-crossing halo cells. """
+    def apply_instructions(self, field_grid):
+        """ Rebuilds step by step a received field into subdomain with NorthFold boundary-crossing halo cells. """
         # make halos grid
         if len(self._copies) != 0:
             S_cp = self._copies[:,0]
@@ -61,14 +61,70 @@ def grid_to_offsets_sizes(grid):
     return offsets.tolist(), sizes.tolist()
 
 
-def clean_for_oasis(offsets, sizes):
-    """ Rearranges contents of an offsets/sizes couple to remove duplicates and sort indexes in increasing order. """
-    # build artificial oasis partition
-    grid = np.concatenate([np.arange(off, off + size) + 1 for off, size in zip(offsets, sizes)])
+def merge_intervals(starts, ends):
+    """
+    Merges overlapping or contiguous intervals of cells [start,end).
+    
+    Parameters
+    ----------
+        starts : list(int)
+            first cell of each interval
+        ends : list(int)
+            cell following the last cell of each interval
+    Returns
+    -------
+        bounds : numpy.ndarray
+            start-end couples of disjoint intervals, in increasing order
+    
+    """
+    starts = np.asarray(starts, dtype=int)
+    ends = np.asarray(ends, dtype=int)
+    
+    # sort non empty intervals
+    non_empty = ends > starts
+    starts = starts[non_empty]
+    ends = ends[non_empty]
+    if len(starts) == 0:
+        return np.empty((0,2), dtype=int)
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    ends = np.maximum.accumulate(ends[order])
 
-    # remove duplicates
-    grid = np.unique(grid)
+    # new interval where start is beyond all previous ends
+    disc_idx = np.flatnonzero( starts[1:] > ends[:-1] ) + 1
+    return np.stack( ( starts[np.r_[0,disc_idx]] , ends[np.r_[disc_idx-1,len(ends)-1]] ), axis=1 )
+
+
+def subtract_intervals(bounds, others):
+    """ Returns cells of intervals ``bounds`` that are not contained in intervals ``others``, both given as start-end couples from merge_intervals(). """
+    # elementary intervals between all bounds
+    points = np.unique( np.concatenate( (bounds.ravel(), others.ravel()) ) )
+    starts = points[:-1]
+    ends = points[1:]
+    
+    # an elementary interval is in a set of disjoint intervals if an odd number of bounds precedes it
+    in_bounds = np.searchsorted(bounds.ravel(), starts, side='right') % 2 == 1
+    in_others = np.searchsorted(others.ravel(), starts, side='right') % 2 == 1
+    keep = in_bounds & ~in_others
+    return merge_intervals(starts[keep], ends[keep])
+
+
+def locate_intervals(bounds, grid_bounds):
+    """ Returns positions of cells of intervals ``bounds`` within the cells list described by intervals ``grid_bounds``, both given as start-end couples from merge_intervals(). """
+    # return empty array if no intervals
+    if len(bounds) == 0:
+        return np.array([])
     
-    # sort and convert back to offsets / sizes
-    grid = np.sort(grid)
-    return grid_to_offsets_sizes(grid)
+    # position of first cell of each grid interval
+    grid_pos = np.concatenate( ([0], np.cumsum(grid_bounds[:,1] - grid_bounds[:,0])) )
+
+    # grid interval containing each interval
+    idx = np.searchsorted(grid_bounds[:,0], bounds[:,0], side='right') - 1
+    pos = grid_pos[idx] + bounds[:,0] - grid_bounds[idx,0]
+    return merge_intervals(pos, pos + bounds[:,1] - bounds[:,0])
+
+
+def clean_for_oasis(offsets, sizes):
+    """ Rearranges contents of an offsets/sizes couple to remove duplicates and sort indexes in increasing order. """
+    bounds = merge_intervals(offsets, np.add(offsets,sizes))
+    return bounds[:,0].tolist(), (bounds[:,1] - bounds[:,0]).tolist()
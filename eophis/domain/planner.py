@@ -0,0 +1,137 @@
+"""
+planner.py - This module contains tools to plan Grid decompositions offline, for all subdomains at once and without coupling environment.
+
+* Copyright (c) 2023 IGE-MEOM
+    Eophis is released under an MIT License.
+    See the `LICENSE <https://github.com/meom-group/eophis/blob/main/LICENSE>`_ file for details.
+
+"""
+# eophis modules
+from .grid import Grid, _select_halo_type, _orange_segments
+# external module
+import numpy as np
+import argparse
+import json
+
+__all__ = ['plan_tunnel']
+
+def plan_tunnel(config, nsub):
+    """
+    Computes partitions of all subdomains of Tunnel grids, as they would be defined by ``nsub`` processes when opening the Tunnel.
+
+    Parameters
+    ----------
+    config : dict
+        Tunnel configuration, as given to ``register_tunnels()``. Only ``grids``, ``exchs`` and ``mpi_halos`` keys are used.
+    nsub : int
+        number of processes, i.e. of subdomains
+
+    Returns
+    -------
+    plans : dict
+        for each grid label, dict of arrays of size ``nsub`` indexed by subdomain:
+            - box_offset, size_x, size_y : sending Box partition (real cells)
+            - halo_type : HaloGrid, CyclicHalo or NFHalo, Empty if no subdomain is left after land elimination
+            - nseg : number of segments of receiving Orange partition
+            - orange_size : number of cells received by OASIS
+            - memory : size of Tunnel exchange buffers in bytes
+
+    Notes
+    -----
+    Subdomains whose halos do not cross the global grid boundaries are treated at once. Orange partitions of the others are computed subdomain by subdomain.
+    If a grid has a land/sea mask, subdomains are those kept by ``Grid.decompose_masked()`` and the last processes may be left with empty partitions.
+
+    """
+    plans = {}
+    for grd_lbl, grd_info in config['grids'].items():
+        nx, ny = grd_info['npts']
+        hls = 0 if 'halos' not in grd_info.keys() else grd_info['halos']
+        bnd = ('close', 'close') if 'bnd' not in grd_info.keys() else grd_info['bnd']
+        grd_type, fold = ('T', 'T') if 'folding' not in grd_info.keys() else grd_info['folding']
+        mask = None if 'mask' not in grd_info.keys() else grd_info['mask']
+        grd = Grid( grd_lbl, nx, ny, hls, bnd, grd_type, fold, mask )
+
+        # Box partitions of all subdomains, land rectangles are eliminated if mask is provided
+        if grd.mask is None:
+            rankx, ranky = grd.decompose(nsub)
+            rects = np.arange(nsub)
+        else:
+            rankx, ranky, active = grd.decompose_masked(nsub)
+            rects = np.concatenate( (active, np.full(nsub-len(active),-1)) )
+        empty = rects < 0
+        isub, jsub = rects % len(rankx), rects // len(rankx)
+        size_x = np.where( empty, 0, np.array(rankx)[isub] )
+        size_y = np.where( empty, 0, np.array(ranky)[jsub % len(ranky)] )
+        off_x = np.where( empty, 0, np.concatenate( ([0], np.cumsum(rankx)) )[isub] )
+        off_y = np.where( empty, 0, np.concatenate( ([0], np.cumsum(ranky)) )[jsub % len(ranky)] )
+        box_offset = off_y * nx + off_x
+
+        # halo types, as selected by Grid
+        cross_x = ~empty & ( (hls - off_x > 0) | (hls - nx + size_x + off_x > 0) )
+        cross_y0 = ~empty & (hls - off_y > 0)
+        cross_y1 = ~empty & (hls - ny + size_y + off_y > 0)
+        if 'fold' in grd.bnd[1]:
+            nfold = cross_y0
+            cyclic = ~nfold & (cross_x | cross_y1)
+        else:
+            nfold = np.zeros(nsub, dtype=bool)
+            cyclic = cross_x | cross_y0 | cross_y1
+        halo_type = np.where( nfold, 'NFHalo', np.where( cyclic, 'CyclicHalo', np.where( empty, 'Empty', 'HaloGrid' ) ) )
+
+        # Orange partitions: lines of real and halo cells of inner subdomains are only merged if they cover x dimension
+        width = np.where( empty, 0, size_x + 2*hls )
+        lines = np.where( empty, 0, size_y + 2*hls )
+        nseg = np.where( width == nx, 1, lines )
+        orange_size = width * lines
+        for rk in np.flatnonzero( nfold | cyclic ):
+            halos = _select_halo_type( grd.grd, grd.fold, grd.bnd, hls, grd.size, (size_x[rk],size_y[rk]), box_offset[rk] )
+            seg_offsets, seg_sizes = _orange_segments( halos, box_offset[rk], nx, (size_x[rk],size_y[rk]) )
+            nseg[rk] = len(seg_sizes)
+            orange_size[rk] = sum(seg_sizes)
+
+        # exchange buffers: raw and rebuilt receptions, sendings. Raw receptions only contain real cells if halos are filled by MPI
+        raw_size = size_x * size_y if config.get('mpi_halos', False) else orange_size
+        memory = np.zeros(nsub, dtype=np.int64)
+        for ex in [ ex for ex in config['exchs'] if ex['grd'] == grd_lbl ]:
+            itemsize = np.dtype( np.float64 if 'dtype' not in ex.keys() else ex['dtype'] ).itemsize
+            memory += itemsize * ex['lvl'] * len(ex['in']) * ( raw_size + width * lines )
+            memory += itemsize * ex['lvl'] * len(ex['out']) * size_x * size_y
+
+        plans[grd_lbl] = { 'box_offset' : box_offset, 'size_x' : size_x, 'size_y' : size_y, 'halo_type' : halo_type, \
+                           'nseg' : nseg, 'orange_size' : orange_size, 'memory' : memory }
+    return plans
+
+
+def summary(plans):
+    """
+    Summarizes Tunnel partition plans.
+
+    Parameters
+    ----------
+    plans : dict
+        partition plans returned by ``plan_tunnel()``
+
+    Returns
+    -------
+    lines : list( string )
+        min, mean and max over subdomains of segment numbers, Orange partition sizes and buffers memory, for each grid
+
+    """
+    lines = []
+    for grd_lbl, plan in plans.items():
+        types, counts = np.unique( plan['halo_type'], return_counts=True )
+        lines.append( f'Grid {grd_lbl}: {len(plan["nseg"])} subdomains -- ' + ', '.join( f'{n} {tp}' for tp,n in zip(types,counts) ) )
+        for key in ('nseg','orange_size','memory'):
+            lines.append( f'   {key:<12} min {plan[key].min():>12}   mean {plan[key].mean():>14.1f}   max {plan[key].max():>12}' )
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plans partitions of Tunnel grids for a given number of processes.')
+    parser.add_argument('config', help='JSON file containing a Tunnel configuration')
+    parser.add_argument('nsub', type=int, help='number of processes')
+    args = parser.parse_args()
+
+    with open(args.config) as infile:
+        config = json.load(infile)
+    [ print(line) for line in summary( plan_tunnel(config, args.nsub) ) ]
@@ -7,10 +7,18 @@ This module contains time loop structures to synchronize connexions between coup
     
 """
 # eophis modules
-from .utils import logs
+from .utils import logs, timers
+from .utils.worker import threads_supported
 from .coupling import Tunnel, tunnels_ready
+from .router import RouterGraph
 # external modules
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+from time import perf_counter
+import heapq
+
+# number of iterations with exchanges between two forwardings of log messages to Master, messages are dropped if log buffers get full in between
+LOG_PERIOD = 100
 
 def starter(loop_router):
     """
@@ -25,7 +33,7 @@ def starter(loop_router):
     loop_router()
 
 
-def all_in_all_out(geo_model,step,niter):
+def all_in_all_out(geo_model,step,niter,prefetch=False):
     """
     Builds a Loop on All In All Out (AIAO) structure. ``assembler()`` function inserts ``router()``
     inside ``base_loop()`` in which receivings and sendings steps are pre-defined.
@@ -38,6 +46,8 @@ def all_in_all_out(geo_model,step,niter):
         loop time step, in seconds
     niter : int
         number of loop iteration
+    prefetch : bool
+        if True, receptions of next iteration and sendings of current iteration are performed in background while ``router()`` is running
         
     Returns
     -------
@@ -57,6 +67,18 @@ def all_in_all_out(geo_model,step,niter):
         1. receive all data from earth
         2. transfert data to models (provided from ``router()``)
         3. send back all results
+        
+    Iterations at which no variable is exchanged are skipped: ``router()`` is not called.
+    ``router()`` may also be an ``eophis.RouterGraph``: only its models whose inputs arrived at the current iteration are then called.
+        
+    If sendings of ``geo_model`` are lagged (``'lag'`` exchange option), values sent at iteration N are received by earth at the next coupling date. Earth then computes
+    its next time steps while ``router()`` treats iteration N, instead of waiting for its results: Python and geoscientific computations overlap.
+
+    With ``prefetch``, receptions and sendings are performed by two threads. Receptions of iteration N+1 are posted while ``router()`` treats iteration N,
+    hiding coupling latency if earth runs ahead. This requires MPI to be initialized with MPI_THREAD_MULTIPLE, and a Tunnel not reusing its reception buffers.
+    The loop falls back to sequential receptions and sendings otherwise.
+
+    Log messages of all processes are forwarded to Master every ``LOG_PERIOD`` iterations with exchanges, and at the end of the loop.
     
     Example
     -------
@@ -76,6 +98,7 @@ def all_in_all_out(geo_model,step,niter):
             logs.info(f'Number of iterations : {niter}')
             logs.info(f'Time step : {step}s -- {step_date}')
             logs.info(f'Total Time : {niter*step}s -- {final_date} \n')
+            _log_lags(geo_model)
 
             # check router
             if not callable(router):
@@ -85,29 +108,229 @@ def all_in_all_out(geo_model,step,niter):
             if not tunnels_ready():
                 logs.abort('Static variables must be exchanged before starting any loop')
 
-            for it in range(niter):
-                it_sec = int(step * it)
-                date = datetime.timedelta(seconds=it_sec)
-                date_info = f'Iteration {it+1}: {it_sec}s -- {date} \n'
-                
-                # perform all receptions
-                # ----------------------
-                arrays = { varin : geo_model.receive(varin,it_sec) for varin in geo_model.arriving_list() }
-                if not all( type(arr) == type(None) for arr in arrays.values() ):
-                    requests = ", ".join( [ varin for varin,arr in arrays.items() if type(arr) is not type(None) ] )
-                    logs.info(f'{date_info}   Treating {requests} received through tunnel {geo_model.label}')
-                    
-                # Modeling
-                # --------
-                inferences = router(**arrays)
-
-                # perform all sendings
-                # --------------------
-                [ geo_model.send(varout,inf,it_sec) for varout,inf in inferences.items() ]
-                if not all( type(arr) == type(None) for arr in arrays.values()  ):
-                    results = ", ".join( [ varout for varout,inf in inferences.items() if type(inf) is not type(None) ] )
-                    logs.info(f'   Sending back {results} through tunnel {geo_model.label}')
+            # check prefetch conditions
+            pipelined = prefetch
+            if prefetch and not threads_supported():
+                logs.warning('MPI does not provide full thread support, prefetch disabled')
+                pipelined = False
+            if prefetch and geo_model.reuse:
+                logs.warning(f'Tunnel {geo_model.label} reuses its reception buffers, prefetch disabled')
+                pipelined = False
+
+            if pipelined:
+                _pipelined_loop(geo_model, router, step, niter)
+            else:
+                _sequential_loop(geo_model, router, step, niter)
+            _close_routers([router])
 
             logs.info(f'------------------- END OF LOOP -------------------')
+            logs.gather_logs()
         return base_loop
     return assembler
+
+
+def all_in_all_out_multi(geo_models,steps,niters):
+    """
+    Builds a Loop on All In All Out (AIAO) structure for several Tunnels. Each Tunnel has its own time step and is associated with its own ``router()``.
+    
+    Parameters
+    ----------
+    geo_models : list( eophis.Tunnel )
+        coupling Tunnels to perform exchanges with earth
+    steps : list( int )
+        loop time step of each Tunnel, in seconds
+    niters : list( int )
+        number of loop iteration of each Tunnel
+        
+    Returns
+    -------
+    base_loop : function
+        AIAO loop completed with ``router()``
+        
+    Raises
+    ------
+    eophis.abort()
+        if no router defined for a Tunnel
+    eophis.abort()
+        if loop starts with tunnels not ready
+        
+    Notes
+    -----
+    ``router()`` may be a single function used for all Tunnels, or a dictionary of functions whose keys are the Tunnel labels.
+    As for ``all_in_all_out()``, iterations at which no variable of a Tunnel is exchanged are skipped.
+    
+    Each Tunnel is serviced by its own thread, so that a Tunnel waiting for earth does not block the others. Routers must then be thread-safe.
+    This requires MPI to be initialized with MPI_THREAD_MULTIPLE. Otherwise, iterations of all Tunnels are performed one after the other in increasing date order.
+    Log messages of all processes are then forwarded to Master every ``LOG_PERIOD`` iterations. They are only forwarded at the end of the loop with one thread per Tunnel.
+    
+    Example
+    -------
+    >>> loop = all_in_all_out_multi([ocean,ice],[oceanStep,iceStep],[oceanIter,iceIter])
+    >>> loop = loop( { 'OCEAN' : ocean_router, 'ICE' : ice_router } )
+    >>> starter(loop)
+    
+    """
+    def assembler(router=None):
+        def base_loop(*args, **kwargs):
+            logs.info(f'\n-------------------- RUN LOOP ----------------------')
+            for tnl, stp, nit in zip(geo_models,steps,niters):
+                logs.info(f'Tunnel {tnl.label}')
+                logs.info(f'   Number of iterations : {nit}')
+                logs.info(f'   Time step : {stp}s -- {datetime.timedelta(seconds=stp)}')
+                logs.info(f'   Total Time : {nit*stp}s -- {datetime.timedelta(seconds=nit*stp)}')
+                _log_lags(tnl)
+            logs.info('')
+
+            # check routers
+            routers = router if isinstance(router,dict) else { tnl.label : router for tnl in geo_models }
+            for tnl in geo_models:
+                if not callable(routers.get(tnl.label)):
+                    logs.abort(f'No Router defined for tunnel {tnl.label}')
+
+            # check static variables status
+            if not tunnels_ready():
+                logs.abort('Static variables must be exchanged before starting any loop')
+
+            if len(geo_models) > 1 and threads_supported():
+                with ThreadPoolExecutor(max_workers=len(geo_models)) as pool:
+                    loops = [ pool.submit(_sequential_loop, tnl, routers[tnl.label], stp, nit, False) for tnl,stp,nit in zip(geo_models,steps,niters) ]
+                    [ lp.result() for lp in loops ]
+            else:
+                _timeline_loop(geo_models, routers, steps, niters)
+            _close_routers(routers.values())
+
+            logs.info(f'------------------- END OF LOOP -------------------')
+            logs.gather_logs()
+        return base_loop
+    return assembler
+
+
+def _close_routers(routers):
+    """ Releases threads of RouterGraph routers, once each. """
+    for router in { id(rt) : rt for rt in routers }.values():
+        if isinstance(router, RouterGraph):
+            router.close()
+
+
+def _log_lags(geo_model):
+    """ Writes lagged sendings of a Tunnel in logs. """
+    for varout, lag in geo_model.lags().items():
+        logs.info(f'   {varout} sent at iteration date t is received by earth at t+{lag}s, router overlaps with earth time steps')
+
+
+def _receive_all(geo_model, date):
+    """ Performs all receptions of a Tunnel for a given date. """
+    return { varin : geo_model.receive(varin,date) for varin in geo_model.arriving_list() }
+
+
+def _send_all(geo_model, inferences, date):
+    """ Performs all sendings of a Tunnel for a given date. """
+    [ geo_model.send(varout,inf,date) for varout,inf in inferences.items() ]
+
+
+def _route(geo_model, router, arrays):
+    """
+    Calls router with received arrays of a Tunnel and records its duration. Router is skipped if local subdomains only contain land.
+    A RouterGraph only calls the models whose inputs arrived and which contribute to the Tunnel sent variables, their durations are recorded too.
+    """
+    if geo_model.is_idle():
+        return geo_model.idle_sendings()
+    t0 = perf_counter()
+    if isinstance(router, RouterGraph):
+        inferences = router.evaluate(arrays, geo_model.departure_list(), lambda node, elapsed: timers.record(geo_model.label, node, 'node', elapsed))
+    else:
+        inferences = router(**arrays)
+    timers.record(geo_model.label, None, 'router', perf_counter() - t0)
+    return inferences
+
+
+def _log_receptions(geo_model, arrays, it, it_sec):
+    """ Writes received variables of an iteration in logs. """
+    if not all( type(arr) == type(None) for arr in arrays.values() ):
+        date = datetime.timedelta(seconds=it_sec)
+        requests = ", ".join( [ varin for varin,arr in arrays.items() if type(arr) is not type(None) ] )
+        logs.info(f'Iteration {it+1}: {it_sec}s -- {date} \n   Treating {requests} received through tunnel {geo_model.label}')
+
+
+def _log_sendings(geo_model, arrays, inferences):
+    """ Writes sent variables of an iteration in logs. """
+    if not all( type(arr) == type(None) for arr in arrays.values()  ):
+        results = ", ".join( [ varout for varout,inf in inferences.items() if type(inf) is not type(None) ] )
+        logs.info(f'   Sending back {results} through tunnel {geo_model.label}')
+
+
+def _iterate(geo_model, router, it, it_sec):
+    """ Runs one AIAO iteration: receptions, router and sendings are successively performed. """
+    # perform all receptions
+    # ----------------------
+    arrays = _receive_all(geo_model, it_sec)
+    _log_receptions(geo_model, arrays, it, it_sec)
+        
+    # Modeling
+    # --------
+    inferences = _route(geo_model, router, arrays)
+
+    # perform all sendings
+    # --------------------
+    _send_all(geo_model, inferences, it_sec)
+    _log_sendings(geo_model, arrays, inferences)
+
+
+def _gather_logs(k):
+    """ Forwards log messages of all processes to Master every LOG_PERIOD iterations with exchanges. Collective: every process must perform the same iterations. """
+    if (k + 1) % LOG_PERIOD == 0:
+        logs.gather_logs()
+
+
+def _sequential_loop(geo_model, router, step, niter, gather=True):
+    """ Runs an AIAO loop: receptions, router and sendings are successively performed at each iteration with exchanges. Log messages are periodically forwarded to Master if gather. """
+    for k, it in enumerate(geo_model.active_steps(step, niter)):
+        _iterate(geo_model, router, it, int(step * it))
+        _gather_logs(k) if gather else None
+
+
+def _timeline_loop(geo_models, routers, steps, niters):
+    """ Runs AIAO loops of several Tunnels in one thread. Iterations with exchanges of all Tunnels are performed in increasing date order. """
+    def timeline(i):
+        return ( (int(steps[i] * it), i, it) for it in geo_models[i].active_steps(steps[i],niters[i]) )
+
+    for k, (it_sec, i, it) in enumerate( heapq.merge(*[ timeline(i) for i in range(len(geo_models)) ]) ):
+        _iterate(geo_models[i], routers[geo_models[i].label], it, it_sec)
+        _gather_logs(k)
+
+
+def _pipelined_loop(geo_model, router, step, niter):
+    """ Runs an AIAO loop: receptions of next iteration and sendings of current iteration are performed in background threads while router is running. """
+    its = geo_model.active_steps(step, niter)
+    if len(its) == 0:
+        return
+        
+    with ThreadPoolExecutor(max_workers=1) as receiver, ThreadPoolExecutor(max_workers=1) as sender:
+        arrivals = receiver.submit(_receive_all, geo_model, int(step * its[0]))
+        departures = []
+    
+        for k, it in enumerate(its):
+            it_sec = int(step * it)
+            
+            # wait for current receptions, post next ones
+            # -------------------------------------------
+            arrays = arrivals.result()
+            if k + 1 < len(its):
+                arrivals = receiver.submit(_receive_all, geo_model, int(step * its[k+1]))
+            _log_receptions(geo_model, arrays, it, it_sec)
+
+            # Modeling
+            # --------
+            inferences = _route(geo_model, router, arrays)
+
+            # post sendings, check achieved ones
+            # ----------------------------------
+            for dep in [ dep for dep in departures if dep.done() ]:
+                dep.result()
+                departures.remove(dep)
+            departures.append( sender.submit(_send_all, geo_model, inferences, it_sec) )
+            _log_sendings(geo_model, arrays, inferences)
+            _gather_logs(k)
+
+        # flush remaining sendings
+        [ dep.result() for dep in departures ]
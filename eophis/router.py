@@ -0,0 +1,213 @@
+"""
+This module contains tools to build Routers as graphs of models, evaluated incrementally by Loops.
+
+* Copyright (c) 2023 IGE-MEOM
+    Eophis is released under an MIT License.
+    See the `LICENSE <https://github.com/meom-group/eophis/blob/main/LICENSE>`_ file for details.
+
+"""
+# eophis modules
+from .utils import logs
+# external modules
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import threading
+
+__all__ = ['RouterGraph']
+
+class _Node:
+    """
+    This class is a model of a RouterGraph.
+
+    Attributes
+    ----------
+    name : string
+        node name
+    func : function
+        model, called with the values of inputs as positional arguments
+    inputs : list( string )
+        names of the variables taken by the model
+    outputs : list( string )
+        names of the variables returned by the model
+    level : int
+        evaluation wave of the node: nodes of a wave only depend on nodes of previous waves
+
+    """
+    def __init__(self, name, func, inputs, outputs):
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.outputs = outputs
+        self.level = 0
+
+    def run(self, values):
+        """ Calls model with input values, returns output values and call duration. """
+        t0 = perf_counter()
+        res = self.func( *[ values[var] for var in self.inputs ] )
+        elapsed = perf_counter() - t0
+        if len(self.outputs) == 1:
+            return [res], elapsed
+        res = [None] * len(self.outputs) if res is None else list(res)
+        if len(res) != len(self.outputs):
+            logs.abort(f'Router node {self.name} returned {len(res)} values instead of {len(self.outputs)}')
+        return res, elapsed
+
+
+class RouterGraph:
+    """
+    This class is a declarative Router: a graph of models connected by named variables. Variables are the Tunnel received and sent fields, or intermediate results of models.
+    At each Loop iteration, only models whose inputs are all available are called. Models that do not depend on each other are called concurrently by a thread pool.
+
+    Attributes
+    ----------
+    max_workers : int
+        number of threads calling independent models, models are called one after the other if 1
+    _nodes : list( _Node )
+        models of the graph, in order of declaration
+    _producers : dict
+        node computing each variable
+    _waves : list
+        nodes of each evaluation wave, updated when a model is added
+    _pool : concurrent.futures.ThreadPoolExecutor
+        thread pool, created at first concurrent evaluation and shut down by ``close()``
+    _lock : threading.Lock
+        protects thread pool creation and shutdown, graph may be evaluated by several Loop threads
+
+    Notes
+    -----
+    A model is called with its inputs as positional arguments. It returns one value if it has one output, a sequence of values otherwise, or ``None`` if it has nothing to compute.
+    Models of a same wave are called concurrently: they must be thread-safe. Numpy and most machine learning libraries release the GIL during their computations.
+    Loops close the graph when they end, a closed graph may still be evaluated.
+
+    Example
+    -------
+    >>> router = RouterGraph()
+    >>> router.add(add_100, inputs=['sst'], outputs=['sst_var'])
+    >>> router.add(add_100, inputs=['svt'], outputs=['svt_var'])
+    >>> loop = all_in_all_out(geo_model=earth, step=step, niter=niter)(router)
+    >>> starter(loop)
+
+    """
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._nodes = []
+        self._producers = {}
+        self._waves = []
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def add(self, func, inputs, outputs, name=None):
+        """
+        Adds a model to the graph.
+
+        Parameters
+        ----------
+        func : function
+            model to call
+        inputs : list( string )
+            names of the variables passed to the model, in order
+        outputs : list( string )
+            names of the variables returned by the model, in order
+        name : string
+            node name for logs and timings, name of func if None
+
+        Returns
+        -------
+        graph : eophis.RouterGraph
+            graph itself, so that additions may be chained
+
+        Raises
+        ------
+        eophis.abort()
+            if an output is already computed by another model
+        eophis.abort()
+            if the model closes a cycle in the graph
+
+        """
+        node = _Node( name or getattr(func,'__name__','node'), func, list(inputs), list(outputs) )
+        for var in node.outputs:
+            if var in self._producers:
+                logs.abort(f'Router variable {var} of node {node.name} is already computed by node {self._producers[var].name}')
+            self._producers[var] = node
+        self._nodes.append(node)
+        self._schedule()
+        return self
+
+    def _schedule(self):
+        """ Sorts nodes in evaluation waves. """
+        levels = {}
+        def level(node):
+            if id(node) not in levels:
+                levels[id(node)] = None
+                levels[id(node)] = 1 + max( [ level(self._producers[var]) for var in node.inputs if var in self._producers ] + [-1] )
+            elif levels[id(node)] is None:
+                logs.abort(f'Router graph contains a cycle through node {node.name}')
+            return levels[id(node)]
+
+        for node in self._nodes:
+            node.level = level(node)
+        self._waves = [ [] for _ in range( 1 + max([ node.level for node in self._nodes ] + [-1]) ) ]
+        [ self._waves[node.level].append(node) for node in self._nodes ]
+
+    def _required(self, wanted):
+        """ Returns nodes contributing to wanted variables. """
+        required, stack = set(), [ self._producers[var] for var in wanted if var in self._producers ]
+        while stack:
+            node = stack.pop()
+            if id(node) not in required:
+                required.add(id(node))
+                stack += [ self._producers[var] for var in node.inputs if var in self._producers ]
+        return required
+
+    def sinks(self):
+        """ Returns variables computed by models and not used by other models. """
+        used = { var for node in self._nodes for var in node.inputs }
+        return [ var for node in self._nodes for var in node.outputs if var not in used ]
+
+    def evaluate(self, inputs, wanted=None, timing=None):
+        """
+        Calls models whose inputs are available, wave after wave.
+
+        Parameters
+        ----------
+        inputs : dict
+            values of received variables, ``None`` if not received
+        wanted : list( string )
+            variables to return, graph sinks if None. Models not contributing to them are not called
+        timing : function
+            called with node name and duration after each model call, nothing recorded if None
+
+        Returns
+        -------
+        outputs : dict
+            values of wanted variables, ``None`` if not computed
+
+        """
+        wanted = self.sinks() if wanted is None else wanted
+        required = self._required(wanted)
+        values = { var : val for var, val in inputs.items() if val is not None }
+
+        for wave in self._waves:
+            ready = [ node for node in wave if id(node) in required and all( var in values for var in node.inputs ) ]
+            if len(ready) > 1 and self.max_workers != 1:
+                with self._lock:
+                    self._pool = self._pool or ThreadPoolExecutor(max_workers=self.max_workers)
+                    futures = [ self._pool.submit(node.run, values) for node in ready ]
+                results = [ res.result() for res in futures ]
+            else:
+                results = [ node.run(values) for node in ready ]
+            for node, (res, elapsed) in zip(ready, results):
+                values.update({ var : val for var, val in zip(node.outputs, res) if val is not None })
+                timing(node.name, elapsed) if timing else None
+        return { var : values.get(var) for var in wanted }
+
+    def close(self):
+        """ Shuts thread pool down, waiting for running models. """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def __call__(self, **inputs):
+        """ Evaluates graph as a Router function, returns values of graph sinks. """
+        return self.evaluate(inputs)
@@ -1,5 +1,5 @@
 """
-This module creates and configures eophis log files.
+This module creates and configures eophis log files. Only the Master process writes in log files, messages of other processes are forwarded to it.
 
 * Copyright (c) 2023 IGE-MEOM
     Eophis is released under an MIT License.
@@ -9,26 +9,112 @@ This module creates and configures eophis log files.
 # eophis modules
 from .worker import Paral, quit_eophis
 # external modules
+from collections import deque
 import logging
-import inspect
+import sys
 
 __all__ = ['info','warning','abort']
 
 class _Logbuffer:
     """
-    This class contains the log buffer. It is used to store output messages until the Master process is identified,
-    which is not possible while coupling environment is not set.
+    This class contains the log buffers. The first one is used to store output messages until the Master process is identified,
+    which is not possible while coupling environment is not set. The second one stores messages of other processes until they are forwarded to Master.
+    Buffers are bounded: oldest messages are dropped when they are full.
     
     Attributes
     ----------
-    content : list( string )
-        list of stored output messages
+    MAXLEN : int
+        maximum number of messages in each buffer
+    content : collections.deque( string )
+        stored output messages
     store : bool
         store output messages in log buffer if True, does not otherwise
+    forward : collections.deque( tuple )
+        level and content of messages to forward to Master
+    direct : bool
+        calling process writes its own messages in log files if True, forwards them otherwise
+    dropped : int
+        number of messages dropped from full buffers
+    aborted : bool
+        True if calling process aborted the run
+    opened : set( string )
+        names of loggers whose file is opened by calling process
         
     """
-    content = []
+    MAXLEN = 10000
+    content = deque(maxlen=MAXLEN)
     store = True
+    forward = deque(maxlen=MAXLEN)
+    direct = False
+    dropped = 0
+    aborted = False
+    opened = set()
+
+
+class _Warnings:
+    """
+    This class contains the occurrences of warnings. Identical warnings repeatedly raised from the same code line are only written
+    at their 1st, 10th, 100th... occurrences.
+    
+    Attributes
+    ----------
+    counts : dict
+        number of occurrences and next occurrence to write, for each (file, line, message, args) raising warnings
+        
+    """
+    counts = {}
+
+
+def _caller(depth=2):
+    """ Returns file name and line number of the calling frame at given depth, without reading source context. """
+    frame = sys._getframe(depth)
+    return frame.f_code.co_filename, frame.f_lineno
+
+
+def _push(buffer, item):
+    """ Appends item in a bounded log buffer, counts dropped messages if full. """
+    if len(buffer) == buffer.maxlen:
+        _Logbuffer.dropped += 1
+    buffer.append(item)
+
+
+def _emit(level, message):
+    """ Writes message in log file if calling process is a writer, stores it to be forwarded to Master otherwise. """
+    if Paral.RANK == Paral.MASTER or _Logbuffer.direct:
+        if level == 'info':
+            _open_log_file('logger_info')
+            _logger_info.info(message)
+        else:
+            _open_log_file('logger_err')
+            getattr(_logger_err,level)(message)
+    else:
+        _push(_Logbuffer.forward, (level,message))
+
+
+def gather_logs():
+    """
+    Forwards stored messages of all processes to Master, which writes them in log files.
+    
+    Notes
+    -----
+    This is a collective operation on eophis communicator.
+    
+    """
+    records = list(_Logbuffer.forward)
+    if _Logbuffer.dropped > 0:
+        records.append( ('warning', '[RANK:'+str(Paral.RANK)+'] '+str(_Logbuffer.dropped)+' log messages dropped from full buffers') )
+    _Logbuffer.forward.clear()
+    _Logbuffer.dropped = 0
+
+    all_records = Paral.EOPHIS_COMM.gather(records, root=Paral.MASTER)
+    if Paral.RANK == Paral.MASTER:
+        for level, message in [ rec for rank_records in all_records for rec in rank_records ]:
+            _emit(level,message)
+
+
+def aborted():
+    """ Returns True if calling process aborted the run. Other processes may then never join a collective operation. """
+    return _Logbuffer.aborted
 
 
 def flush_buffer(writer=Paral.RANK):
@@ -52,12 +138,12 @@ def info(message='',writer=Paral.MASTER):
         
     """
     if _Logbuffer.store:
-        _Logbuffer.content.append(message)
-    else:
-        _logger_info.info(message) if Paral.RANK == writer else None
+        _push(_Logbuffer.content, message)
+    elif Paral.RANK == writer:
+        _emit('info',message)
 
 
-def warning(message='Warning not described'):
+def warning(message='Warning not described', *args):
     """
     Writes a warning message in 'eophis.err' log file.
     Writes that a warning occured in 'eophis.out' log file.
@@ -65,15 +151,36 @@ def warning(message='Warning not described'):
     Parameters
     ----------
     message : string
-        warning message to be logged
+        warning message to be logged, may contain %-style format specifiers
+    args : tuple
+        values formatted in message, only if the warning is written
+        
+    Notes
+    -----
+    Identical warnings, i.e. with same message and args, repeatedly raised from the same code line are only written at their 1st, 10th, 100th... occurrences, with the number of occurrences.
+    Message is only formatted if the warning is written.
         
     """
-    caller = inspect.stack()[1]
-    _logger_err.warning('[RANK:'+str(Paral.RANK)+'] from '+caller.filename+' at line '+str(caller.lineno)+': '+message)
+    filename, lineno = _caller()
+    key = (filename, lineno, message, args)
+    try:
+        hash(key)
+    except TypeError:
+        key = (filename, lineno, message, repr(args))
+    count, next_write = _Warnings.counts.get( key, (0,1) )
+    count += 1
+    if count < next_write:
+        _Warnings.counts[key] = (count, next_write)
+        return
+    _Warnings.counts[key] = (count, 10*next_write)
+    
+    message = message % args if args else message
+    message = message if count == 1 else message+' ('+str(count)+' occurrences)'
+    _emit('warning', '[RANK:'+str(Paral.RANK)+'] from '+filename+' at line '+str(lineno)+': '+message)
     info('Warning raised by rank '+str(Paral.RANK)+' ! See error log for details\n',Paral.RANK)
 
 
-def abort(message='Error not described'):
+def abort(message='Error not described', *args):
     """
     Writes an error message in 'eophis.err' log file.
     Writes that a error occured in 'eophis.out' log file.
@@ -82,11 +189,20 @@ def abort(message='Error not described'):
     Parameters
     ----------
     message : string
-        error message to be logged
+        error message to be logged, may contain %-style format specifiers
+    args : tuple
+        values formatted in message
         
     """
-    caller = inspect.stack()[1]
-    _logger_err.error('[RANK:'+str(Paral.RANK)+'] from '+caller.filename+' at line '+str(caller.lineno)+': '+message)
+    filename, lineno = _caller()
+    message = message % args if args else message
+    _Logbuffer.aborted = True
+
+    # execution stops: calling process writes its own messages
+    _Logbuffer.direct = True
+    while _Logbuffer.forward:
+        _emit( *_Logbuffer.forward.popleft() )
+    _emit('error', '[RANK:'+str(Paral.RANK)+'] from '+filename+' at line '+str(lineno)+': '+message)
     info('RUN ABORTED by rank '+str(Paral.RANK)+' see error log for details',Paral.RANK)
     flush_buffer()
     quit_eophis()
@@ -94,7 +210,7 @@ def abort(message='Error not described'):
 
 def _setup_logger(name, log_file, formatter, level=logging.INFO):
     """
-    Creates a logger.
+    Creates a logger. Its log file is not opened yet: Master opens it at eophis initialization, other processes if they have to write in it.
     
     Parameters
     ----------
@@ -113,24 +229,34 @@ def _setup_logger(name, log_file, formatter, level=logging.INFO):
         logger object to write messages
         
     """
-    if Paral.RANK == Paral.MASTER: 
-        mode='w'
-    else:
-        mode='a'
-
-    handler = logging.FileHandler(log_file,mode=mode)
-    handler.setFormatter(formatter)
-    
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    logger.addHandler(handler)
+    _log_files[name] = (log_file, formatter)
 
     return logger
+
+
+def open_log_files():
+    """ Master opens log files, so that log files of a previous run are overwritten even if no message is written. Called at eophis initialization, not at import. """
+    [ _open_log_file(name) for name in _log_files ] if Paral.RANK == Paral.MASTER else None
+
+
+def _open_log_file(name):
+    """ Opens log file of a logger for calling process, if not already done. Only the first process of all coupled cpus overwrites an existing log file. """
+    if name not in _Logbuffer.opened:
+        _Logbuffer.opened.add(name)
+        log_file, formatter = _log_files[name]
+        mode = 'w' if Paral.GLOBAL_RANK == Paral.MASTER else 'a'
+        
+        handler = logging.FileHandler(log_file,mode=mode)
+        handler.setFormatter(formatter)
+        logging.getLogger(name).addHandler(handler)
     
     
 # define and create formats and loggers for warning and info logs
 _format = logging.Formatter('%(message)s')
 _format_err = logging.Formatter('%(levelname)s %(message)s')
+_log_files = {}
 
 _logger_info = _setup_logger('logger_info','eophis.out',_format)
 _logger_err = _setup_logger('logger_err','eophis.err',_format_err,logging.WARNING)
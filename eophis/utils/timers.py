@@ -0,0 +1,150 @@
+"""
+This module measures durations of the coupling exchange phases.
+
+* Copyright (c) 2023 IGE-MEOM
+    Eophis is released under an MIT License.
+    See the `LICENSE <https://github.com/meom-group/eophis/blob/main/LICENSE>`_ file for details.
+
+"""
+# eophis modules
+from .worker import Paral
+from . import logs
+# external modules
+import numpy as np
+import threading
+import math
+
+__all__ = []
+
+class _Timings:
+    """
+    This class contains histograms of exchange phase durations.
+    Durations are sorted in logarithmic bins, from 1 microsecond to 1000 seconds. Shorter and longer durations are counted in the first and last bins.
+
+    Attributes
+    ----------
+    enabled : bool
+        record durations if True, does not otherwise
+    records : dict
+        counts per bin, total duration and number of moved bytes for each (tunnel, variable, phase)
+    lock : threading.Lock
+        protects records, durations may be recorded by several Loop, prefetch and Router threads
+    LOG_MIN : int
+        decimal logarithm of the first bin lower edge, in seconds
+    BINS_PER_DECADE : int
+        number of bins per power of ten
+    NBINS : int
+        number of bins between 1 microsecond and 1000 seconds
+
+    """
+    enabled = True
+    records = {}
+    lock = threading.Lock()
+    LOG_MIN = -6
+    BINS_PER_DECADE = 10
+    NBINS = 9 * BINS_PER_DECADE
+
+
+def record(tunnel, var, phase, elapsed, nbytes=0):
+    """
+    Adds a phase duration in histograms.
+
+    Parameters
+    ----------
+    tunnel : string
+        Tunnel label
+    var : string
+        variable label, None if the phase concerns all variables of the Tunnel
+    phase : string
+        exchange phase name
+    elapsed : float
+        phase duration, in seconds
+    nbytes : int
+        number of bytes moved during the phase
+
+    """
+    if not _Timings.enabled:
+        return
+    key = (tunnel, var, phase)
+    ibin = int( (math.log10(elapsed) - _Timings.LOG_MIN) * _Timings.BINS_PER_DECADE ) + 1 if elapsed > 0.0 else 0
+    with _Timings.lock:
+        if key not in _Timings.records:
+            _Timings.records[key] = [ np.zeros(_Timings.NBINS+2, dtype=np.int64), 0.0, 0 ]
+        rec = _Timings.records[key]
+        rec[0][ min(max(ibin,0), _Timings.NBINS+1) ] += 1
+        rec[1] += elapsed
+        rec[2] += nbytes
+
+
+def percentile(counts, q):
+    """
+    Estimates a percentile of durations from their histogram.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+        number of durations in each bin
+    q : float
+        percentile to compute, between 0 and 100
+
+    Returns
+    -------
+    value : float
+        geometric center of the bin containing the percentile, in seconds
+
+    """
+    ibin = int( np.searchsorted( np.cumsum(counts), q / 100.0 * counts.sum() ) )
+    ibin = min( max(ibin,1), _Timings.NBINS )
+    return 10.0 ** ( _Timings.LOG_MIN + (ibin - 0.5) / _Timings.BINS_PER_DECADE )
+
+
+def reset():
+    """ Erases all recorded durations. """
+    with _Timings.lock:
+        _Timings.records = {}
+
+
+def summary():
+    """
+    Merges histograms of all processes and builds a summary of recorded durations.
+
+    Returns
+    -------
+    lines : list( string )
+        formatted summary, one line per (tunnel, variable, phase) and a header. Empty if nothing was recorded or not master process.
+
+    Notes
+    -----
+    This is a collective operation on eophis communicator.
+
+    """
+    with _Timings.lock:
+        records = { key : [ rec[0].copy(), rec[1], rec[2] ] for key, rec in _Timings.records.items() }
+    all_records = Paral.EOPHIS_COMM.gather(records, root=Paral.MASTER)
+    if Paral.RANK != Paral.MASTER:
+        return []
+
+    merged = {}
+    for records in all_records:
+        for key, (counts, total, nbytes) in records.items():
+            if key not in merged:
+                merged[key] = [ np.zeros_like(counts), 0.0, 0 ]
+            merged[key][0] += counts
+            merged[key][1] += total
+            merged[key][2] += nbytes
+    if not merged:
+        return []
+
+    lines = [ f'{"tunnel":<12} {"variable":<12} {"phase":<8} {"count":>8} {"mean(ms)":>10} {"p50(ms)":>10} {"p99(ms)":>10} {"bytes":>14}' ]
+    for (tunnel, var, phase), (counts, total, nbytes) in sorted( merged.items(), key=lambda item: tuple(str(k) for k in item[0]) ):
+        count = int(counts.sum())
+        lines.append( f'{tunnel:<12} {var or "-":<12} {phase:<8} {count:>8} {1e3*total/count:>10.3f} {1e3*percentile(counts,50):>10.3f} {1e3*percentile(counts,99):>10.3f} {nbytes:>14}' )
+    return lines
+
+
+def write_summary():
+    """ Writes summary of recorded durations of all processes in 'eophis.out' log file. """
+    lines = summary()
+    if lines:
+        logs.info(f'\n-------- Exchange timings (all ranks) --------')
+        [ logs.info(line) for line in lines ]
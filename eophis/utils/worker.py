@@ -28,6 +28,8 @@ class Paral:
         Rank numbering of cpus in EOPHIS_COMM
     MASTER : int
         Output rank
+    ISOLATED : bool
+        True if EOPHIS_COMM only contains eophis cpus, i.e. collective operations do not involve coupled codes
         
     """
     GLOBAL_COMM = MPI.COMM_WORLD
@@ -35,6 +37,7 @@ class Paral:
     EOPHIS_COMM = GLOBAL_COMM
     RANK = GLOBAL_RANK
     MASTER = 0
+    ISOLATED = False
 
 
 def set_local_communicator(new_comm):
@@ -49,6 +52,12 @@ def set_local_communicator(new_comm):
     """
     Paral.EOPHIS_COMM = new_comm
     Paral.RANK = Paral.EOPHIS_COMM.Get_rank()
+    Paral.ISOLATED = True
+
+
+def threads_supported():
+    """ Checks if MPI is initialized with full thread support, i.e. if several threads may communicate at the same time. """
+    return MPI.Query_thread() == MPI.THREAD_MULTIPLE
 
 
 def quit_eophis():
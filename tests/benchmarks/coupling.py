@@ -0,0 +1,80 @@
+"""
+This script measures the throughput of an All In All Out loop without OASIS nor coupled code, with the mock coupling backend.
+Fields are received from synthetic global fields and sent back unchanged by the router: measured durations are Eophis overhead only.
+Namcouple is written in preproduction mode by a first process, the loop is run in production mode by a second one, in a temporary directory.
+
+Usage: python3 ./coupling.py [--grid eORCA05] [--nvar 4] [--lvl 10] [--niter 100] [--fuse] [--reuse] [--mpi-halos]
+       mpirun -np 4 python3 ./coupling.py --run prod ... (in a directory containing a namcouple written with --run preprod)
+
+"""
+# external modules
+import subprocess
+import tempfile
+import argparse
+import json
+import time
+import sys
+import os
+
+STEP = 3600
+
+def tunnel_config(args):
+    """ Returns Tunnel configuration: nvar received and nvar sent variables on a pre-defined Domain. """
+    from eophis import Domains, Freqs
+    exchs = [ { 'in' : [f'in{i}'], 'out' : [f'out{i}'], 'grd' : args.grid, 'lvl' : args.lvl, 'freq' : Freqs.HOURLY } for i in range(args.nvar) ]
+    return { 'label' : 'BENCH', 'grids' : { args.grid : getattr(Domains, args.grid) }, 'exchs' : exchs, \
+             'fuse' : args.fuse, 'reuse' : args.reuse, 'mpi_halos' : args.mpi_halos }
+
+
+def preproduction(args):
+    """ Writes namcouple for the benchmark Tunnel. """
+    import eophis
+    eophis.set_mode('preprod')
+    eophis.register_tunnels( [tunnel_config(args)] )
+    eophis.write_coupling_namelist( simulation_time=STEP*args.niter )
+
+
+def production(args):
+    """ Runs the loop with the mock backend, prints iterations per second. """
+    import eophis
+    from eophis.utils.worker import Paral
+    eophis.set_backend('mock')
+    eophis.set_mode('prod')
+    tunnel, = eophis.register_tunnels( [tunnel_config(args)] )
+    eophis.open_tunnels()
+
+    @eophis.all_in_all_out(geo_model=tunnel, step=STEP, niter=args.niter)
+    def loop_core(**inputs):
+        return { f'out{i}' : inputs[f'in{i}'] for i in range(args.nvar) }
+
+    Paral.EOPHIS_COMM.Barrier()
+    t0 = time.perf_counter()
+    eophis.starter(loop_core)
+    Paral.EOPHIS_COMM.Barrier()
+    elapsed = time.perf_counter() - t0
+    if Paral.RANK == Paral.MASTER:
+        print(json.dumps( { 'ranks' : Paral.EOPHIS_COMM.Get_size(), 'elapsed' : elapsed, 'it_per_s' : args.niter / elapsed } ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--grid', default='eORCA05', help='pre-defined Domain')
+    parser.add_argument('--nvar', type=int, default=4, help='number of received and sent variables')
+    parser.add_argument('--lvl', type=int, default=10, help='number of levels per variable')
+    parser.add_argument('--niter', type=int, default=100, help='number of loop iterations')
+    parser.add_argument('--fuse', action='store_true', help='fuse variables in OASIS fields')
+    parser.add_argument('--reuse', action='store_true', help='reuse reception buffers')
+    parser.add_argument('--mpi-halos', dest='mpi_halos', action='store_true', help='fill halos by MPI communications')
+    parser.add_argument('--run', choices=('preprod','prod'), default=None, help='run one step only, in current directory')
+    args = parser.parse_args()
+
+    if args.run == 'preprod':
+        preproduction(args)
+    elif args.run == 'prod':
+        production(args)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            for run in ('preprod','prod'):
+                out = subprocess.run( [sys.executable, os.path.abspath(__file__), '--run', run] + sys.argv[1:], \
+                                      cwd=workdir, capture_output=True, text=True, check=True ).stdout
+            print(out.strip().splitlines()[-1])
@@ -0,0 +1,146 @@
+"""
+This script measures durations and peak memory of Grid decomposition and halo rebuild, for pre-defined Domains, numbers of processes and numbers of levels.
+For each number of processes, first, middle and last subdomains are measured: they cover the different halo types of NorthFold grids.
+Results are written in a JSON file and compared with a baseline file if given: measures exceeding baseline beyond tolerance are reported as regressions.
+Baselines depend on the machine and are not versioned: write one with --save-baseline before modifying sources, on the machine used for comparisons.
+
+Usage: python3 ./decomposition.py [--output results.json] [--baseline baseline.json [--save-baseline]] [--quick]
+
+"""
+# eophis modules
+from eophis import Domains
+from eophis.domain.grid import Grid
+# external modules
+import numpy as np
+import tracemalloc
+import argparse
+import time
+import json
+import sys
+import os
+
+DOMAINS = ('eORCA05', 'eORCA025', 'eORCA025_U', 'eORCA025_V', 'eORCA025_F')
+NSUBS = (1, 4, 16, 64, 256, 1024, 4096)
+LEVELS = (1, 10)
+
+def _measure(func, repeat):
+    """ Returns shortest duration of func in seconds and peak memory allocated during its first call in bytes. """
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times), peak
+
+
+def run(domains=DOMAINS, nsubs=NSUBS, levels=LEVELS, repeat=5):
+    """
+    Measures Grid decomposition, Orange partition computation and halo rebuild.
+
+    Parameters
+    ----------
+    domains : tuple( string )
+        names of pre-defined Domains to measure
+    nsubs : tuple( int )
+        numbers of processes
+    levels : tuple( int )
+        numbers of levels of rebuilt fields
+    repeat : int
+        number of measures, shortest is kept
+
+    Returns
+    -------
+    results : dict
+        for each '<domain>/<nsub>/<subdomain>/<operation>' key, shortest duration ('time', in seconds) and peak memory ('memory', in bytes)
+
+    """
+    results = {}
+    for name in domains:
+        info = getattr(Domains, name)
+        nx, ny = info['npts']
+        grd_type, fold = info['folding']
+        for nsub in nsubs:
+            for rank in sorted({ 0, nsub//2, nsub-1 }):
+                grd = Grid( name, nx, ny, info['halos'], info['bnd'], grd_type, fold )
+                key = f'{name}/{nsub}/{rank}'
+                measures = { 'decompose' : lambda: grd.make_local_subdomain(rank, nsub), \
+                             'orange' : lambda: grd.as_orange_partition() }
+                for op, func in measures.items():
+                    results[f'{key}/{op}'] = dict( zip( ('time','memory'), _measure(func, repeat) ) )
+                for nlvl in levels:
+                    rcv_fld = np.random.rand(grd.orange_size, nlvl)
+                    out = grd.generate_rebuilt_array(nlvl)
+                    results[f'{key}/rebuild_{nlvl}'] = dict( zip( ('time','memory'), _measure(lambda: grd.rebuild(rcv_fld, out), repeat) ) )
+    return results
+
+
+def compare(results, baseline, tolerance=0.5, min_time=2e-3):
+    """
+    Compares measures with a baseline.
+
+    Parameters
+    ----------
+    results : dict
+        measures returned by ``run()``
+    baseline : dict
+        reference measures, with same format
+    tolerance : float
+        relative increase above which a measure is a regression
+    min_time : float
+        durations shorter than this value, in seconds, are not compared
+
+    Returns
+    -------
+    regressions : list( string )
+        description of measures exceeding baseline
+
+    """
+    regressions = []
+    for key, ref in baseline.items():
+        if key not in results:
+            continue
+        res = results[key]
+        if max(res['time'], ref['time']) > min_time and res['time'] > (1.0 + tolerance) * ref['time']:
+            regressions.append( f'{key}: time {1e3*res["time"]:.3f} ms, baseline {1e3*ref["time"]:.3f} ms' )
+        if res['memory'] > (1.0 + tolerance) * ref['memory'] and res['memory'] - ref['memory'] > 1024**2:
+            regressions.append( f'{key}: memory {res["memory"]} B, baseline {ref["memory"]} B' )
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default='decomposition.json', help='JSON file in which results are written')
+    parser.add_argument('--baseline', default=None, help='JSON file of reference results, results are not compared if not given')
+    parser.add_argument('--save-baseline', action='store_true', help='write results in baseline file instead of comparing them')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='relative increase above which a measure is a regression')
+    parser.add_argument('--repeat', type=int, default=5, help='number of measures')
+    parser.add_argument('--quick', action='store_true', help='only measure eORCA05 up to 64 processes')
+    args = parser.parse_args()
+
+    if args.save_baseline and args.baseline is None:
+        parser.error('--save-baseline requires --baseline')
+
+    kwargs = { 'domains' : ('eORCA05',), 'nsubs' : (1, 4, 16, 64) } if args.quick else {}
+    results = run(repeat=args.repeat, **kwargs)
+    with open(args.output, 'w') as outfile:
+        json.dump(results, outfile, indent=1, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as outfile:
+            json.dump(results, outfile, indent=1, sort_keys=True)
+        print(f'Baseline written in {args.baseline}')
+    elif args.baseline is None:
+        print(f'Results written in {args.output}, no baseline given')
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline) as infile:
+            regressions = compare(results, json.load(infile), args.tolerance)
+        [ print(line) for line in regressions ]
+        print(f'{len(regressions)} regression(s) against {args.baseline}')
+        sys.exit(1 if regressions else 0)
+    else:
+        print(f'Baseline {args.baseline} not found, run with --save-baseline to create it')
+        sys.exit(1)
@@ -0,0 +1,52 @@
+"""
+This script measures Eophis start-up times: package import, and initialization with ``eophis.init()``.
+Each measure is performed in a new Python process, to include module loading from file system.
+
+Usage: python3 ./startup.py [--repeat N]
+
+"""
+# external modules
+import subprocess
+import argparse
+import json
+import sys
+
+_PROBE = """
+import time
+t0 = time.perf_counter()
+import eophis
+t1 = time.perf_counter()
+eophis.init()
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t1)
+"""
+
+def measure(repeat=5):
+    """
+    Measures import and initialization times of Eophis.
+    
+    Parameters
+    ----------
+    repeat : int
+        number of measures
+        
+    Returns
+    -------
+    times : dict
+        median import ('import' key) and initialization ('init' key) times, in seconds
+        
+    """
+    imports, inits = [], []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _PROBE], capture_output=True, text=True, check=True).stdout
+        t_import, t_init = ( float(t) for t in out.split()[-2:] )
+        imports.append(t_import)
+        inits.append(t_init)
+    return { 'import' : sorted(imports)[repeat//2], 'init' : sorted(inits)[repeat//2] }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='number of measures')
+    args = parser.parse_args()
+    print(json.dumps(measure(args.repeat), indent=2))
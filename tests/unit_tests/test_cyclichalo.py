@@ -245,3 +245,20 @@ def test_4x4x2_4x4x2_1_halo_total():
     res = hls.rebuild(np.arange(32).reshape(16,2,order='F')+1).transpose()
     ref = np.array( [ [[0,13,14,15,16,0],[0,1,2,3,4,0],[0,5,6,7,8,0],[0,9,10,11,12,0],[0,13,14,15,16,0],[0,1,2,3,4,0]] , [[0,29,30,31,32,0],[0,17,18,19,20,0],[0,21,22,23,24,0],[0,25,26,27,28,0],[0,29,30,31,32,0],[0,17,18,19,20,0]] ] )
     assert np.array_equal(res,ref) == True
+
+# ====================
+# segments, all cases
+# ====================
+@pytest.mark.parametrize("global_grid, local_grid, offset, size, bnd, offsets, sizes", [
+    # inner subdomain, lines split in side halos
+    ( (4,3), (2,1), 5, 1, ('cyclic','cyclic'), [1,0,3,4,7,9,8,11], [2,1,1,1,1,2,1,1] ),
+    ( (4,3), (2,1), 5, 1, ('close','close'), [1,0,3,4,7,9,8,11], [2,1,1,1,1,2,1,1] ),
+    # top left corner, upper halo line taken from last line
+    ( (4,3), (2,1), 0, 1, ('cyclic','close'), [8,11,10,3,2,4,7,6], [2,1,1,1,1,2,1,1] ),
+    # full x dimension, no side halos
+    ( (4,3), (4,1), 4, 1, ('cyclic','cyclic'), [0,8], [4,4] ),
+    # left side halos split across x boundary
+    ( (5,5), (1,1), 11, 2, ('cyclic','close'), [1,4,0,2,6,9,5,7,14,10,12,16,19,15,17,21,24,20,22], [1,1,1,2,1,1,1,2,1,1,2,1,1,1,2,1,1,1,2] ) ])
+def test_segment_cases(global_grid, local_grid, offset, size, bnd, offsets, sizes):
+    hls = CyclicHalo(size=size, global_grid=global_grid, local_grid=local_grid, offset=offset, bnd=bnd)
+    assert hls.segment() == (offsets, sizes)
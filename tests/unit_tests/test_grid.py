@@ -1,5 +1,6 @@
 import os
 import shutil
+from unittest.mock import patch
 import pytest
 import numpy as np
 #
@@ -64,6 +65,7 @@ def test_bnd_attributes_cyclic_close():
     assert grd.bnd == ('close','cyclic')
     assert grd.fold == 'T'
     assert grd.fold == 'T'
+    assert grd.global_offset == 0
     
 def test_decompose_cyclic_close():
     grd = Grid('DEMO_GRID', nx=9, ny=9, halo_size=0, bnd=('clOse','cYclic'), grd='T', fold='T')
@@ -147,3 +149,130 @@ def test_subdomain_NF_third():
     assert grd.as_orange_partition() == ([0,5,11],[4,5,7],24)
     rcv_fld = grd.format_sending_array( grd.rebuild(grd.generate_receiving_array(2)) )
     assert rcv_fld.shape == (3,2,2)
+
+def test_subdomain_NF_rebuilt_buffer():
+    grd = Grid('eORCA1', nx=6, ny=4, halo_size=1, bnd=('cyclic','nfold'), grd='T', fold='T')
+    grd.make_local_subdomain(0,2)
+    grd.as_orange_partition()
+    rcv_fld = np.random.rand(grd.orange_size,2)
+    out = grd.generate_rebuilt_array(2)
+    res = grd.rebuild(rcv_fld,out)
+    assert res is out
+    assert out.shape == (5,6,2)
+    assert np.array_equal(out,grd.halos.apply_instructions(rcv_fld)) == True
+
+def test_subdomain_sending_buffer():
+    grd = Grid('DEMO_GRID', nx=9, ny=9, halo_size=1, bnd=('close','cyclic'), grd='T', fold='T')
+    grd.make_local_subdomain(4,9)
+    grd.as_orange_partition()
+    out = grd.generate_sending_array(2)
+    assert out.shape == (3,3,2)
+    # halos removed and copied in buffer
+    snd_fld = np.random.rand(5,5,2)
+    res = grd.format_sending_array(snd_fld,'var',out)
+    assert res is out
+    assert np.array_equal(res,snd_fld[1:4,1:4,:]) == True
+    # contiguous array without halos not copied
+    grd = Grid('DEMO_GRID', nx=9, ny=9, halo_size=0, bnd=('close','cyclic'), grd='T', fold='T')
+    grd.make_local_subdomain(4,9)
+    grd.as_orange_partition()
+    snd_fld = np.asfortranarray(np.random.rand(3,3,2))
+    res = grd.format_sending_array(snd_fld,'var',out)
+    assert res is not out
+    assert np.shares_memory(res,snd_fld) == True
+
+def test_subdomain_exchange_types():
+    grd = Grid('DEMO_GRID', nx=9, ny=9, halo_size=1, bnd=('close','cyclic'), grd='T', fold='T')
+    grd.make_local_subdomain(4,9)
+    grd.as_orange_partition()
+    rcv_fld = grd.generate_receiving_array(2,np.float32)
+    out = grd.generate_rebuilt_array(2,np.float32)
+    assert rcv_fld.dtype == np.float32
+    assert grd.rebuild(rcv_fld,out).dtype == np.float32
+    assert grd.rebuild(rcv_fld).dtype == np.float32
+    assert grd.generate_sending_array(2,np.float32).dtype == np.float32
+    # contiguous array of exchange type without halos not copied
+    out = grd.generate_sending_array(2,np.float32)
+    snd_fld = np.zeros((3,3,2),dtype=np.float32,order='F')
+    assert np.shares_memory(grd.format_sending_array(snd_fld,'var',out),snd_fld) == True
+    snd_fld = np.zeros((3,3,2),order='F')
+    assert grd.format_sending_array(snd_fld,'var',out) is out
+
+def test_subdomain_NF_plan_cache(tmp_path):
+    grd = Grid('eORCA1', nx=6, ny=4, halo_size=1, bnd=('cyclic','nfold'), grd='V', fold='F')
+    grd.make_local_subdomain(1,2)
+    ref = grd.as_orange_partition(cache=str(tmp_path))
+    assert os.path.isfile(grd.plan_file(str(tmp_path)))
+    # new grid with same properties loads plan
+    grd2 = Grid('other', nx=6, ny=4, halo_size=1, bnd=('cyclic','nfold'), grd='V', fold='F')
+    grd2.make_local_subdomain(1,2)
+    grd2.halos.segment = None
+    assert grd2.as_orange_partition(cache=str(tmp_path)) == ref
+    assert grd2.orange_size == grd.orange_size
+    rcv_fld = np.random.rand(grd.orange_size,2)
+    assert np.array_equal(grd.rebuild(rcv_fld),grd2.rebuild(rcv_fld)) == True
+
+def test_subdomain_plan_checks(tmp_path):
+    grd = Grid('eORCA1', nx=6, ny=4, halo_size=1, bnd=('cyclic','nfold'), grd='V', fold='F')
+    grd.make_local_subdomain(1,2)
+    grd.as_orange_partition(cache=str(tmp_path))
+    plan_file = grd.plan_file(str(tmp_path))
+    with np.load(plan_file) as plan:
+        content = dict(plan)
+    assert int(content['version']) == eophis.domain.grid.PLAN_VERSION
+
+    # plans of another format, or inconsistent with subdomain, are recomputed
+    changes = [ { 'version' : np.array(0) }, { 'rebuilt_size' : content['rebuilt_size'] + 1 }, \
+                { 'sizes' : content['sizes'][:-1], 'offsets' : content['offsets'][:-1] }, { 'sizes' : content['sizes'] - 1 }, \
+                { 'gather' : content['gather'] + 10 } ]
+    for change in changes:
+        np.savez(plan_file, **{ **content, **change })
+        with patch('eophis.domain.grid.logs.warning') as mock_warning:
+            assert grd.load_plan(plan_file) is None
+            mock_warning.assert_called_once()
+    content.pop('version')
+    np.savez(plan_file, **content)
+    with patch('eophis.domain.grid.logs.warning') as mock_warning:
+        assert grd.load_plan(plan_file) is None
+        assert 'format None' in mock_warning.call_args[0][0]
+
+def test_subdomain_masked(tmp_path):
+    # land in the western half, except one sea point
+    mask = np.ones((8,6))
+    mask[:4,:] = 0
+    mask[0,5] = 1
+    grd = Grid('masked', nx=8, ny=6, halo_size=1, bnd=('cyclic','close'), mask=mask)
+    rankx, ranky, active = grd.decompose_masked(3)
+    assert len(active) == 3
+    assert len(rankx) * len(ranky) > 3
+    for k in range(len(rankx)*len(ranky)):
+        i, j = k % len(rankx), k // len(rankx)
+        sea = mask[ sum(rankx[:i]) : sum(rankx[:i+1]) , sum(ranky[:j]) : sum(ranky[:j+1]) ].any()
+        assert sea == (k in active)
+    # mask from numpy file with one sea point, second process is left without subdomain
+    np.save(tmp_path / 'mask.npy', np.arange(48).reshape(8,6) == 40)
+    grd = Grid('masked', nx=8, ny=6, halo_size=1, bnd=('cyclic','close'), mask=str(tmp_path / 'mask.npy'))
+    grd.make_local_subdomain(1,2)
+    assert grd.empty == True
+    assert grd.as_orange_partition() == ([], [], 48)
+    assert grd.rebuild(grd.generate_receiving_array(2)).shape == (0,0,2)
+    assert grd.format_sending_array(np.zeros((0,0,2)),'var',grd.generate_sending_array(2)).shape == (0,0,2)
+    grd.make_local_subdomain(0,2)
+    assert grd.empty == False
+    assert grd.plan_file(str(tmp_path)) != Grid('unmasked', nx=8, ny=6, halo_size=1, bnd=('cyclic','close')).plan_file(str(tmp_path))
+
+def test_subdomain_NF_mpi_halos():
+    # single process: halos are filled with its own real cells
+    glob = np.arange(6*4*2, dtype=np.float64).reshape(6,4,2,order='F') + 1
+    ref = Grid('eORCA1', nx=6, ny=4, halo_size=2, bnd=('cyclic','nfold'), grd='U', fold='F')
+    ref.make_local_subdomain(0,1)
+    offsets, sizes, _ = ref.as_orange_partition()
+    flat = glob.reshape(-1,2,order='F')
+    rcv_fld = np.concatenate( [ flat[off:off+siz] for off,siz in zip(offsets,sizes) ] )
+    grd = Grid('eORCA1', nx=6, ny=4, halo_size=2, bnd=('cyclic','nfold'), grd='U', fold='F')
+    grd.make_local_subdomain(0,1)
+    grd.set_halo_exchange(*grd.as_orange_partition()[:2])
+    assert grd.generate_receiving_array(2).shape == (24,2)
+    out = grd.generate_rebuilt_array(2)
+    assert grd.rebuild(flat,out) is out
+    assert np.array_equal(out, ref.rebuild(rcv_fld)) == True
@@ -75,6 +75,18 @@ def test_segment_side_halos():
     res = hls.segment_side_halos(34,36)
     assert res == ([27],[2])
     
+# -- segment side halos of several lines at once: (line starts, side halo x positions) -> kept (offsets, sizes)
+@pytest.mark.parametrize("global_grid, size, starts, local_offsets, offsets, sizes", [
+    ( (9,9), 2, [21,19,18,33,34], [19,17,16,35,36], [19,26,18,25,35,27,27], [2,1,1,2,1,1,2] ),
+    ( (6,4), 1, [0,11,18], [-1,12,23], [5,6,23], [1,1,1] ),
+    ( (6,4), 3, [6,12], [5,10], [11,6,16,12], [1,2,2,1] ) ])
+def test_segment_side_lines(global_grid, size, starts, local_offsets, offsets, sizes):
+    hls = HaloGrid(size=size , global_grid=global_grid, local_grid=(1,1), offset=0)
+    off, siz, keep = hls.segment_side_lines( np.array(starts), np.array(local_offsets) )
+    assert off.shape == siz.shape == keep.shape == (len(starts),2)
+    assert off[keep].tolist() == offsets
+    assert siz[keep].tolist() == sizes
+
 # global grid 6x4
 # -- local grid 2x2
 def test_6x4_2x2_1_halos():
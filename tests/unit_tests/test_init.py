@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+from unittest.mock import patch
+import pytest
+#
+import eophis
+
+# ========
+# cleaning
+# ========
+@pytest.fixture(scope="session",autouse=True)
+def clean_files():
+    yield
+    for file_name in ["eophis.out", "eophis.err"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+    if os.path.isdir("__pycache__"):
+        shutil.rmtree("__pycache__")
+
+# ===============
+# test __init__.py
+# ===============
+_PROBE = """
+import os, sys, json, atexit
+import eophis
+from eophis.coupling import tunnel
+from eophis.coupling.namcouple import Namcouple
+state = {}
+
+# import: nothing initialized, OASIS module not executed
+state['import'] = [ eophis._Status.initialized, Namcouple._instance is not None, 'watermark' in sys.modules, os.path.exists('namcouple'), type(tunnel.pyoasis).__name__ ]
+state['logs'] = [ os.path.exists('eophis.out'), os.path.exists('eophis.err') ]
+
+# first Namcouple use initializes package, log files opened
+Namcouple()
+state['namcouple'] = [ eophis._Status.initialized, 'watermark' in sys.modules, os.path.exists('eophis.out'), os.path.exists('eophis.err') ]
+
+# next calls do nothing
+calls = []
+eophis._init_coupling = lambda: calls.append('coupling')
+register = atexit.register
+atexit.register = lambda *args: calls.append('atexit')
+eophis.init()
+eophis.init()
+atexit.register = register
+state['init'] = calls
+print(json.dumps(state))
+"""
+
+def test_lazy_init(tmp_path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join( [ os.path.dirname(os.path.dirname(eophis.__file__)) ] + sys.path ))
+    out = subprocess.run( [sys.executable, '-c', _PROBE], cwd=tmp_path, env=env, capture_output=True, text=True, check=True ).stdout
+    state = json.loads( out.strip().splitlines()[-1] )
+    assert state['import'][0:4] == [False, False, False, False]
+    assert state['import'][4] in ('_LazyModule', '_MissingModule')
+    assert state['logs'] == [False, False]
+    assert state['namcouple'] == [True, True, True, True]
+    assert state['init'] == []
+
+def test_finish_after_abort():
+    # no collective operation if calling process aborted, others may never join it
+    with patch('eophis.timers.write_summary') as mock_summary, patch('eophis.close_tunnels') as mock_close, \
+         patch('eophis.logs.aborted', return_value=True):
+        eophis._finish_eophis()
+        mock_summary.assert_not_called()
+        mock_close.assert_not_called()
+    with patch('eophis.timers.write_summary') as mock_summary, patch('eophis.close_tunnels') as mock_close, \
+         patch('eophis.logs.aborted', return_value=False):
+        eophis._finish_eophis()
+        mock_summary.assert_called_once()
+        mock_close.assert_called_once_with(reread=False)
@@ -23,10 +23,11 @@ def clean_files():
 # ============
 # test logs.py
 # ============
-from eophis.utils.logs import info, warning, abort, _Logbuffer, _logger_info, _logger_err
+from eophis.utils.logs import info, warning, abort, aborted, gather_logs, open_log_files, _Logbuffer, _Warnings, _push, _logger_info, _logger_err
 from eophis.utils.worker import Paral
 
 def test_inquire_log_files():
+    open_log_files()
     assert os.path.exists("eophis.out"), "log file 'eophis.out' does not exist"
     assert os.path.exists("eophis.err"), "log file 'eophis.err' does not exist"
 
@@ -47,7 +48,7 @@ def test_warning():
     with patch('eophis.utils.logs._logger_err', mock_logger_err), \
          patch('eophis.utils.logs.info', mock_info):
         warning("Test warning")
-        mock_logger_err.warning.assert_called_once_with("[RANK:0] from "+caller+" at line 49: Test warning")
+        mock_logger_err.warning.assert_called_once_with("[RANK:0] from "+caller+" at line 50: Test warning")
         mock_info.assert_called_once_with('Warning raised by rank 0 ! See error log for details\n', 0)
 
 def test_abort():
@@ -60,6 +61,90 @@ def test_abort():
          patch('eophis.utils.logs.info', mock_info), \
          patch('eophis.utils.logs.quit_eophis', mock_quit_eophis):
         abort("Test error")
-        mock_logger_err.error.assert_called_once_with("[RANK:0] from "+caller+" at line 62: Test error")
+        mock_logger_err.error.assert_called_once_with("[RANK:0] from "+caller+" at line 63: Test error")
         mock_info.assert_called_once_with('RUN ABORTED by rank 0 see error log for details', 0)
         mock_quit_eophis.assert_called_once()
+
+def test_repeated_warning():
+    caller = os.getcwd() + '/test_logs.py'
+    Paral.RANK = Paral.MASTER
+    _Logbuffer.store = False
+    mock_logger_err = MagicMock(spec=logging.Logger)
+    mock_info = MagicMock()
+    with patch('eophis.utils.logs._logger_err', mock_logger_err), \
+         patch('eophis.utils.logs.info', mock_info):
+        for i in range(100):
+            warning("Repeated warning %s", "sst")
+        assert mock_logger_err.warning.call_count == 3
+        mock_logger_err.warning.assert_any_call("[RANK:0] from "+caller+" at line 77: Repeated warning sst")
+        mock_logger_err.warning.assert_any_call("[RANK:0] from "+caller+" at line 77: Repeated warning sst (10 occurrences)")
+        mock_logger_err.warning.assert_called_with("[RANK:0] from "+caller+" at line 77: Repeated warning sst (100 occurrences)")
+        assert mock_info.call_count == 3
+        assert _Warnings.counts[(caller,77,"Repeated warning %s",("sst",))] == (100,1000)
+
+def test_forwarded_logs():
+    _Logbuffer.store = False
+    _Logbuffer.direct = False
+    _Logbuffer.forward.clear()
+    mock_logger_err = MagicMock(spec=logging.Logger)
+    mock_logger_info = MagicMock(spec=logging.Logger)
+    mock_comm = MagicMock()
+    with patch('eophis.utils.logs._logger_err', mock_logger_err), \
+         patch('eophis.utils.logs._logger_info', mock_logger_info), \
+         patch.object(Paral, 'EOPHIS_COMM', mock_comm):
+        # other rank: messages are stored
+        Paral.RANK = 1
+        warning("Forwarded warning")
+        mock_logger_err.warning.assert_not_called()
+        mock_logger_info.info.assert_not_called()
+        assert len(_Logbuffer.forward) == 2
+        records = list(_Logbuffer.forward)
+        mock_comm.gather.return_value = None
+        gather_logs()
+        mock_comm.gather.assert_called_once_with(records, root=Paral.MASTER)
+        assert len(_Logbuffer.forward) == 0
+
+        # master: writes messages of all ranks
+        Paral.RANK = Paral.MASTER
+        mock_comm.gather.return_value = [ [], records ]
+        gather_logs()
+        mock_logger_err.warning.assert_called_once_with(records[0][1])
+        mock_logger_info.info.assert_called_once_with('Warning raised by rank 1 ! See error log for details\n')
+
+def test_bounded_buffer():
+    _Logbuffer.dropped = 0
+    _Logbuffer.forward.clear()
+    for i in range(_Logbuffer.MAXLEN + 5):
+        _push(_Logbuffer.forward, ('info', str(i)))
+    assert len(_Logbuffer.forward) == _Logbuffer.MAXLEN
+    assert _Logbuffer.forward[0] == ('info', '5')
+    assert _Logbuffer.dropped == 5
+    _Logbuffer.forward.clear()
+    _Logbuffer.dropped = 0
+
+def test_distinct_warnings():
+    import inspect
+    caller = os.getcwd() + '/test_logs.py'
+    Paral.RANK = Paral.MASTER
+    _Logbuffer.store = False
+    mock_logger_err = MagicMock(spec=logging.Logger)
+    with patch('eophis.utils.logs._logger_err', mock_logger_err), \
+         patch('eophis.utils.logs.info', MagicMock()):
+        for var in ("sst", "svt", "sst"):
+            warning("Static sending of %s through tunnel %s already done, skipped", var, "earth")
+        line = inspect.currentframe().f_lineno - 1
+    # different variables warning from the same line are both written, and counted separately
+    assert mock_logger_err.warning.call_count == 2
+    mock_logger_err.warning.assert_any_call("[RANK:0] from "+caller+f" at line {line}: Static sending of sst through tunnel earth already done, skipped")
+    mock_logger_err.warning.assert_any_call("[RANK:0] from "+caller+f" at line {line}: Static sending of svt through tunnel earth already done, skipped")
+    assert _Warnings.counts[(caller,line,"Static sending of %s through tunnel %s already done, skipped",("sst","earth"))] == (2,10)
+
+def test_aborted():
+    _Logbuffer.aborted = False
+    assert not aborted()
+    with patch('eophis.utils.logs._logger_err', MagicMock(spec=logging.Logger)), \
+         patch('eophis.utils.logs.info', MagicMock()), \
+         patch('eophis.utils.logs.quit_eophis', MagicMock()):
+        abort("Test error")
+    assert aborted()
+    _Logbuffer.aborted = False
@@ -0,0 +1,119 @@
+import os
+import shutil
+from unittest.mock import patch
+import pytest
+import numpy as np
+#
+import eophis
+
+# ========
+# cleaning
+# ========
+@pytest.fixture(scope="session",autouse=True)
+def clean_files():
+    yield
+    for file_name in ["eophis.out", "eophis.err"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+    if os.path.isdir("__pycache__"):
+        shutil.rmtree("__pycache__")
+
+# ============
+# test loop.py
+# ============
+from eophis.coupling import mockoasis
+from eophis.coupling.tunnel import set_backend
+from eophis.coupling.namcouple import register_tunnels
+from eophis.utils.params import set_mode
+from eophis.loop import all_in_all_out, all_in_all_out_multi
+
+def mock_tunnel(label, exchs, log=None):
+    """ Registers a Tunnel opened with the mock backend, whose receptions and sendings are logged in log as (variable, operation, date, mean value). """
+    set_mode('preprod')
+    tunnel, = register_tunnels( [ { "label": label, "grids": { f"grid_{label}" : { 'npts' : (6,4) } }, "exchs": exchs } ] )
+    set_backend('mock')
+    try:
+        tunnel._define_partitions(0,1)
+        tunnel._define_variables()
+    finally:
+        set_backend('pyoasis')
+
+    # received values are the reception date
+    for lbl in tunnel.arriving_list():
+        mockoasis.set_source( tunnel.py_aliases[lbl], lambda index, nlvl, date: np.full((len(index),nlvl), float(date)) )
+
+    tunnel.exchanges = [] if log is None else log
+    def spy(lbl, var, op):
+        method = getattr(var, op)
+        def call(date, array):
+            method(date, array)
+            tunnel.exchanges.append( (lbl, op, date, float(np.mean(array))) )
+        setattr(var, op, call)
+    [ spy(lbl, var, 'get') for lbl, var in tunnel._variables['rcv'].items() ]
+    [ spy(lbl, var, 'put') for lbl, var in tunnel._variables['snd'].items() ]
+    return tunnel
+
+def router(u, v):
+    """ Sends back received values plus one, results only depend on the reception date. """
+    return { 't' : None if u is None else u + 1.0, 's' : None if v is None else v + 1.0 }
+
+def test_prefetch_loop():
+    exchs = [ {"grd": "grid_loop", "in": ["u"], "out": ["t"], "freq": 900, "lvl": 1}, \
+              {"grd": "grid_loop", "in": ["v"], "out": ["s"], "freq": 1800, "lvl": 2} ]
+    step, niter = 450, 9
+    results = {}
+    for prefetch in (False, True):
+        tunnel = mock_tunnel('loop', exchs)
+        with patch('eophis.loop.tunnels_ready', return_value=True), patch('eophis.loop.threads_supported', return_value=True):
+            all_in_all_out(geo_model=tunnel, step=step, niter=niter, prefetch=prefetch)(router)()
+        results[prefetch] = tunnel.exchanges
+    mockoasis._Sources.fields = {}
+
+    # each variable exchanged at its own dates, up to the last iteration
+    for lbl, op, freq in (('u','get',900), ('t','put',900), ('v','get',1800), ('s','put',1800)):
+        dates = [ date for var, oper, date, _ in results[True] if var == lbl and oper == op ]
+        assert dates == list( range(0, step*niter, freq) )
+
+    # sent values match the date of their reception, and are sent after it
+    for k, (lbl, op, date, value) in enumerate(results[True]):
+        if op == 'put':
+            assert value == date + 1.0
+            assert ( {'t':'u','s':'v'}[lbl], 'get', date, float(date) ) in results[True][:k]
+
+    # same exchanges as the sequential loop
+    assert sorted(results[True]) == sorted(results[False])
+
+def test_multi_loop():
+    exchs_a = [ {"grd": "grid_multi_a", "in": ["a_in"], "out": ["a_out"], "freq": 1200, "lvl": 1} ]
+    exchs_b = [ {"grd": "grid_multi_b", "in": ["b_in"], "out": ["b_out"], "freq": 900, "lvl": 1} ]
+    routers = { 'multi_a' : lambda a_in: { 'a_out' : None if a_in is None else a_in + 1.0 }, \
+                'multi_b' : lambda b_in: { 'b_out' : None if b_in is None else b_in + 1.0 } }
+    expected = { 'a' : [0,1200,2400], 'b' : [0,900,1800,2700] }
+
+    for threaded in (True, False):
+        log = []
+        tunnels = [ mock_tunnel('multi_a', exchs_a, log), mock_tunnel('multi_b', exchs_b, log) ]
+        with patch('eophis.loop.tunnels_ready', return_value=True), patch('eophis.loop.threads_supported', return_value=threaded):
+            all_in_all_out_multi(tunnels, [600,900], [6,4])(routers)()
+
+        # each tunnel exchanges at its own dates only, sent values match reception dates
+        for tnl in ('a','b'):
+            for op in ('get','put'):
+                assert [ date for var, oper, date, _ in log if var.startswith(tnl) and oper == op ] == expected[tnl]
+            assert all( value == date + 1.0 for var, op, date, value in log if var.startswith(tnl) and op == 'put' )
+
+        # one thread: iterations of both tunnels merged in date order, first tunnel first at same date
+        if not threaded:
+            assert [ (var, date) for var, op, date, _ in log if op == 'get' ] == \
+                   [ ('a_in',0), ('b_in',0), ('b_in',900), ('a_in',1200), ('b_in',1800), ('a_in',2400), ('b_in',2700) ]
+    mockoasis._Sources.fields = {}
+
+def test_log_period():
+    exchs = [ {"grd": "grid_period", "in": ["p_in"], "out": ["p_out"], "freq": 900, "lvl": 1} ]
+    tunnel = mock_tunnel('period', exchs)
+    with patch('eophis.loop.tunnels_ready', return_value=True), patch('eophis.loop.LOG_PERIOD', 2), \
+         patch('eophis.loop.logs.gather_logs') as mock_gather:
+        all_in_all_out(geo_model=tunnel, step=900, niter=5)(lambda p_in: { 'p_out' : p_in })()
+        # every 2 iterations, and at loop end
+        assert mock_gather.call_count == 3
+    mockoasis._Sources.fields = {}
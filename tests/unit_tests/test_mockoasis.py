@@ -0,0 +1,97 @@
+import os
+import shutil
+from unittest.mock import patch
+import pytest
+import numpy as np
+#
+import eophis
+
+# ========
+# cleaning
+# ========
+@pytest.fixture(scope="session",autouse=True)
+def clean_files():
+    yield
+    for file_name in ["eophis.out", "eophis.err"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+    if os.path.exists("test_namcouple"):
+        os.remove("test_namcouple")
+    for dir_name in ["test_records", "__pycache__"]:
+        if os.path.isdir(dir_name):
+            shutil.rmtree(dir_name)
+
+# =================
+# test mockoasis.py
+# =================
+from eophis.coupling import mockoasis
+from eophis.coupling.tunnel import set_backend
+from eophis.coupling.namcouple import register_tunnels, close_tunnels
+from eophis.utils.params import set_mode
+
+def test_mock_partitions():
+    box = mockoasis.BoxPartition(7, 2, 3, 5)
+    assert box.index.tolist() == [7,8,12,13,17,18]
+    orange = mockoasis.OrangePartition([3,10],[2,1],20)
+    assert orange.index.tolist() == [3,4,10]
+    assert mockoasis.OrangePartition([],[],20).index.tolist() == []
+
+def test_mock_tunnel():
+    configs = [
+        {
+            "label": "test_mock",
+            "grids": {"grid_mock": { 'npts' : (6,4), 'halos' : 1, 'bnd' : ('cyclic','close') } },
+            "exchs": [{"grd": "grid_mock", "in": ["u"], "out": ["t"], "freq": 900, "lvl": 2}]
+        }
+    ]
+    set_mode('preprod')
+    tunnel, = register_tunnels(configs)
+    set_backend('mock')
+    try:
+        tunnel._define_partitions(0,1)
+        tunnel._define_variables()
+    finally:
+        set_backend('pyoasis')
+
+    # reception gathered from synthetic global field, halos rebuilt
+    rcv = tunnel.receive('u', 900)
+    glob = np.arange(1,25).reshape(6,4,order='F')
+    assert tunnel._variables['rcv']['u'].cpl_freqs == [900]
+    assert np.array_equal( rcv[1:7,1:5,0], glob )
+    assert np.array_equal( rcv[0,1:5,0], glob[5,:] )
+    assert np.all( rcv[:,0,0] == 0 )
+    assert np.array_equal( rcv[1:7,1:5,1], glob + mockoasis._Sources.LEVEL_STRIDE )
+    assert tunnel.receive('u', 1000) is None
+
+    # user-defined source, recorded
+    alias = tunnel.py_aliases['u']
+    mockoasis.set_source( alias, lambda index, nlvl, date: np.add.outer(index + float(date), np.arange(nlvl)) )
+    tunnel._received[alias] = None
+    tunnel.record = "test_records"
+    recorded = [ tunnel.receive('u', date).copy() for date in (1800,2700) ]
+    assert np.array_equal( recorded[0][1:7,1:5,1], glob + 1800.0 )
+    mockoasis._Sources.fields = {}
+    tunnel.record = None
+
+    # record files closed with tunnels
+    files = list(tunnel._recorder._files.values())[0]
+    with patch('eophis.coupling.namcouple.Namcouple._reset') as mock_reset:
+        close_tunnels()
+        mock_reset.assert_called_once()
+    assert tunnel._recorder is None
+    assert all( fl.closed for fl in files )
+
+    # replayed receptions
+    set_backend('replay', records="test_records")
+    try:
+        tunnel._variables['rcv']['u'] = mockoasis.Var(alias, tunnel._inpartitions['grid_mock'], mockoasis.OASIS.IN, bundle_size=2)
+        tunnel._received[alias] = None
+        replayed = [ tunnel.receive('u', date) for date in (1800,2700) ]
+    finally:
+        set_backend('pyoasis')
+    assert all( np.array_equal(rec, rep) for rec, rep in zip(recorded, replayed) )
+
+    # sending counted
+    var = tunnel._variables['snd']['t']
+    tunnel.send('t', rcv, 900)
+    assert var.puts == 1 and var.last_put[0] == 900 and var.last_put[1].shape == (6,4,2)
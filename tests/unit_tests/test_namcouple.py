@@ -1,5 +1,6 @@
 import os
 import shutil
+from unittest.mock import patch
 import pytest
 #
 import eophis
@@ -21,7 +22,8 @@ def clean_files():
 # =================
 # test namcouple.py
 # =================
-from eophis.coupling.namcouple import Namcouple, register_tunnels, init_namcouple, write_coupling_namelist
+from eophis.coupling.namcouple import Namcouple, register_tunnels, init_namcouple, write_coupling_namelist, _make_and_check_section
+from eophis.coupling.namelist import NamcoupleIndex, raw_content
 from eophis.coupling.tunnel import Tunnel
 from eophis.utils.worker import Paral
 from eophis.utils.params import set_mode
@@ -56,3 +58,62 @@ def test_Namcouple():
     set_mode('preprod')
     write_coupling_namelist()
     assert os.path.exists("test_namcouple"), "file 'test_namcouple' has not been written"
+
+def test_prod_registration():
+    init_namcouple("test_namcouple","test_namcouple")
+    namcouple = Namcouple()
+    set_mode('prod')
+    configs = [ { "label": "prod_tunnel", "grids": {"g": { 'npts' : (4,4) } }, "exchs": [ {"grd": "g", "in": ["a"], "out": [], "freq": 3600, "lvl": 1} ] } ]
+    register_tunnels(configs)
+
+    # namcouple is neither read nor modified, sections are checked later
+    assert '_lines' not in namcouple.__dict__
+    assert namcouple._unchecked == [ ('E_OUT_0','M_IN_0',3600,'g',(4,4)) ]
+    
+    set_mode('preprod')
+    init_namcouple("test_namcouple","test_namcouple")
+    assert Namcouple()._unchecked == []
+
+def test_check_sections(tmp_path):
+    # write namcouple in preprod mode
+    set_mode('preprod')
+    init_namcouple(str(tmp_path / "nofile"), str(tmp_path / "namcouple"))
+    configs = [ { "label": "chk_tunnel", "grids": {"g": { 'npts' : (4,4) } }, \
+                  "exchs": [ {"grd": "g", "in": ["a"], "out": ["b"], "freq": 3600, "lvl": 1}, \
+                             {"grd": "g", "in": ["c"], "out": [], "freq": -1, "lvl": 1} ] } ]
+    register_tunnels(configs)
+    Paral.RANK = Paral.MASTER
+    write_coupling_namelist(1000.)
+
+    # indexed content
+    nml = NamcoupleIndex( raw_content(str(tmp_path / "namcouple")) )
+    assert nml.get('$NFIELDS') == '3'
+    assert nml.get('$RUNTIME') == '1010'
+    assert set(nml.fields.keys()) == { ('E_OUT_0','M_IN_0'), ('M_OUT_0','E_IN_0'), ('E_OUT_1','M_IN_1') }
+    assert nml.field('E_OUT_1','M_IN_1') == 'E_OUT_1 M_IN_1 1 1010 0 rst.nc EXPORTED 4 4 4 4 g g LAG=0 R 0 R 0'.split()
+    assert nml.field('E_OUT_2','M_IN_2') == None
+
+    # production mode checks
+    set_mode('prod')
+    with patch('eophis.coupling.namcouple.logs.abort') as mock_abort:
+        _make_and_check_section('E_OUT_0','M_IN_0',3600,'g',(4,4),nmcpl=nml)
+        _make_and_check_section('E_OUT_1','M_IN_1',-1,'g',(4,4),nmcpl=nml)
+        mock_abort.assert_not_called()
+        _make_and_check_section('E_OUT_0','M_IN_0',1800,'g',(4,4),nmcpl=nml)
+        _make_and_check_section('E_OUT_0','M_IN_0',3600,'g',(4,5),nmcpl=nml)
+        _make_and_check_section('E_OUT_5','M_IN_5',3600,'g',(4,4),nmcpl=nml)
+        assert mock_abort.call_count == 3
+
+    # section followed by transformations
+    lines = raw_content(str(tmp_path / "namcouple"))
+    start, end = nml.fields[('E_OUT_0','M_IN_0')]
+    lines[start:end] = [ 'E_OUT_0 M_IN_0 1 3600 1 rst.nc EXPORTED', '4 4 4 4 g g LAG=0', 'R 0 R 0', 'LOCTRANS', 'AVERAGE' ]
+    nml = NamcoupleIndex(lines)
+    assert nml.field('E_OUT_0','M_IN_0')[-2:] == ['LOCTRANS','AVERAGE']
+    with patch('eophis.coupling.namcouple.logs.abort') as mock_abort:
+        _make_and_check_section('E_OUT_0','M_IN_0',3600,'g',(4,4),nmcpl=nml)
+        mock_abort.assert_not_called()
+        _make_and_check_section('E_OUT_0','M_IN_0',3600,'h',(4,4),nmcpl=nml)
+        assert mock_abort.call_count == 1
+    set_mode('preprod')
+    init_namcouple("test_namcouple","test_namcouple")
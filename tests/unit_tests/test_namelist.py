@@ -1,5 +1,7 @@
 import os
 import shutil
+from unittest.mock import MagicMock, patch
+from mpi4py import MPI
 import pytest
 #
 import eophis
@@ -21,7 +23,7 @@ def clean_files():
 # ================
 # test namelist.py
 # ================
-from eophis.coupling.namelist import FortranNamelist, raw_content, is_in, find_pos, replace_line, find_and_replace_line, find_and_replace_char, write
+from eophis.coupling.namelist import FortranNamelist, raw_content, shared_content, shared_communicator, root_call, is_in, find_pos, replace_line, find_and_replace_line, find_and_replace_char, write
 
 @pytest.fixture
 def namelist_file(tmpdir):
@@ -51,6 +53,49 @@ def test_raw_content(namelist_file):
     del lines[0]
     assert lines == ["&namelist1", "    var1 = value1", "    var2 = value2", "/", "", "&namelist2", "    var3 = value3", "    var4 = value4", "/"]
 
+def test_shared_content(namelist_file):
+    lines = shared_content(namelist_file, MPI.COMM_WORLD)
+    assert lines == raw_content(namelist_file)
+    assert shared_content("nofile.dat", MPI.COMM_WORLD, retries=1) == []
+    
+    # other processes do not read file
+    comm = MagicMock()
+    comm.Get_rank.return_value = 1
+    comm.bcast.return_value = (lines, None)
+    with patch('eophis.coupling.namelist.raw_content') as mock_read:
+        assert shared_content(namelist_file, comm) == lines
+        mock_read.assert_not_called()
+        comm.bcast.assert_called_once_with((None, None), root=0)
+
+def test_root_call():
+    # error of first process raised by every process
+    comm = MagicMock()
+    comm.Get_rank.return_value = 0
+    comm.bcast.side_effect = lambda obj, root: obj
+    with pytest.raises(ZeroDivisionError):
+        root_call(comm, lambda x: x / 0, 1.)
+    assert isinstance(comm.bcast.call_args[0][0][1], ZeroDivisionError)
+    comm.Get_rank.return_value = 1
+    comm.bcast.side_effect = None
+    comm.bcast.return_value = (None, FileNotFoundError('nofile'))
+    with pytest.raises(FileNotFoundError):
+        root_call(comm, raw_content, 'nofile')
+
+def test_shared_FortranNamelist(namelist_file):
+    namelist = FortranNamelist(namelist_file, MPI.COMM_WORLD)
+    assert namelist.formatted['namelist2']['var3'] == 'value3'
+
+    # eophis communicator by default, only if it does not involve coupled codes
+    with patch('eophis.coupling.namelist.Paral') as paral, patch('eophis.coupling.namelist.Mode') as mode:
+        paral.ISOLATED, mode.PREPROD = False, False
+        assert shared_communicator() is None
+        paral.ISOLATED = True
+        assert shared_communicator() is paral.EOPHIS_COMM
+        paral.EOPHIS_COMM.Get_rank.return_value = 1
+        paral.EOPHIS_COMM.bcast.return_value = (namelist.formatted, None)
+        assert FortranNamelist(namelist_file).formatted == namelist.formatted
+        paral.EOPHIS_COMM.bcast.assert_called_once_with((None, None), root=0)
+
 def test_raw_content_nofile():
     lines = raw_content("nofile.dat")
     assert lines == []
@@ -0,0 +1,49 @@
+import os
+import shutil
+import pytest
+import numpy as np
+#
+import eophis
+
+# ========
+# cleaning
+# ========
+@pytest.fixture(scope="session",autouse=True)
+def clean_files():
+    yield
+    for file_name in ["eophis.out", "eophis.err"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+    if os.path.exists("test_namcouple"):
+        os.remove("test_namcouple")
+    if os.path.isdir("__pycache__"):
+        shutil.rmtree("__pycache__")
+
+# ==============
+# test nfhalo.py
+# ==============
+from eophis.domain.nfhalo import NFHalo
+from eophis.domain.offsiz import set_fold_trf
+
+# folded line of a 2x1 subdomain at the fold, for each grid type and fold point: start of the folded halo line and merged segments
+@pytest.mark.parametrize("grd, fold, fold_start, offsets, sizes", [
+    ( 'T', 'T', 9, [1,7], [4,5] ),
+    ( 'U', 'T', 8, [1,7], [4,4] ),
+    ( 'V', 'T', 15, [1,7,14], [4,4,4] ),
+    ( 'F', 'T', 14, [1,7,13], [4,4,4] ),
+    ( 'T', 'F', 2, [1,7], [4,4] ),
+    ( 'U', 'F', 1, [0,7], [5,4] ),
+    ( 'V', 'F', 8, [1,7], [4,4] ),
+    ( 'F', 'F', 7, [1,6], [4,5] ) ])
+def test_6x4_2x1_segment(grd, fold, fold_start, offsets, sizes):
+    hls = NFHalo( size=1, global_grid=(6,4), local_grid=(2,1), offset=2, fold_param=set_fold_trf(grd,fold), bnd=('close','nfold') )
+    assert hls.shifts == (0,1)
+    assert hls.segment_intern_fold(fold_start) == ([fold_start],[2])
+    assert hls.segment() == (offsets, sizes)
+
+# folded lines of several lines at once, split across x boundary
+def test_6x4_2x1_segment_fold_lines():
+    hls = NFHalo( size=1, global_grid=(6,4), local_grid=(2,1), offset=2, fold_param=set_fold_trf('T','T'), bnd=('close','nfold') )
+    off, siz, keep = hls.segment_fold_lines( np.array([11,8,17]) )
+    assert off[keep].tolist() == [11,6,8,17,12]
+    assert siz[keep].tolist() == [1,1,2,1,1]
@@ -164,3 +164,16 @@ def test_6x4_6x4_T_T_total():
     res = hls.rebuild(np.arange(24).reshape(24,1,order='F')+1).transpose()
     ref = np.array( [ [[0,7,12,11,10,9,8,0],[0,1,2,3,4,5,6,0],[0,7,8,9,10,11,12,0],[0,13,14,15,16,17,18,0],[0,19,20,21,22,23,24,0],[0,0,0,0,0,0,0,0]] ] )
     assert np.array_equal(ref,res) == True
+
+# -- gather plan
+def test_6x4_1x1_T_T_plan():
+    hls = NFHalo( size=2, global_grid=(6,4), local_grid=(1,1), offset=3, fold_param=folds_TT, bnd=('close','nfold') )
+    res = hls.segment()
+    hls.compile_rebuild(sum(res[1]))
+    assert len(hls._gather) == 5*5
+    # rebuild grid with several levels
+    grid = np.random.rand(sum(res[1]),3)
+    res = hls.rebuild(grid)
+    ref = hls.apply_instructions(grid)
+    assert res.shape == (5,5,3)
+    assert np.array_equal(ref,res) == True
@@ -23,7 +23,7 @@ def clean_files():
 # ==============
 # test offsiz.py
 # ==============
-from eophis.domain.offsiz import set_fold_trf, list_to_slices, grid_to_offsets_sizes, clean_for_oasis
+from eophis.domain.offsiz import set_fold_trf, list_to_slices, grid_to_offsets_sizes, clean_for_oasis, merge_intervals, subtract_intervals, locate_intervals
 
 def test_set_fold_trf():
     assert set_fold_trf('T','T') == [1,1,0]
@@ -59,3 +59,23 @@ def test_clean_for_oasis_clean():
     offsets, sizes = clean_for_oasis(off,siz)
     assert offsets ==  [0,11,17,21]
     assert sizes == [8,2,3,1]
+
+def test_merge_intervals():
+    res = merge_intervals( [0,3,11,17,21,0,5,30], [3,6,13,20,22,4,8,30] )
+    ref = np.array( [[0,8],[11,13],[17,20],[21,22]] )
+    assert np.array_equal(res,ref) == True
+    assert merge_intervals([],[]).shape == (0,2)
+
+def test_subtract_intervals():
+    bounds = merge_intervals( [0,10], [6,14] )
+    others = merge_intervals( [2,12], [4,20] )
+    res = subtract_intervals(bounds,others)
+    ref = np.array( [[0,2],[4,6],[10,12]] )
+    assert np.array_equal(res,ref) == True
+
+def test_locate_intervals():
+    grid_bounds = merge_intervals( [0,10,20], [4,14,24] )
+    bounds = merge_intervals( [2,10,22], [4,12,23] )
+    res = locate_intervals(bounds,grid_bounds)
+    ref = np.array( [[2,6],[10,11]] )
+    assert np.array_equal(res,ref) == True
@@ -0,0 +1,69 @@
+import os
+import shutil
+import numpy as np
+import pytest
+#
+import eophis
+
+# ========
+# cleaning
+# ========
+@pytest.fixture(scope="session",autouse=True)
+def clean_files():
+    yield
+    for file_name in ["eophis.out", "eophis.err"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+    if os.path.exists("test_namcouple"):
+        os.remove("test_namcouple")
+    if os.path.isdir("__pycache__"):
+        shutil.rmtree("__pycache__")
+
+# ===============
+# test planner.py
+# ===============
+from eophis.domain.planner import plan_tunnel, summary
+from eophis.domain.grid import Grid
+
+def test_plan_tunnel():
+    config = { 'grids' : { 'nf' : { 'npts' : (20,15), 'halos' : 2, 'bnd' : ('cyclic','NFold'), 'folding' : ('U','F') }, \
+                           'box' : { 'npts' : (12,9) } }, \
+               'exchs' : [ { 'grd' : 'nf', 'in' : ['a','b'], 'out' : ['c'], 'lvl' : 3, 'freq' : 900, 'dtype' : np.float32 } ] }
+    plans = plan_tunnel(config, 6)
+
+    # same partitions as computed by each process
+    for rk in range(6):
+        grd = Grid('nf', 20, 15, 2, ('cyclic','NFold'), 'U', 'F')
+        grd.make_local_subdomain(rk, 6)
+        offsets, sizes, _ = grd.as_orange_partition()
+        plan = plans['nf']
+        assert plan['box_offset'][rk] == grd.global_offset
+        assert (plan['size_x'][rk], plan['size_y'][rk]) == grd.loc_size
+        assert plan['halo_type'][rk] == type(grd.halos).__name__
+        assert plan['nseg'][rk] == len(sizes)
+        assert plan['orange_size'][rk] == sum(sizes)
+        rebuilt = grd.generate_rebuilt_array(3, np.float32)
+        assert plan['memory'][rk] == 2 * ( grd.generate_receiving_array(3, np.float32).nbytes + rebuilt.nbytes ) + grd.generate_sending_array(3, np.float32).nbytes
+
+    # grid without exchanges nor halos
+    assert plans['box']['halo_type'].tolist() == ['HaloGrid'] * 6
+    assert plans['box']['orange_size'].sum() == 12*9
+    assert np.all( plans['box']['memory'] == 0 )
+    assert len(summary(plans)) == 8
+
+def test_plan_tunnel_masked():
+    mask = np.ones((20,15))
+    mask[5:15,3:12] = 0
+    config = { 'grids' : { 'nf' : { 'npts' : (20,15), 'halos' : 1, 'bnd' : ('cyclic','NFold'), 'mask' : mask } }, \
+               'exchs' : [ { 'grd' : 'nf', 'in' : ['a'], 'out' : ['b'], 'lvl' : 1, 'freq' : 900 } ] }
+    plan = plan_tunnel(config, 30)['nf']
+    for rk in range(30):
+        grd = Grid('nf', 20, 15, 1, ('cyclic','NFold'), mask=mask)
+        grd.make_local_subdomain(rk, 30)
+        offsets, sizes, _ = grd.as_orange_partition()
+        assert (plan['size_x'][rk], plan['size_y'][rk]) == grd.loc_size
+        assert plan['halo_type'][rk] == ('Empty' if grd.empty else type(grd.halos).__name__)
+        assert plan['nseg'][rk] == len(sizes)
+        assert plan['orange_size'][rk] == sum(sizes)
+        if not grd.empty:
+            assert plan['box_offset'][rk] == grd.global_offset
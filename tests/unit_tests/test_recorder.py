@@ -0,0 +1,57 @@
+import os
+import shutil
+import pytest
+import numpy as np
+#
+import eophis
+
+# ========
+# cleaning
+# ========
+@pytest.fixture(scope="session",autouse=True)
+def clean_files():
+    yield
+    for file_name in ["eophis.out", "eophis.err"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+    for dir_name in ["test_records", "__pycache__"]:
+        if os.path.isdir(dir_name):
+            shutil.rmtree(dir_name)
+
+# ================
+# test recorder.py
+# ================
+from eophis.coupling.recorder import Recorder, load_record
+
+def test_record_round_trip():
+    fields = [ np.asfortranarray( np.random.rand(12,3) ) for _ in range(3) ]
+    rec = Recorder("test_records", 2)
+    for date, fld in zip((0,900,1800), fields):
+        rec.write("fld", date, fld)
+    rec.close()
+
+    dates, records = load_record("test_records", "fld", 2)
+    assert dates == { 0 : 0, 900 : 1, 1800 : 2 }
+    assert records.shape == (3,12,3)
+    assert all( np.array_equal(records[i], fields[i]) for i in range(3) )
+    assert records[0].flags['F_CONTIGUOUS']
+
+    # interrupted recording, incomplete last record ignored
+    with open("test_records/fld_rank2.bin", "ab") as outfile:
+        outfile.write( b"\0" * 8 )
+    with open("test_records/fld_rank2.dates", "a") as outfile:
+        outfile.write( "2700\n" )
+    dates, records = load_record("test_records", "fld", 2)
+    assert len(dates) == 3 and records.shape[0] == 3
+
+def test_record_empty_partition():
+    # idle processes receive empty fields
+    rec = Recorder("test_records", 3)
+    for date in (0,900):
+        rec.write("empty", date, np.zeros((0,1), order='F'))
+    rec.close()
+
+    dates, records = load_record("test_records", "empty", 3)
+    assert dates == { 0 : 0, 900 : 1 }
+    assert records.shape == (2,0,1)
+    assert records[1].shape == (0,1)
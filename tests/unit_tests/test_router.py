@@ -0,0 +1,113 @@
+import os
+import shutil
+import threading
+from unittest.mock import MagicMock, patch
+import pytest
+import numpy as np
+#
+import eophis
+
+# ========
+# cleaning
+# ========
+@pytest.fixture(scope="session",autouse=True)
+def clean_files():
+    yield
+    for file_name in ["eophis.out", "eophis.err"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+    if os.path.isdir("__pycache__"):
+        shutil.rmtree("__pycache__")
+
+# ==============
+# test router.py
+# ==============
+from eophis.router import RouterGraph
+from eophis.loop import _route, all_in_all_out, all_in_all_out_multi
+from concurrent.futures import ThreadPoolExecutor
+
+def test_router_graph():
+    calls = []
+    def model(tag, func):
+        def run(*args):
+            calls.append(tag)
+            return func(*args)
+        return run
+
+    graph = RouterGraph()
+    graph.add( model('fast', lambda sst: sst + 1), ['sst'], ['sst_var'], name='fast' )
+    graph.add( model('split', lambda sst, svt: (sst * svt, sst - svt)), ['sst','svt'], ['prod','diff'], name='split' )
+    graph.add( model('slow', lambda prod: prod * 10), ['prod'], ['svt_var'], name='slow' )
+    graph.add( model('unused', lambda diff: diff), ['diff'], ['diag'], name='unused' )
+    assert graph.sinks() == ['sst_var', 'svt_var', 'diag']
+
+    # all inputs arrived
+    outputs = graph(sst=2.0, svt=3.0)
+    assert outputs == { 'sst_var' : 3.0, 'svt_var' : 60.0, 'diag' : -1.0 }
+    assert [ [ node.name for node in wave ] for wave in graph._waves ] == [ ['fast','split'], ['slow','unused'] ]
+
+    # missing input: dependent models are not called
+    calls.clear()
+    assert graph(sst=2.0, svt=None) == { 'sst_var' : 3.0, 'svt_var' : None, 'diag' : None }
+    assert calls == ['fast']
+
+    # models not contributing to wanted variables are not called, timings reported
+    calls.clear()
+    timing = MagicMock()
+    assert graph.evaluate( {'sst' : 2.0, 'svt' : 3.0}, ['svt_var'], timing ) == { 'svt_var' : 60.0 }
+    assert calls == ['split','slow']
+    assert [ args[0][0] for args in timing.call_args_list ] == ['split','slow']
+
+def test_router_concurrency():
+    # independent models wait for each other: only possible if run concurrently
+    barrier = threading.Barrier(2, timeout=5)
+    def wait_and_add(x):
+        barrier.wait()
+        return x + 1
+    graph = RouterGraph(max_workers=2)
+    graph.add(wait_and_add, ['a'], ['b'], name='first').add(wait_and_add, ['a'], ['c'], name='second')
+    assert graph(a=1) == { 'b' : 2, 'c' : 2 }
+
+    # pool threads released when closed, created again if needed
+    pool = graph._pool
+    graph.close()
+    assert graph._pool is None and pool._shutdown
+    assert all( not thread.is_alive() for thread in pool._threads )
+    assert graph(a=2) == { 'b' : 3, 'c' : 3 }
+    graph.close()
+
+    # same graph evaluated by several threads
+    graph = RouterGraph(max_workers=2).add(lambda a: a + 1, ['a'], ['b']).add(lambda a: a * 2, ['a'], ['c'])
+    with ThreadPoolExecutor(max_workers=4) as loops:
+        results = list( loops.map(lambda a: graph(a=a), range(20)) )
+    assert results == [ { 'b' : a + 1, 'c' : a * 2 } for a in range(20) ]
+    graph.close()
+
+def test_router_errors():
+    with patch('eophis.router.logs.abort', side_effect=RuntimeError) as mock_abort:
+        graph = RouterGraph().add(lambda a: a, ['a'], ['b'])
+        with pytest.raises(RuntimeError):
+            graph.add(lambda c: c, ['c'], ['b'])
+        graph = RouterGraph().add(lambda c: c, ['c'], ['b'], name='n1')
+        with pytest.raises(RuntimeError):
+            graph.add(lambda b: b, ['b'], ['c'], name='n2')
+        graph = RouterGraph().add(lambda a: (a,), ['a'], ['b','c'])
+        with pytest.raises(RuntimeError):
+            graph(a=1)
+
+def test_router_loop():
+    # loop asks for Tunnel sendings only
+    tunnel = MagicMock(label='test_router')
+    tunnel.is_idle.return_value = False
+    tunnel.departure_list.return_value = ['t']
+    graph = RouterGraph().add(lambda u: u * 2, ['u'], ['t']).add(lambda u: u * 3, ['u'], ['extra'])
+    assert _route(tunnel, graph, { 'u' : np.ones(2) }).keys() == {'t'}
+    assert _route(tunnel, graph, { 'u' : None }) == { 't' : None }
+
+    # graph closed at the end of loops
+    tunnel.active_steps.return_value = []
+    tunnel.lags.return_value = {}
+    for loop in ( all_in_all_out(tunnel, 900, 2), all_in_all_out_multi([tunnel], [900], [2]) ):
+        with patch('eophis.loop.tunnels_ready', return_value=True), patch.object(graph, 'close') as mock_close:
+            loop(graph)()
+            mock_close.assert_called_once()
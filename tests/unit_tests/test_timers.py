@@ -0,0 +1,71 @@
+import os
+import shutil
+from mpi4py import MPI
+import numpy as np
+import pytest
+#
+import eophis
+
+# ========
+# cleaning
+# ========
+@pytest.fixture(scope="session",autouse=True)
+def clean_files():
+    yield
+    for file_name in ["eophis.out", "eophis.err"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+    if os.path.exists("test_namcouple"):
+        os.remove("test_namcouple")
+    if os.path.isdir("__pycache__"):
+        shutil.rmtree("__pycache__")
+
+# ==============
+# test timers.py
+# ==============
+from eophis.utils.timers import _Timings, record, percentile, reset, summary
+from eophis.utils.worker import Paral
+
+def test_record():
+    reset()
+    record('tnl', 'var', 'get', 2e-3, 800)
+    record('tnl', 'var', 'get', 3e-3, 800)
+    record('tnl', None, 'router', 0.0)
+    record('tnl', None, 'router', 1e4)
+    counts, total, nbytes = _Timings.records[('tnl','var','get')]
+    assert counts.sum() == 2 and np.isclose(total, 5e-3) and nbytes == 1600
+    assert counts[ 1 + int( (np.log10(2e-3) + 6) * 10 ) ] == 1
+    counts = _Timings.records[('tnl',None,'router')][0]
+    assert counts[0] == 1 and counts[-1] == 1
+
+def test_percentile():
+    counts = np.zeros(_Timings.NBINS+2, dtype=np.int64)
+    counts[31] = 99
+    counts[61] = 1
+    assert np.isclose( percentile(counts,50), 10**(-3+0.05) )
+    assert np.isclose( percentile(counts,99), 10**(-3+0.05) )
+    assert np.isclose( percentile(counts,100), 10**(0+0.05) )
+
+def test_summary():
+    Paral.EOPHIS_COMM = MPI.COMM_WORLD
+    Paral.RANK = Paral.MASTER
+    reset()
+    assert summary() == []
+    record('tnl', 'var', 'put', 1e-3, 400)
+    lines = summary()
+    assert len(lines) == 2
+    assert lines[1].split() == ['tnl', 'var', 'put', '1', '1.000', '1.122', '1.122', '400']
+    _Timings.enabled = False
+    record('tnl', 'var', 'put', 1e-3, 400)
+    _Timings.enabled = True
+    assert _Timings.records[('tnl','var','put')][0].sum() == 1
+    reset()
+
+def test_threaded_record():
+    from concurrent.futures import ThreadPoolExecutor
+    reset()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        [ pool.submit( lambda: [ record('tnl', 'var', 'get', 1e-3, 8) for _ in range(1000) ] ) for _ in range(8) ]
+    counts, total, nbytes = _Timings.records[('tnl','var','get')]
+    assert counts.sum() == 8000 and nbytes == 64000 and np.isclose(total, 8.0)
+    reset()
@@ -5,6 +5,7 @@ import inspect
 from unittest.mock import MagicMock, patch
 from mpi4py import MPI
 import pytest
+import numpy as np
 #
 import eophis
 
@@ -27,6 +28,7 @@ def clean_files():
 # ==============
 from eophis.coupling.namcouple import Namcouple, register_tunnels
 from eophis.coupling.tunnel import Tunnel
+from eophis.coupling.namelist import NamcoupleIndex
 from eophis.utils.params import set_mode
 
 def test_register_tunnels():
@@ -48,6 +50,8 @@ def test_register_tunnels():
     # tunnel creation
     assert len(tunnels) == 1
     assert tunnels[0].label == "test_tunnel"
+    assert tunnels[0].reuse == False
+    assert tunnels[0].cache == None
     assert tunnels[0].grids['grid1'].label == "grid1"
     assert tunnels[0].grids['grid1'].size == (10,10)
     assert tunnels[0].grids['grid1'].bnd == ('close','close')
@@ -68,3 +72,171 @@ def test_register_tunnels():
     section1 = 'VAR2_PY VAR2_GEO 1 3600 0 rst.nc EXPORTED\n10 10 10 10 grid1 grid1 LAG=0\nR 0 R 0'
     assert section0 in namcouple._lines
     assert section1 in namcouple._lines
+
+def test_active_steps():
+    tunnel = Namcouple().tunnels[0]
+    var1, var2, var0 = MagicMock(), MagicMock(), MagicMock()
+    var1.cpl_freqs = [3600]
+    var2.cpl_freqs = [7200]
+    var0.cpl_freqs = [60]
+    tunnel._variables = { 'rcv' : {'var1' : var1, 'var0' : var0}, 'snd' : {'var2' : var2} }
+    tunnel._static_used = {'var0' : True}
+    assert tunnel.active_steps(900,10).tolist() == [0,4,8]
+    assert tunnel.active_steps(2700,10).tolist() == [0,4,8]
+
+def test_fused_exchanges():
+    configs = [
+        {
+            "label": "test_fused",
+            "grids": {"grid2": { 'npts' : (8,6) } },
+            "exchs": [{"grd": "grid2", "in": ["u","v"], "out": ["t"], "freq": 900, "lvl": 1}, \
+                      {"grd": "grid2", "in": ["w"], "out": ["s"], "freq": 900, "lvl": 2}, \
+                      {"grd": "grid2", "in": ["p"], "out": [], "freq": 1800, "lvl": 1}],
+            "fuse": True
+        }
+    ]
+    namcouple = Namcouple()
+    Nin, Nout = namcouple._Nin, namcouple._Nout
+    tunnel = register_tunnels(configs)[0]
+
+    # one field per grid, frequency and direction
+    assert tunnel.fuse == True
+    assert tunnel.py_aliases == { 'u' : f'M_IN_{Nin}', 'v' : f'M_IN_{Nin}', 'w' : f'M_IN_{Nin}', 'p' : f'M_IN_{Nin+1}', \
+                                  't' : f'M_OUT_{Nout}', 's' : f'M_OUT_{Nout}' }
+    assert f'# Earth -- u,v,w --> Models' in namcouple._lines
+    assert namcouple._Nin == Nin + 2 and namcouple._Nout == Nout + 1
+
+    # bundles
+    with patch('eophis.coupling.tunnel.pyoasis') as fake_oasis:
+        fake_oasis.Var.side_effect = lambda *args, **kwargs: MagicMock(cpl_freqs=[900])
+        tunnel._define_partitions(0,1)
+        tunnel._define_variables()
+    assert tunnel._levels == { 'u' : slice(0,1), 'v' : slice(1,2), 't' : slice(0,1), 'w' : slice(2,4), 's' : slice(1,3), 'p' : slice(0,1) }
+    assert tunnel._variables['rcv']['u'] is tunnel._variables['rcv']['w']
+    assert tunnel._buffers['raw'][f'M_IN_{Nin}'].shape == (48,4)
+    assert tunnel._buffers['snd'][f'M_OUT_{Nout}'].shape == (8,6,3)
+
+    # packed sending: one put once all variables are given
+    var = tunnel._variables['snd']['t']
+    tunnel.send('t', np.ones((8,6,1)), 900)
+    var.put.assert_not_called()
+    tunnel.send('s', np.full((8,6,2),2.0), 900)
+    var.put.assert_called_once()
+    assert np.array_equal( var.put.call_args[0][1][:,:,2], np.full((8,6),2.0) )
+
+    # missing variable at a date: field not sent, stale levels never sent with next date
+    tunnel.send('t', np.full((8,6,1),3.0), 1800)
+    tunnel.send('s', None, 1800)
+    with patch('eophis.coupling.tunnel.logs.warning') as mock_warning:
+        tunnel.send('s', np.full((8,6,2),4.0), 2700)
+        mock_warning.assert_called_once()
+        assert mock_warning.call_args[0][3:] == (1800, 's')
+    assert var.put.call_count == 1
+    tunnel.send('t', np.full((8,6,1),5.0), 2700)
+    assert var.put.call_count == 2 and var.put.call_args[0][0] == 2700
+    assert np.all( var.put.call_args[0][1][:,:,0] == 5.0 ) and np.all( var.put.call_args[0][1][:,:,1:] == 4.0 )
+
+    # unpacked reception: one get for all variables
+    var = tunnel._variables['rcv']['u']
+    var.get.side_effect = lambda date, raw: raw.__setitem__( slice(None), np.arange(4)[None,:] )
+    rcv = [ tunnel.receive(lbl, 900) for lbl in ('u','v','w') ]
+    var.get.assert_called_once()
+    assert np.all(rcv[0] == 0) and np.all(rcv[1] == 1) and rcv[2].shape == (8,6,2) and np.all(rcv[2][:,:,1] == 3)
+
+def test_idle_process():
+    configs = [
+        {
+            "label": "test_idle",
+            "grids": {"grid3": { 'npts' : (8,6), 'halos' : 1, 'mask' : np.arange(48).reshape(8,6) == 40 } },
+            "exchs": [{"grd": "grid3", "in": ["u"], "out": ["t"], "freq": 900, "lvl": 2}]
+        }
+    ]
+    tunnel = register_tunnels(configs)[0]
+
+    # second process only gets land, partitions without segments
+    with patch('eophis.coupling.tunnel.pyoasis') as fake_oasis:
+        fake_oasis.Var.side_effect = lambda *args, **kwargs: MagicMock(cpl_freqs=[900])
+        tunnel._define_partitions(1,2)
+        tunnel._define_variables()
+    fake_oasis.OrangePartition.assert_called_once_with([], [], 48)
+    fake_oasis.BoxPartition.assert_not_called()
+    assert tunnel.is_idle() == True
+    
+    # router is skipped, empty arrays are still exchanged
+    from eophis.loop import _route
+    sendings = _route(tunnel, None, {})
+    assert list(sendings.keys()) == ['t'] and sendings['t'].shape == (0,0,2)
+    tunnel.send('t', sendings['t'], 900)
+    tunnel._variables['snd']['t'].put.assert_called_once()
+    assert tunnel.receive('u', 900).shape == (0,0,2)
+
+def test_mpi_halos():
+    configs = [
+        {
+            "label": "test_mpi_halos",
+            "grids": {"grid4": { 'npts' : (8,6), 'halos' : 2, 'bnd' : ('cyclic','cyclic') } },
+            "exchs": [{"grd": "grid4", "in": ["u"], "out": ["t"], "freq": 900, "lvl": 1}],
+            "mpi_halos": True
+        }
+    ]
+    tunnel = register_tunnels(configs)[0]
+    with patch('eophis.coupling.tunnel.pyoasis') as fake_oasis:
+        fake_oasis.Var.side_effect = lambda *args, **kwargs: MagicMock(cpl_freqs=[900])
+        tunnel._define_partitions(0,1)
+        tunnel._define_variables()
+
+    # reception on Box partition, halos filled from real cells
+    fake_oasis.OrangePartition.assert_not_called()
+    assert tunnel._inpartitions['grid4'] is tunnel._outpartitions['grid4']
+    var = tunnel._variables['rcv']['u']
+    var.get.side_effect = lambda date, raw: raw.__setitem__( slice(None), np.arange(48)[:,None] )
+    rcv = tunnel.receive('u', 900)
+    assert rcv.shape == (12,10,1)
+    assert np.array_equal( rcv[2:10,2:8,0], np.arange(48).reshape(8,6,order='F') )
+    assert np.array_equal( rcv[0:2,2:8,0], rcv[8:10,2:8,0] )
+
+def test_lagged_sendings(tmp_path):
+    configs = [
+        {
+            "label": "test_lag",
+            "grids": {"grid5": { 'npts' : (8,6) } },
+            "exchs": [{"grd": "grid5", "in": ["u"], "out": ["t","s"], "freq": 900, "lvl": 2, "lag": 900}],
+            "fuse": True
+        }
+    ]
+    namcouple = Namcouple()
+    tunnel = register_tunnels(configs)[0]
+    alias, geo_alias = tunnel.py_aliases['t'], tunnel.geo_aliases['t']
+
+    # lagged field has its own restart file, received field is not lagged
+    nml = NamcoupleIndex(namcouple._lines)
+    sct = nml.field(alias, geo_alias)
+    assert sct[5] == f'rst_{alias}.nc' and sct[13] == 'LAG=900'
+    assert nml.field(tunnel.geo_aliases['u'], tunnel.py_aliases['u'])[13] == 'LAG=0'
+    assert tunnel.lags() == { 't' : 900, 's' : 900 }
+
+    # restart file of the bundle filled with zeros, existing values kept
+    with patch('eophis.coupling.tunnel.pyoasis') as fake_oasis:
+        fake_oasis.Var.side_effect = lambda *args, **kwargs: MagicMock(cpl_freqs=[900])
+        tunnel._define_partitions(0,1)
+        tunnel._define_variables()
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        tunnel._write_restarts(nml)
+        from netCDF4 import Dataset
+        with Dataset(sct[5], 'a') as rst:
+            assert sorted(rst.variables) == [ f'{alias}_bundle{n:02d}' for n in range(1,5) ]
+            assert rst.variables[f'{alias}_bundle01'].shape == (6,8)
+            assert np.all( rst.variables[f'{alias}_bundle04'][:] == 0.0 )
+            rst.variables[f'{alias}_bundle01'][:] = 1.0
+        tunnel._write_restarts(nml)
+        with Dataset(sct[5]) as rst:
+            assert np.all( rst.variables[f'{alias}_bundle01'][:] == 1.0 )
+    finally:
+        os.chdir(cwd)
+
+    # lag must be a multiple of frequency
+    with patch('eophis.coupling.tunnel.logs.abort') as mock_abort:
+        Tunnel('bad_lag', {}, [{"grd": "g", "in": [], "out": ["t"], "freq": 900, "lvl": 1, "lag": 600}], {}, {})
+        mock_abort.assert_called_once()